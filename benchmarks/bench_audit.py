@@ -0,0 +1,135 @@
+"""End-to-end benchmark of the bulk audit pipeline against a local DNS stand-in.
+
+Starts ``dns_stub`` in a child process, audits every synthetic domain with
+``audit_domains`` and reports throughput, per-domain latency percentiles,
+DNS queries issued and peak RSS of the auditing process.
+
+    python benchmarks/bench_audit.py --domains 5000 --latency 5 --timeout-rate 0.01 --nxdomain-rate 0.1
+
+``--max-qps`` makes the stand-in refuse queries beyond that rate, to watch
+the rate limiter back off and settle just below it.
+
+SMTP probing and MTA-STS policy fetching are replaced by fixed results (the
+synthetic hosts do not exist) so only DNS, parsing and analysis are measured.
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dns_stub import build_zone, load_zone, serve
+from dmarc_audit.async_analyzer import audit_domains
+from dmarc_audit.logger import logger
+from dmarc_audit.mta_sts import PolicyResult
+from dmarc_audit.ratelimit import get_scheduler
+from dmarc_audit.resolver import CachingResolver
+from dmarc_audit.smtp import ProbeResult
+
+class StaticProber:
+    """Reports STARTTLS with TLS 1.3 for every host without connecting."""
+
+    async def probe(self, host):
+        return ProbeResult(host, ehlo=[host, "STARTTLS"], starttls=True, tls_version='TLSv1.3')
+
+    async def probe_all(self, hosts):
+        return {host: await self.probe(host) for host in hosts}
+
+class StaticPolicyFetcher:
+    """Serves the same enforce-mode policy for every domain without connecting."""
+
+    async def fetch(self, domain, policy_id):
+        return PolicyResult(domain, policy_id, "version: STSv1\nmode: enforce\nmx: *.bench\nmax_age: 604800\n")
+
+def run_server(zone_text, options, ready):
+    async def run():
+        transport, protocol = await serve(load_zone(zone_text), **options)
+        ready.send(transport.get_extra_info('sockname')[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def audit(domains, resolver, concurrency):
+    started = {}
+    latencies = []
+
+    def feed():
+        # audit_domains pulls the next domain only when a worker is free,
+        # so the pull time is when that domain's audit starts.
+        for domain in domains:
+            started[domain] = time.perf_counter()
+            yield domain
+
+    async for domain, _ in audit_domains(feed(), concurrency=concurrency, resolver=resolver, prober=StaticProber(),
+                                         policy_fetcher=StaticPolicyFetcher()):
+        latencies.append(time.perf_counter() - started[domain])
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--domains", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Milliseconds added to every DNS answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random milliseconds per DNS answer")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of DNS queries dropped")
+    parser.add_argument("--nxdomain-rate", type=float, default=0.0, help="Fraction of domains that do not exist")
+    parser.add_argument("--max-qps", type=int, default=0, help="DNS stand-in answers REFUSED beyond this rate")
+    parser.add_argument("--dns-timeout", type=float, default=0.5, help="Per-query resolver timeout in seconds")
+    parser.add_argument("--zone", help="Load the zone from this file instead of generating it")
+    parser.add_argument("--write-zone", help="Write the generated zone fixture to this file and exit")
+    args = parser.parse_args()
+
+    zone_text, domains = build_zone(args.domains, args.nxdomain_rate)
+    if args.write_zone:
+        with open(args.write_zone, 'w') as f:
+            f.write(zone_text)
+        return
+    if args.zone:
+        with open(args.zone) as f:
+            zone_text = f.read()
+
+    logger.setLevel(logging.ERROR)
+    options = {
+        'latency': args.latency / 1000,
+        'jitter': args.jitter / 1000,
+        'timeout_rate': args.timeout_rate,
+        'max_qps': args.max_qps
+    }
+    receive, send = multiprocessing.Pipe(duplex=False)
+    server = multiprocessing.Process(target=run_server, args=(zone_text, options, send), daemon=True)
+    server.start()
+    try:
+        port = receive.recv()
+        resolver = CachingResolver(['127.0.0.1'], port=port, timeout=args.dns_timeout,
+                                   lifetime=args.dns_timeout * 2)
+        start = time.perf_counter()
+        latencies = asyncio.run(audit(domains, resolver, args.concurrency))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+
+    stats = resolver.stats()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"domains:      {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} domains/s)")
+    print(f"latency:      p50 {percentile(latencies, 0.50) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"dns queries:  {stats['queries']} ({stats['queries'] / max(1, len(latencies)):.1f}/domain, {stats['hits']} cache hits)")
+    limiter = get_scheduler().stats()
+    errors = sum(upstream['errors'] for upstream in stats['upstreams'].values())
+    print(f"rate limiter: {limiter['throttled']} throttled, {limiter['deferred']} deferred, {errors} upstream errors")
+    print(f"peak rss:     {peak_rss:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark of the progress journal's cost per finished domain.
+
+Records ``--domains`` synthetic reports and postures with the default
+batched ``fsync`` and with one ``fsync`` per record, then replays the
+journal as ``--resume`` does.  Reports records/s and microseconds per
+domain for each.
+
+    python benchmarks/bench_journal.py --domains 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from dmarc_audit.journal import Journal
+from dmarc_audit.portfolio import Posture
+
+REPORT = {
+    'spf': (["SPF uses soft fail (~all)"], ["Consider using hard fail (-all)"]),
+    'dmarc': (["DMARC policy is set to none"], ["Set the DMARC policy to quarantine or reject",
+                                                "Add a rua tag to receive aggregate reports"]),
+    'dkim': ([], []),
+    'mta_sts': ([], ["Publish an MTA-STS policy"]),
+}
+
+def record(path, domains, **options):
+    journal = Journal(path, {'shard': [0, 1]}, **options)
+    journal.start()
+    started = time.perf_counter()
+    with journal.open():
+        for i in range(domains):
+            domain = f"domain{i}.example"
+            journal.add(Posture(domain, 'none', '~all', 'rsa', 'missing', 'google.com', 100, 3, 2048, 0, 2, 4))
+            journal.record(domain, REPORT)
+    return time.perf_counter() - started, journal.syncs
+
+def report(label, domains, elapsed, syncs=None):
+    extra = f", {syncs} fsyncs" if syncs is not None else ""
+    print(f"{label:22} {elapsed:.2f}s ({domains / elapsed:.0f} domains/s, "
+          f"{elapsed / domains * 1e6:.1f} us/domain{extra})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--domains', type=int, default=100000)
+    parser.add_argument('--unbatched', type=int, default=2000, help="domains recorded with one fsync each")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "batched.journal")
+        elapsed, syncs = record(path, args.domains)
+        report("record (batched):", args.domains, elapsed, syncs)
+        print(f"journal size:          {os.path.getsize(path) / 1e6:.1f} MB")
+
+        started = time.perf_counter()
+        replayed = sum(1 for _ in Journal(path, {'shard': [0, 1]}).replay())
+        report("replay:", replayed, time.perf_counter() - started)
+
+        elapsed, syncs = record(os.path.join(tmpdir, "unbatched.journal"), args.unbatched, sync_records=1)
+        report("record (fsync each):", args.unbatched, elapsed, syncs)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Micro-benchmark for the SPF/DMARC record parsers.
+
+Parses a synthetic corpus of distinct records (default: one million) with
+the memoization bypassed, then re-parses a hot subset through the cache.
+
+    python benchmarks/bench_parse.py --count 1000000
+"""
+
+import argparse
+import random
+import time
+from dmarc_audit.records import parse_spf, parse_dmarc
+
+SPF_TERMS = [
+    "include:_spf.google.com", "include:spf.protection.outlook.com", "include:sendgrid.net",
+    "ip4:192.0.2.{n}", "ip6:2001:db8::{n}/128", "a", "mx", "a:mail{n}.example.com/24",
+    "exists:%{{i}}._spf.example.com", "~all", "-all", "redirect=_spf{n}.example.com"
+]
+
+def build_corpus(count, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(count):
+        if n % 2:
+            terms = rng.sample(SPF_TERMS, rng.randint(2, 6))
+            corpus.append(("spf", "v=spf1 " + " ".join(t.format(n=n % 250) for t in terms)))
+        else:
+            policy = rng.choice(("none", "quarantine", "reject"))
+            corpus.append(("dmarc", f"v=DMARC1; p={policy}; pct={rng.randint(1, 100)}; "
+                                    f"rua=mailto:dmarc{n}@example.com; adkim=s; aspf=r"))
+    return corpus
+
+def run(corpus, spf, dmarc):
+    start = time.perf_counter()
+    for kind, record in corpus:
+        (spf if kind == "spf" else dmarc)(record)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.count)
+    cold = run(corpus, parse_spf.__wrapped__, parse_dmarc.__wrapped__)
+    print(f"uncached: {len(corpus)} records in {cold:.2f}s ({len(corpus) / cold:,.0f} records/s)")
+
+    hot = corpus[:1000] * (len(corpus) // 1000 or 1)
+    warm = run(hot, parse_spf, parse_dmarc)
+    print(f"memoized: {len(hot)} records in {warm:.2f}s ({len(hot) / warm:,.0f} records/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark of the portfolio summary on many synthetic domain postures.
+
+Adds ``--domains`` random postures to a ``Portfolio`` one at a time, as a
+bulk audit does, then summarizes it with the standard-library column
+operations and, when numpy is installed, with numpy.  Reports rows/s,
+summary time and the memory taken by the columns.
+
+    python benchmarks/bench_portfolio.py --domains 1000000
+"""
+
+import argparse
+import random
+import resource
+import sys
+import time
+
+from dmarc_audit.portfolio import Portfolio, Posture, _NumpyColumns, _PythonColumns, _load_numpy, summarize
+
+PROVIDERS = ['google.com', 'outlook.com', 'pphosted.com', 'mimecast.com', 'zoho.com', 'yandex.net', 'none']
+
+def postures(count, providers, rng):
+    own = [f"mail{i}.example" for i in range(providers)]
+    for number in range(count):
+        policy = rng.choice(('none', 'none', 'quarantine', 'reject', 'missing', 'invalid'))
+        dkim_key = rng.choice(('rsa', 'rsa', 'rsa', 'ed25519', 'missing'))
+        yield Posture(
+            domain=f"domain{number}.example",
+            dmarc_policy=policy,
+            spf_all=rng.choice(('-all', '~all', '~all', '?all', 'missing')),
+            dkim_key=dkim_key,
+            mta_sts_mode=rng.choice(('missing', 'missing', 'missing', 'enforce', 'testing')),
+            provider=rng.choice(PROVIDERS) if rng.random() < 0.7 else rng.choice(own),
+            dmarc_pct=-1 if policy in ('missing', 'invalid') else rng.choice((100, 100, 100, 50, 10)),
+            spf_lookups=rng.randint(0, 14),
+            dkim_bits={'rsa': rng.choice((1024, 2048, 2048, 4096)), 'ed25519': 256}.get(dkim_key, -1),
+            tls_rpt=int(rng.random() < 0.2),
+            vulnerabilities=rng.randint(0, 5),
+            recommendations=rng.randint(0, 8)
+        )
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--domains', type=int, default=1000000)
+    parser.add_argument('--providers', type=int, default=20000, help="distinct self-hosted mail domains")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows = list(postures(args.domains, args.providers, random.Random(args.seed)))
+    rss_before = peak_rss_mb()
+    portfolio = Portfolio()
+    started = time.perf_counter()
+    for posture in rows:
+        portfolio.add(posture)
+    added = time.perf_counter() - started
+    column_bytes = sum(column.itemsize * len(column)
+                       for columns in (portfolio.codes, portfolio.numbers) for column in columns.values())
+    print(f"domains:          {len(portfolio)} ({len(portfolio.values['provider'])} providers)")
+    print(f"add:              {added:.2f}s ({len(portfolio) / added:.0f} rows/s)")
+    print(f"columns:          {column_bytes / 1e6:.1f} MB (peak RSS {peak_rss_mb():.1f} MB, "
+          f"{rss_before:.1f} MB before adding)")
+
+    backends = [_PythonColumns()]
+    numpy = _load_numpy()
+    if numpy is not None:
+        backends.append(_NumpyColumns(numpy))
+    for backend in backends:
+        started = time.perf_counter()
+        summary = summarize(portfolio, backend)
+        print(f"summary ({backend.name + '):':8} {time.perf_counter() - started:.2f}s "
+              f"(dmarc_enforced {summary['rates']['dmarc_enforced']:.1%}, "
+              f"spf_lookups p99 {summary['stats']['spf_lookups']['p99']})")
+    if numpy is None:
+        print("numpy is not installed; only the standard-library backend was measured")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
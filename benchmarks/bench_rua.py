@@ -0,0 +1,113 @@
+"""Benchmark of DMARC aggregate report ingestion on large synthetic reports.
+
+Writes ``--reports`` gzip (or zip) reports of ``--records`` records each,
+spread over ``--sources`` source IPs, to a temporary directory, then
+ingests them all with one ``Aggregate``.  Reports records/s, uncompressed
+MB/s and peak RSS, which should stay flat as ``--records`` grows.
+
+    python benchmarks/bench_rua.py --records 500000 --reports 4 --sources 5000
+"""
+
+import argparse
+import gzip
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+from dmarc_audit.rua import ingest
+
+RECORD = (
+    "<record><row><source_ip>{ip}</source_ip><count>{count}</count><policy_evaluated>"
+    "<disposition>{disposition}</disposition><dkim>{dkim}</dkim><spf>{spf}</spf></policy_evaluated></row>"
+    "<identifiers><header_from>{header_from}</header_from><envelope_from>{header_from}</envelope_from></identifiers>"
+    "<auth_results><dkim><domain>{header_from}</domain><selector>s1</selector><result>{dkim}</result></dkim>"
+    "<spf><domain>{header_from}</domain><result>{spf}</result></spf></auth_results></record>\n"
+)
+
+def write_report(stream, index, records, sources, rng):
+    """Write one report to ``stream``; return the uncompressed size in bytes."""
+    head = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<feedback><report_metadata><org_name>receiver.bench</org_name>'
+        f'<email>noreply@receiver.bench</email><report_id>bench-{index}</report_id>'
+        '<date_range><begin>1700000000</begin><end>1700086400</end></date_range></report_metadata>'
+        '<policy_published><domain>example.com</domain><adkim>r</adkim><aspf>r</aspf><p>none</p><sp>none</sp>'
+        '<pct>100</pct></policy_published>\n'
+    ).encode()
+    stream.write(head)
+    size = len(head)
+    pool = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, sources + 1)]
+    batch = []
+    for _ in range(records):
+        passing = rng.random() < 0.95
+        batch.append(RECORD.format(
+            ip=rng.choice(pool),
+            count=rng.randint(1, 20),
+            disposition='none',
+            dkim='pass' if passing else 'fail',
+            spf='pass' if passing or rng.random() < 0.3 else 'fail',
+            header_from=rng.choice(('example.com', 'mail.example.com'))
+        ))
+        if len(batch) >= 10000:
+            chunk = "".join(batch).encode()
+            stream.write(chunk)
+            size += len(chunk)
+            batch = []
+    chunk = ("".join(batch) + "</feedback>\n").encode()
+    stream.write(chunk)
+    return size + len(chunk)
+
+def generate(directory, args):
+    rng = random.Random(args.seed)
+    size = 0
+    for index in range(args.reports):
+        if args.compress == 'zip':
+            with zipfile.ZipFile(os.path.join(directory, f"report{index}.zip"), 'w', zipfile.ZIP_DEFLATED) as archive:
+                with archive.open(f"report{index}.xml", 'w') as stream:
+                    size += write_report(stream, index, args.records, args.sources, rng)
+        elif args.compress == 'gzip':
+            with gzip.open(os.path.join(directory, f"report{index}.xml.gz"), 'wb', compresslevel=1) as stream:
+                size += write_report(stream, index, args.records, args.sources, rng)
+        else:
+            with open(os.path.join(directory, f"report{index}.xml"), 'wb') as stream:
+                size += write_report(stream, index, args.records, args.sources, rng)
+    return size
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000, help="records per report")
+    parser.add_argument('--reports', type=int, default=4)
+    parser.add_argument('--sources', type=int, default=5000, help="distinct source IPs")
+    parser.add_argument('--compress', choices=('gzip', 'zip', 'none'), default='gzip')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        size = generate(directory, args)
+        generated = time.perf_counter() - started
+        on_disk = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        rss_before = peak_rss_mb()
+
+        started = time.perf_counter()
+        aggregate = ingest([directory])
+        elapsed = time.perf_counter() - started
+
+    messages = sum(counts[0] for counts in aggregate.groups.values())
+    print(f"reports:          {aggregate.reports} ({args.compress}, {on_disk / 1e6:.1f} MB on disk, "
+          f"{size / 1e6:.1f} MB XML, generated in {generated:.1f}s)")
+    print(f"records:          {aggregate.records} ({messages} messages, {len(aggregate.groups)} groups)")
+    print(f"elapsed:          {elapsed:.2f}s ({aggregate.records / elapsed:.0f} records/s, "
+          f"{size / 1e6 / elapsed:.1f} MB/s)")
+    print(f"peak RSS:         {peak_rss_mb():.1f} MB (before ingestion: {rss_before:.1f} MB)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
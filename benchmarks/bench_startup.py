@@ -0,0 +1,54 @@
+"""Startup-time benchmark: ``import dmarc_audit`` and a no-op CLI run.
+
+Each command runs in a fresh interpreter ``--repeat`` times and the median,
+min and max wall time are reported, next to a bare ``python -c pass`` so the
+interpreter's own startup can be subtracted.
+
+    python benchmarks/bench_startup.py --repeat 30
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+COMMANDS = [
+    ("python", ["-c", "pass"]),
+    ("import dmarc_audit", ["-c", "import dmarc_audit"]),
+    ("import dmarc_audit.main", ["-c", "import dmarc_audit.main"]),
+    ("dmarc-audit --version", ["-m", "dmarc_audit.main", "--version"]),
+    ("dmarc-audit --help", ["-m", "dmarc_audit.main", "--help"])
+]
+
+def measure(arguments, repeat, cwd):
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # An empty working directory also shows that nothing (e.g. a log file) is created.
+    with tempfile.TemporaryDirectory() as cwd:
+        for label, arguments in COMMANDS:
+            times = measure(arguments, args.repeat, cwd)
+            print(f"{label:<26} median {statistics.median(times) * 1000:6.1f} ms"
+                  f"  (min {min(times) * 1000:.1f}, max {max(times) * 1000:.1f})")
+        created = os.listdir(cwd)
+    if created:
+        print(f"files created: {', '.join(sorted(created))}")
+
+if __name__ == "__main__":
+    main()
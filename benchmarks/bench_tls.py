@@ -0,0 +1,129 @@
+"""Benchmark of concurrent TLS inspection against local TLS servers.
+
+Starts one TLS server per certificate on 127.0.0.1 (each certificate covers
+``*.<group>.bench``, like shared hosting), plus an optional server that
+never answers the handshake, and inspects every synthetic host with one
+``TLSInspector``.  Reports throughput, per-host latency percentiles,
+handshakes made and how many distinct certificates were parsed.
+
+    python benchmarks/bench_tls.py --hosts 2000 --certificates 5 --stall-rate 0.01
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import ssl
+import sys
+import tempfile
+import time
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from dmarc_audit.tls import TLSInspector, clear_certificate_cache
+
+def make_certificate(group):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f"*.{group}.bench")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(f"*.{group}.bench")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                serialization.NoEncryption())
+    return cert.public_bytes(serialization.Encoding.PEM), key_pem
+
+def server_context(cert_pem, key_pem):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cert_path = os.path.join(tmpdir, "cert.pem")
+        key_path = os.path.join(tmpdir, "key.pem")
+        with open(cert_path, "wb") as f:
+            f.write(cert_pem)
+        with open(key_path, "wb") as f:
+            f.write(key_pem)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+    return context
+
+async def hang_up(reader, writer):
+    writer.close()
+
+async def stall(reader, writer):
+    await reader.read()
+    writer.close()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def run(args):
+    servers = []
+    endpoints = []
+    cadata = ""
+    for group in range(args.certificates):
+        cert_pem, key_pem = make_certificate(f"g{group}")
+        cadata += cert_pem.decode()
+        server = await asyncio.start_server(hang_up, '127.0.0.1', 0, ssl=server_context(cert_pem, key_pem))
+        servers.append(server)
+        endpoints.append((f"g{group}", server.sockets[0].getsockname()[1]))
+    stalled = await asyncio.start_server(stall, '127.0.0.1', 0)
+    servers.append(stalled)
+    stall_port = stalled.sockets[0].getsockname()[1]
+
+    stall_every = int(1 / args.stall_rate) if args.stall_rate else 0
+    targets = []
+    for index in range(args.hosts):
+        group, port = endpoints[index % len(endpoints)]
+        if stall_every and index % stall_every == 0:
+            port = stall_port
+        targets.append((f"mx{index}.{group}.bench", port))
+
+    clear_certificate_cache()
+    inspector = TLSInspector(ssl_context=ssl.create_default_context(cadata=cadata), connect_host='127.0.0.1',
+                             handshake_timeout=args.timeout, max_concurrency=args.concurrency)
+    latencies = []
+
+    async def inspect(host, port):
+        started = time.perf_counter()
+        result = await inspector.inspect(host, port)
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(inspect(host, port) for host, port in targets))
+    elapsed = time.perf_counter() - started
+    for server in servers:
+        server.close()
+
+    certificates = {result.certificate.fingerprint for result in results if result.certificate is not None}
+    errors = sum(1 for result in results if result.error is not None)
+    print(f"hosts:            {len(targets)} ({errors} failed)")
+    print(f"elapsed:          {elapsed:.2f}s ({len(targets) / elapsed:.0f} hosts/s)")
+    print(f"latency p50/p99:  {percentile(latencies, 0.5) * 1000:.1f} / {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"handshakes:       {inspector.handshakes}")
+    print(f"certificates:     {len(certificates)} distinct")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=2000)
+    parser.add_argument('--certificates', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=1.0, help="handshake timeout in seconds")
+    parser.add_argument('--stall-rate', type=float, default=0.01, help="fraction of hosts that never answer")
+    asyncio.run(run(parser.parse_args()))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
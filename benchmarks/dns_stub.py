@@ -0,0 +1,188 @@
+"""Local authoritative DNS stand-in for offline benchmarks.
+
+Serves a zone of synthetic domains over UDP on 127.0.0.1 and can inject
+per-query latency, dropped queries (timeouts) and REFUSED answers beyond a
+query rate (like a throttling public resolver).  Domains left out of the
+zone answer NXDOMAIN, so ``nxdomain_rate`` in :func:`build_zone` controls
+how many audited domains do not exist.
+
+    python benchmarks/dns_stub.py --domains 5000 --port 5353 --latency 5
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+import dns.zone
+
+ZONE_HEADER = """\
+$TTL 300
+. IN SOA ns.bench. hostmaster.bench. 1 3600 600 86400 300
+. IN NS ns.bench.
+ns.bench. IN A 127.0.0.1
+"""
+
+ESP_COUNT = 20
+SELECTORS = ('selector1', 'google', 's1', 'k1')
+
+def synthetic_domains(count):
+    return [f"d{n}.bench" for n in range(count)]
+
+def build_zone(count, nxdomain_rate=0.0, seed=0):
+    """Return ``(zone_text, domains)`` for ``count`` synthetic domains.
+
+    About ``nxdomain_rate`` of the returned domains are not in the zone.
+    Domains share a pool of ESP SPF includes and MX hosts, as real ones do.
+    """
+    rng = random.Random(seed)
+    lines = [ZONE_HEADER]
+    for esp in range(ESP_COUNT):
+        lines.append(f'_spf.esp{esp}.bench. IN TXT "v=spf1 ip4:198.51.{esp}.0/24 include:_spf2.esp{esp}.bench ~all"')
+        lines.append(f'_spf2.esp{esp}.bench. IN TXT "v=spf1 ip6:2001:db8:{esp:x}::/48 ~all"')
+        lines.append(f"mx.esp{esp}.bench. IN A 192.0.2.{esp + 1}")
+    domains = synthetic_domains(count)
+    for n, domain in enumerate(domains):
+        if rng.random() < nxdomain_rate:
+            continue
+        esp = rng.randrange(ESP_COUNT)
+        name = f"{domain}."
+        lines.append(f'{name} IN TXT "v=spf1 include:_spf.esp{esp}.bench mx ip4:203.0.113.{n % 250}/32 -all"')
+        lines.append(f"{name} IN MX 10 mx.esp{esp}.bench.")
+        lines.append(f"{name} IN A 203.0.113.{n % 250}")
+        policy = rng.choice(('none', 'quarantine', 'reject'))
+        lines.append(f'_dmarc.{name} IN TXT "v=DMARC1; p={policy}; rua=mailto:dmarc@{domain}"')
+        if rng.random() < 0.5:
+            selector = rng.choice(SELECTORS)
+            lines.append(f'{selector}._domainkey.{name} IN TXT "v=DKIM1; k=rsa; p=MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA"')
+        if rng.random() < 0.2:
+            lines.append(f'_mta-sts.{name} IN TXT "v=STSv1; id={n}"')
+            lines.append(f'_smtp._tls.{name} IN TXT "v=TLSRPTv1; rua=mailto:tls@{domain}"')
+    return "\n".join(lines) + "\n", domains
+
+def load_zone(text):
+    return dns.zone.from_text(text, origin=dns.name.root, relativize=False)
+
+class StubDNSProtocol(asyncio.DatagramProtocol):
+    """Answer queries from a :class:`dns.zone.Zone`, authoritatively."""
+
+    def __init__(self, zone, latency=0.0, jitter=0.0, timeout_rate=0.0, max_qps=0, seed=0):
+        self.zone = zone
+        self.latency = latency
+        self.jitter = jitter
+        self.timeout_rate = timeout_rate
+        self.max_qps = max_qps
+        self.rng = random.Random(seed)
+        self.queries = 0
+        self.dropped = 0
+        self.refused = 0
+        self._second = 0
+        self._second_queries = 0
+        self.soa = zone.find_rrset(dns.name.root, dns.rdatatype.SOA)
+        # Names that only exist as parents of other names (e.g. _domainkey.x)
+        # answer NODATA rather than NXDOMAIN.
+        self.existing = set()
+        for name in zone.nodes:
+            while name != dns.name.root:
+                self.existing.add(name)
+                name = name.parent()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        if self.timeout_rate and self.rng.random() < self.timeout_rate:
+            self.dropped += 1
+            return
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+        if self._over_limit():
+            self.refused += 1
+            response = dns.message.make_response(query)
+            response.set_rcode(dns.rcode.REFUSED)
+            self.transport.sendto(response.to_wire(), addr)
+            return
+        wire = self.answer(query).to_wire()
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, wire, addr)
+        else:
+            self.transport.sendto(wire, addr)
+
+    def _over_limit(self):
+        if not self.max_qps:
+            return False
+        second = int(time.monotonic())
+        if second != self._second:
+            self._second, self._second_queries = second, 0
+        self._second_queries += 1
+        return self._second_queries > self.max_qps
+
+    def answer(self, query):
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        node = self.zone.get_node(question.name)
+        if node is not None:
+            rdataset = node.get_rdataset(dns.rdataclass.IN, question.rdtype)
+            if rdataset is not None:
+                rrset = dns.rrset.RRset(question.name, dns.rdataclass.IN, question.rdtype)
+                rrset.update(rdataset)
+                response.answer.append(rrset)
+                return response
+        elif question.name not in self.existing:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        response.authority.append(self.soa)
+        return response
+
+async def serve(zone, host='127.0.0.1', port=0, **options):
+    """Start serving ``zone``; returns ``(transport, protocol)``.
+
+    With ``port=0`` the OS picks a free port; read it back from
+    ``transport.get_extra_info('sockname')``.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(
+        lambda: StubDNSProtocol(zone, **options), local_addr=(host, port)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--domains", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=5353)
+    parser.add_argument("--latency", type=float, default=0.0, help="Milliseconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random milliseconds per answer")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of queries dropped")
+    parser.add_argument("--nxdomain-rate", type=float, default=0.0, help="Fraction of domains left out of the zone")
+    parser.add_argument("--max-qps", type=int, default=0, help="Answer REFUSED beyond this many queries per second")
+    args = parser.parse_args()
+
+    text, _ = build_zone(args.domains, args.nxdomain_rate)
+
+    async def run():
+        transport, protocol = await serve(
+            load_zone(text), port=args.port, latency=args.latency / 1000,
+            jitter=args.jitter / 1000, timeout_rate=args.timeout_rate, max_qps=args.max_qps
+        )
+        print(f"Serving {args.domains} synthetic domains on 127.0.0.1:{args.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            transport.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
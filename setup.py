@@ -17,7 +17,8 @@ setup(
         "dnspython",
         "rich",
         "colorama",
-        "pyfiglet"
+        "pyfiglet",
+        "cryptography"
     ],
     entry_points={
         "console_scripts": [
@@ -7,19 +7,40 @@ Created by: Sevban Dönmez
 Version: 1.0.0
 """
 
-from .main import main
-from .analyzer import (
-    analyze_dmarc,
-    analyze_spf,
-    check_dkim,
-    SecurityAnalyzer
-)
-from .utils import (
-    print_banner,
-    create_report,
-    print_results_table,
-    print_status
-)
+import importlib
 
 __version__ = "1.0.0"
-__author__ = "Sevban Dönmez" 
\ No newline at end of file
+__author__ = "Sevban Dönmez"
+
+# Public names and the submodule defining each.  They are imported on first
+# access so ``import dmarc_audit`` stays cheap for scripted runs.
+_EXPORTS = {
+    'main': 'main',
+    'analyze_dmarc': 'analyzer',
+    'analyze_spf': 'analyzer',
+    'check_dkim': 'analyzer',
+    'SecurityAnalyzer': 'analyzer',
+    'print_banner': 'utils',
+    'create_report': 'utils',
+    'print_results_table': 'utils',
+    'print_status': 'utils',
+    'audit_domain': 'api',
+    'audit_many': 'api',
+    'aaudit_domain': 'api',
+    'aaudit_many': 'api',
+    'AuditResult': 'api',
+    'Finding': 'api'
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,232 +1,561 @@
-import dns.resolver
-import socket
-import ssl
-from datetime import datetime
-from rich.console import Console
-from .config import DNS_TIMEOUT, DNS_LIFETIME, DNS_SERVERS
+import asyncio
+import ipaddress
+from .context import AuditContext
+from .config import (
+    MAX_SPF_INCLUDES,
+    MAX_SPF_VOID_LOOKUPS,
+    MAX_FORENSIC_URIS,
+    MIN_RSA_KEY_BITS,
+    RECOMMENDED_RSA_KEY_BITS,
+    MTA_STS_MIN_MAX_AGE
+)
+from .dkim import load_dkim_key
+from .findings import Message
+from .mta_sts import mx_matches
+from .providers import get_provider_index
+from .records import parse_spf, parse_dmarc, parse_dkim, parse_mta_sts
+from .resolver import get_resolver, mx_hosts, txt_value
+from .smtp import mx_findings
+from .tls import tls_findings
+from .tracing import traced
 from .logger import logger
 
-console = Console()
 
 def get_dns_record(domain, record_type):
-    resolver = dns.resolver.Resolver()
-    
-    # DNS sunucularını yapılandır
-    resolver.nameservers = [
-        DNS_SERVERS['google_primary'],      # 8.8.8.8
-        DNS_SERVERS['google_secondary'],    # 8.8.4.4
-        DNS_SERVERS['cloudflare_primary'],  # 1.1.1.1
-        DNS_SERVERS['cloudflare_secondary'] # 1.0.0.1
-    ]
-    
-    # Timeout ayarları
-    resolver.timeout = 2.0    # Her sorgu için timeout
-    resolver.lifetime = 10.0  # Toplam sorgu süresi limiti
-    
-    try:
-        answers = resolver.resolve(domain, record_type)
-        return [str(rdata) for rdata in answers]
-    except dns.resolver.Timeout:
-        console.print(f"[yellow]Warning:[/yellow] DNS timeout while querying {domain}. Retrying with different DNS servers...")
-        # Alternatif DNS sunucuları ile tekrar dene
-        for ns in resolver.nameservers[1:]:
-            resolver.nameservers = [ns]
-            try:
-                answers = resolver.resolve(domain, record_type)
-                return [str(rdata) for rdata in answers]
-            except:
-                continue
-        return []
-    except dns.resolver.NXDOMAIN:
-        logger.info(f"No DNS record found for {domain} ({record_type})")
-        return []
-    except Exception as e:
-        logger.error(f"DNS lookup error for {domain}: {str(e)}")
-        return []
+    answer = get_resolver().lookup(domain, record_type)
+    if answer.status == 'TIMEOUT':
+        logger.warning(f"DNS timeout while querying {domain}")
+    return list(answer.records)
+
+def _address_networks(addresses, ip4_cidr, ip6_cidr):
+    networks = []
+    for address in addresses:
+        cidr = ip6_cidr if ':' in address else ip4_cidr
+        try:
+            networks.append(ipaddress.ip_network(f"{address}/{cidr}", strict=False))
+        except ValueError:
+            continue
+    return networks
+
+class SPFNode:
+    """Fetched SPF record of one domain plus the addresses its a/mx mechanisms name."""
+
+    __slots__ = ('domain', 'status', 'spf', 'addresses', 'errors')
+
+    def __init__(self, domain, status, record=None):
+        self.domain = domain
+        self.status = status
+        self.spf = parse_spf(record) if record else None
+        self.addresses = {}
+        self.errors = []
+
+    def targets(self):
+        """Domains whose SPF records this record pulls in (include and redirect)."""
+        if self.spf is None:
+            return []
+        targets = [m.value for m in self.spf.named('include') if m.value]
+        if self.spf.redirect:
+            targets.append(self.spf.redirect)
+        return [t.lower().rstrip('.') for t in targets if '%' not in t]
+
+class SPFResult:
+    """Outcome of expanding an SPF record and everything it includes."""
+
+    def __init__(self, domain):
+        self.domain = domain
+        self.record = None
+        self.lookups = 0
+        self.void_lookups = 0
+        self.networks = set()
+        self.errors = []
+        self.tree = {}
+        self.loop_free = True
+
+    def merge(self, other):
+        self.lookups += other.lookups
+        self.void_lookups += other.void_lookups
+        self.networks |= other.networks
+        self.errors.extend(e for e in other.errors if e not in self.errors)
+        self.loop_free = self.loop_free and other.loop_free
+
+    def authorized_networks(self):
+        """Collapse the authorized ranges into the smallest list of IPv4 and IPv6 networks."""
+        ip4 = [n for n in self.networks if n.version == 4]
+        ip6 = [n for n in self.networks if n.version == 6]
+        return list(ipaddress.collapse_addresses(ip4)) + list(ipaddress.collapse_addresses(ip6))
+
+class SPFEvaluator:
+    """Expand SPF include/redirect trees and count DNS lookups per RFC 7208.
+
+    One evaluator is meant to be shared by a whole batch: DNS fetches of a
+    domain's SPF record (and of its a/mx targets) are memoized, so an
+    include such as ``_spf.google.com`` shared by thousands of domains is
+    fetched and expanded only once.  Records are fetched concurrently and
+    the tree is then summarized with loop detection.
+    """
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver or get_resolver()
+        self._nodes = {}
+        self._summaries = {}
+        self._included = set()
+
+    def _load(self, domain):
+        task = self._nodes.get(domain)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_node(domain))
+            self._nodes[domain] = task
+        return task
 
-def analyze_spf(spf_record):
+    async def _fetch_node(self, domain):
+        answer = await self.resolver.alookup(domain, 'TXT')
+        if answer.status != 'NOERROR':
+            return SPFNode(domain, answer.status)
+        records = [txt_value(r) for r in answer.records]
+        records = [r for r in records if r.lower().split(' ', 1)[0] == 'v=spf1']
+        if not records:
+            return SPFNode(domain, 'NOSPF')
+        node = SPFNode(domain, 'NOERROR', records[0])
+        if len(records) > 1:
+            node.errors.append(Message(
+                "spf.multiple-records",
+                f"Multiple SPF records published for {domain}",
+                domain=domain
+            ))
+        lookups = [m for m in node.spf.mechanisms if m.name in ('a', 'mx')]
+        results = await asyncio.gather(*(self._fetch_addresses(domain, m) for m in lookups))
+        node.addresses = {(m.name, m.value): result for m, result in zip(lookups, results)}
+        return node
+
+    async def _fetch_addresses(self, domain, mechanism):
+        """Return ``(networks, void, error)`` for an a or mx mechanism."""
+        target, ip4_cidr, ip6_cidr = mechanism.split_cidr(domain)
+        if '%' in target:
+            return [], False, None
+        hosts = [target]
+        if mechanism.name == 'mx':
+            answer = await self.resolver.alookup(target, 'MX')
+            hosts = mx_hosts(answer.records)
+            if not hosts:
+                return [], answer.status in ('NXDOMAIN', 'NODATA', 'NOERROR'), None
+            if len(hosts) > 10:
+                return [], False, Message(
+                    "spf.too-many-mx",
+                    f"Too many MX records for mx:{target} ({len(hosts)}, limit 10)",
+                    target=target, hosts=len(hosts)
+                )
+        answers = await asyncio.gather(*(
+            self.resolver.alookup(host, rtype) for host in hosts for rtype in ('A', 'AAAA')
+        ))
+        addresses = [address for answer in answers for address in answer.records]
+        return _address_networks(addresses, ip4_cidr, ip6_cidr), mechanism.name == 'a' and not addresses, None
+
+    async def _crawl(self, domain):
+        """Fetch every record reachable from ``domain``, following includes as they arrive."""
+        seen = {domain}
+        pending = {self._load(domain)}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for target in task.result().targets():
+                    self._included.add(target)
+                    if target not in seen:
+                        seen.add(target)
+                        pending.add(self._load(target))
+
+    def _summarize(self, domain, stack):
+        cached = self._summaries.get(domain)
+        if cached is not None:
+            return cached
+        node = self._nodes[domain].result()
+        result = SPFResult(domain)
+        result.record = node.spf.raw
+        result.errors.extend(node.errors)
+        result.lookups += node.spf.lookup_count()
+        for mechanism in node.spf.mechanisms:
+            name, value = mechanism.name, mechanism.value
+            if name in ('ip4', 'ip6') and mechanism.qualifier == '+':
+                try:
+                    result.networks.add(ipaddress.ip_network(value, strict=False))
+                except ValueError:
+                    result.errors.append(Message("spf.invalid-mechanism", f"Invalid {name} mechanism: {value}",
+                                                 mechanism=name, value=value))
+            elif name in ('a', 'mx'):
+                networks, void, error = node.addresses.get((name, value), ([], False, None))
+                result.void_lookups += int(void)
+                if error:
+                    result.errors.append(error)
+                if mechanism.qualifier == '+':
+                    result.networks.update(networks)
+            elif name == 'include' and value:
+                self._expand(value, stack, result, f"include:{value}")
+        redirect = node.spf.redirect
+        if redirect:
+            self._expand(redirect, stack, result, f"redirect={redirect}")
+        if result.loop_free and domain in self._included:
+            self._summaries[domain] = result
+        return result
+
+    def _expand(self, target, stack, result, term):
+        target = target.lower().rstrip('.')
+        if '%' in target:
+            result.tree[term] = {}
+            return
+        if target in stack:
+            chain = ' -> '.join(stack + [target])
+            result.errors.append(Message("spf.include-loop", f"SPF include loop detected ({chain})", chain=chain))
+            result.loop_free = False
+            return
+        node = self._nodes[target].result()
+        if node.status in ('NXDOMAIN', 'NODATA'):
+            result.void_lookups += 1
+        if node.status != 'NOERROR':
+            reason = "has no SPF record" if node.status in ('NXDOMAIN', 'NODATA', 'NOSPF') else f"lookup failed ({node.status})"
+            result.errors.append(Message("spf.bad-target", f"SPF {term} target {reason}", term=term, reason=reason))
+            result.tree[term] = {}
+            return
+        child = self._summarize(target, stack + [target])
+        result.merge(child)
+        result.tree[term] = child.tree
+
+    @traced('spf.evaluate')
+    async def evaluate(self, domain):
+        """Expand the SPF record of ``domain`` and return an :class:`SPFResult`."""
+        domain = domain.lower().rstrip('.')
+        await self._crawl(domain)
+        node = self._nodes[domain].result()
+        if node.status != 'NOERROR':
+            result = SPFResult(domain)
+        else:
+            result = self._summarize(domain, [domain])
+        if domain not in self._included:
+            # Keep memoized state only for records other domains include.
+            self._nodes.pop(domain, None)
+        return result
+
+def evaluate_spf(domain, resolver=None):
+    """Synchronous :meth:`SPFEvaluator.evaluate` for a single domain."""
+    return asyncio.run(SPFEvaluator(resolver).evaluate(domain))
+
+@traced('analyze.spf')
+def analyze_spf(spf_record, evaluation=None):
     vulnerabilities = []
     recommendations = []
     if not spf_record:
-        vulnerabilities.append("Missing SPF record")
+        vulnerabilities.append(Message("spf.missing", "Missing SPF record"))
         return vulnerabilities, recommendations
-    spf = spf_record[0].lower()
-    # Recommendations
+    if len(spf_record) > 1:
+        vulnerabilities.append(Message(
+            "spf.multiple-records",
+            "Multiple SPF records published (receivers return permerror)"
+        ))
+    spf = parse_spf(txt_value(spf_record[0]))
+    vulnerabilities.extend(spf.errors)
     # Common vulnerability checks
-    if "+all" in spf:
-        vulnerabilities.append("Overly permissive SPF policy (+all)")
-    if "include:mailgun.org" in spf or "include:sendgrid.net" in spf:
-        vulnerabilities.append("Third-party email service included without proper restriction")
-    if spf.count("include:") > 10:
-        vulnerabilities.append("Excessive DNS lookups (more than 10 includes)")
-    if "ptr" in spf:
-        vulnerabilities.append("Insecure PTR mechanism used")
-    recommendations = []
+    if spf.all_qualifier == '+':
+        vulnerabilities.append(Message("spf.permissive-all", "Overly permissive SPF policy (+all)"))
+    if any(get_provider_index().shared_spf(m.value) for m in spf.named('include')):
+        vulnerabilities.append(Message("spf.unrestricted-include",
+                                       "Third-party email service included without proper restriction"))
+    lookups = evaluation.lookups if evaluation is not None else spf.lookup_count()
+    if lookups > MAX_SPF_INCLUDES:
+        vulnerabilities.append(Message(
+            "spf.too-many-lookups",
+            f"Excessive DNS lookups ({lookups} lookups, limit {MAX_SPF_INCLUDES})",
+            lookups=lookups
+        ))
+    if evaluation is not None:
+        if evaluation.void_lookups > MAX_SPF_VOID_LOOKUPS:
+            vulnerabilities.append(Message(
+                "spf.too-many-void-lookups",
+                f"Too many void DNS lookups ({evaluation.void_lookups}, limit {MAX_SPF_VOID_LOOKUPS})",
+                void_lookups=evaluation.void_lookups
+            ))
+        vulnerabilities.extend(evaluation.errors)
+    if spf.has('ptr'):
+        vulnerabilities.append(Message("spf.ptr-mechanism", "Insecure PTR mechanism used"))
     # Recommendations
-    if "redirect=" not in spf and "-all" not in spf:
-        recommendations.append("Consider adding '-all' to enforce strict policy")
-    if "exp=" not in spf:
-        recommendations.append("Consider adding exp= modifier to receive explanation on failures")
-    
+    if not spf.redirect and spf.all_qualifier != '-':
+        recommendations.append(Message("spf.not-strict", "Consider adding '-all' to enforce strict policy"))
+    if 'exp' not in spf.modifiers:
+        recommendations.append(Message(
+            "spf.no-explanation",
+            "Consider adding exp= modifier to receive explanation on failures"
+        ))
+
     return vulnerabilities, recommendations
-    
+
+@traced('analyze.dmarc')
 def analyze_dmarc(dmarc_record):
     vulnerabilities = []
     recommendations = []
-    tags = {}
-    
+
     if not dmarc_record:
-        vulnerabilities.append("Missing DMARC record")
+        vulnerabilities.append(Message("dmarc.missing", "Missing DMARC record"))
         return vulnerabilities, recommendations
-        
-    dmarc = dmarc_record[0].lower()
-    
-    for part in dmarc.split(";"):
-        part = part.strip()
-        if "=" in part:
-            key, value = part.split("=", 1)
-            tags[key] = value
+    if len(dmarc_record) > 1:
+        vulnerabilities.append(Message(
+            "dmarc.multiple-records",
+            "Multiple DMARC records published (receivers ignore DMARC)"
+        ))
+
+    dmarc = parse_dmarc(txt_value(dmarc_record[0]))
+    vulnerabilities.extend(dmarc.errors)
 
     # Policy checks
-    policy = tags.get('p', 'none')
+    policy = dmarc.policy or 'none'
     if policy == 'none':
-        vulnerabilities.append("Policy set to monitoring only (p=none)")
-    if policy == 'reject' and 'pct' in tags and tags['pct'] != '100':
-        vulnerabilities.append(f"Partial policy enforcement (pct={tags['pct']})")
-    if 'ruf' in tags and len(tags['ruf'].split(",")) > 2:
-        vulnerabilities.append("Too many forensic reporting URIs (max 2 recommended)")
-    recommendations = []
+        vulnerabilities.append(Message("dmarc.policy-none", "Policy set to monitoring only (p=none)"))
+    if policy == 'reject' and dmarc.pct is not None and dmarc.pct != 100:
+        vulnerabilities.append(Message("dmarc.partial-enforcement", f"Partial policy enforcement (pct={dmarc.pct})",
+                                       pct=dmarc.pct))
+    if len(dmarc.ruf) > MAX_FORENSIC_URIS:
+        vulnerabilities.append(Message("dmarc.too-many-ruf",
+                                       f"Too many forensic reporting URIs (max {MAX_FORENSIC_URIS} recommended)"))
     # Protocol validation
-    if 'adkim' not in tags:
-        recommendations.append("Consider specifying DKIM alignment mode (adkim)")
-    if 'aspf' not in tags:
-        recommendations.append("Consider specifying SPF alignment mode (aspf)")
-    
+    if dmarc.adkim is None:
+        recommendations.append(Message("dmarc.no-adkim", "Consider specifying DKIM alignment mode (adkim)"))
+    if dmarc.aspf is None:
+        recommendations.append(Message("dmarc.no-aspf", "Consider specifying SPF alignment mode (aspf)"))
+
+    return vulnerabilities, recommendations
+
+def check_dkim_key(key_type, public_key):
+    """Findings for the key size of a decoded DKIM public key."""
+    vulnerabilities = []
+    recommendations = []
+    key = load_dkim_key(key_type, public_key)
+    if key.error is not None:
+        vulnerabilities.append(Message(
+            "dkim.invalid-key",
+            f"Unable to analyze DKIM public key: {key.error}",
+            error=key.error
+        ))
+    elif key.key_type == 'rsa':
+        if key.bits < MIN_RSA_KEY_BITS:
+            vulnerabilities.append(Message(
+                "dkim.weak-rsa-key",
+                f"Weak RSA key length detected ({key.bits} bits)",
+                bits=key.bits
+            ))
+            recommendations.append(Message(
+                "dkim.upgrade-rsa-key",
+                f"Upgrade RSA key length to at least {MIN_RSA_KEY_BITS} bits",
+                bits=MIN_RSA_KEY_BITS
+            ))
+        elif key.bits < RECOMMENDED_RSA_KEY_BITS:
+            recommendations.append(Message(
+                "dkim.stronger-rsa-key",
+                f"Consider upgrading to {RECOMMENDED_RSA_KEY_BITS}-bit RSA key for future-proof security",
+                bits=RECOMMENDED_RSA_KEY_BITS
+            ))
     return vulnerabilities, recommendations
 
 def check_rsa_key_strength(record):
+    dkim = parse_dkim(txt_value(record))
+    if dkim.key_type != 'rsa' or not dkim.public_key:
+        return [], []
+    return check_dkim_key(dkim.key_type, dkim.public_key)
+
+@traced('analyze.mta_sts')
+def analyze_mta_sts(mta_sts_record, policy, hosts):
+    """Check the ``_mta-sts`` TXT records, the fetched :class:`~dmarc_audit.mta_sts.PolicyResult`
+    (including the TLS certificate of the policy host) and whether every MX host in
+    ``hosts`` matches the policy's ``mx`` patterns."""
     vulnerabilities = []
     recommendations = []
-    try:
-        if "k=rsa" in record.lower():
-            key_parts = record.split('p=')[1].split(';')[0].strip()
-            key_length = len(key_parts) * 6
-            
-            if key_length < 2048:
-                vulnerabilities.append(f"Weak RSA key length detected ({key_length} bits)")
-                recommendations.append("Upgrade RSA key length to at least 2048 bits")
-            elif key_length < 4096:
-                recommendations.append("Consider upgrading to 4096-bit RSA key for future-proof security")
-    except:
-        vulnerabilities.append("Unable to analyze RSA key length")
-        
+
+    records = [r for r in map(txt_value, mta_sts_record) if r.lower().startswith('v=stsv1')]
+    if not records:
+        recommendations.append(Message("mta_sts.missing", "Implement MTA-STS for enhanced mail transport security"))
+        return vulnerabilities, recommendations
+    if len(records) > 1:
+        vulnerabilities.append(Message(
+            "mta_sts.multiple-records",
+            "Multiple MTA-STS records published (senders ignore MTA-STS)"
+        ))
+        return vulnerabilities, recommendations
+    record = parse_mta_sts(records[0])
+    vulnerabilities.extend(record.errors)
+    if policy is None:
+        return vulnerabilities, recommendations
+    if policy.error is not None:
+        vulnerabilities.append(Message("mta_sts.fetch-failed", f"MTA-STS policy could not be fetched: {policy.error}",
+                                       error=policy.error))
+        return vulnerabilities, recommendations
+    if policy.tls is not None:
+        tls_vulns, tls_recs = tls_findings(policy.tls)
+        vulnerabilities.extend(tls_vulns)
+        recommendations.extend(tls_recs)
+
+    parsed = policy.policy
+    vulnerabilities.extend(parsed.errors)
+    if parsed.mode == 'none':
+        recommendations.append(Message("mta_sts.mode-none", "MTA-STS policy mode is none (policy withdrawn)"))
+    elif parsed.mode in ('testing', 'enforce'):
+        if parsed.mode == 'testing':
+            recommendations.append(Message(
+                "mta_sts.mode-testing",
+                "MTA-STS policy is in testing mode; switch to enforce once TLS reports are clean"
+            ))
+        for host in hosts:
+            if not any(mx_matches(pattern, host) for pattern in parsed.mx):
+                vulnerabilities.append(Message(
+                    "mta_sts.mx-mismatch",
+                    f"MX host {host} is not covered by the MTA-STS policy",
+                    host=host
+                ))
+    if parsed.max_age is not None and parsed.max_age < MTA_STS_MIN_MAX_AGE:
+        recommendations.append(Message(
+            "mta_sts.short-max-age",
+            f"Increase MTA-STS max_age ({parsed.max_age}s) to at least {MTA_STS_MIN_MAX_AGE} seconds",
+            max_age=parsed.max_age
+        ))
     return vulnerabilities, recommendations
 
-def check_mta_security(domain):
+@traced('check.mta_security')
+def check_mta_security(domain, context=None):
     vulnerabilities = []
     recommendations = []
+    context = context or AuditContext(domain)
     try:
-        mta_sts = get_dns_record(f"_mta-sts.{domain}", "TXT")
-        if not mta_sts:
-            recommendations.append("Implement MTA-STS for enhanced mail transport security")
-        tls_rpt = get_dns_record(f"_smtp._tls.{domain}", "TXT")
+        hosts = context.mx_hosts()
+        mta_vulns, mta_recs = analyze_mta_sts(context.records(f"_mta-sts.{domain}", "TXT"),
+                                              context.mta_sts_policy(), hosts)
+        vulnerabilities.extend(mta_vulns)
+        recommendations.extend(mta_recs)
+        tls_rpt = context.records(f"_smtp._tls.{domain}", "TXT")
         if not tls_rpt:
-            recommendations.append("Enable TLS reporting (TLS-RPT) for monitoring mail transport security")
-        mx_records = dns.resolver.resolve(domain, 'MX')
-        for mx in mx_records:
-            mx_host = str(mx.exchange).rstrip('.')
-            try:
-                with socket.create_connection((mx_host, 25), timeout=5) as sock:
-                    response = sock.recv(1024).decode()
-                    if "STARTTLS" not in response:
-                        vulnerabilities.append(f"STARTTLS not supported on {mx_host}")
-                        recommendations.append(f"Enable STARTTLS on mail server {mx_host}")
-            except:
-                vulnerabilities.append(f"Unable to check STARTTLS on {mx_host}")
+            recommendations.append(Message("mta_sts.no-tls-rpt",
+                                           "Enable TLS reporting (TLS-RPT) for monitoring mail transport security"))
+        for mx_host in hosts:
+            mx_vulns, mx_recs = mx_findings(context.smtp(mx_host))
+            vulnerabilities.extend(mx_vulns)
+            recommendations.extend(mx_recs)
     except Exception as e:
-        vulnerabilities.append(f"MTA security check failed: {str(e)}")
+        vulnerabilities.append(Message("{check}.check-failed", f"MTA security check failed: {str(e)}", error=str(e)))
     return vulnerabilities, recommendations
 
-def check_dkim(domain, selector):
+@traced('analyze.dkim')
+def analyze_dkim(dkim_record):
+    vulnerabilities = []
+    recommendations = []
+    if not dkim_record:
+        vulnerabilities.append(Message("dkim.missing", "Missing DKIM record"))
+        return vulnerabilities, recommendations
+    if len(dkim_record) > 1:
+        vulnerabilities.append(Message("dkim.multiple-records", "Multiple DKIM records found"))
+    dkim = parse_dkim(txt_value(dkim_record[0]))
+    vulnerabilities.extend(dkim.errors)
+    if not dkim.public_key:
+        # An empty p= is how RFC 6376 revokes a key.
+        vulnerabilities.append(Message("dkim.missing-key", "Invalid or missing public key in DKIM record"))
+        return vulnerabilities, recommendations
+
+    key_vulns, key_recs = check_dkim_key(dkim.key_type, dkim.public_key)
+    vulnerabilities.extend(key_vulns)
+    recommendations.extend(key_recs)
+    return vulnerabilities, recommendations
+
+def analyze_dkim_selectors(found):
+    """Analyze the ``{selector: records}`` found by selector discovery.
+
+    Findings are prefixed with their selector so several keys can be told apart.
+    """
+    if not found:
+        return [Message("dkim.missing", "Missing DKIM record")], []
+    vulnerabilities = []
+    recommendations = []
+    for selector, dkim_record in found.items():
+        vulns, recs = analyze_dkim(dkim_record)
+        vulnerabilities.extend(v.prefixed(f"[{selector}] ", selector=selector) for v in vulns)
+        recommendations.extend(r.prefixed(f"[{selector}] ", selector=selector) for r in recs)
+    return vulnerabilities, recommendations
+
+@traced('check.dkim')
+def check_dkim(domain, selector, context=None, selectors=None):
+    """Check the DKIM record of ``selector``, or of every selector in ``selectors`` that exists."""
     try:
-        dkim_record = get_dns_record(f"{selector}._domainkey.{domain}", "TXT")
-        if not dkim_record:
-            return ["Missing DKIM record"], []
-        vulnerabilities = []
-        recommendations = []
-        record = "".join(dkim_record).lower()
-        mta_vulns, mta_recs = check_mta_security(domain)
-        if "k=rsa;" in record:
-            if "p= " in record or "p=" not in record:
-                vulnerabilities.append("Invalid or missing public key in DKIM record")
-            
-            # Add RSA key strength check
-            rsa_vulns, rsa_recs = check_rsa_key_strength(record)
-            vulnerabilities.extend(rsa_vulns)
-            recommendations.extend(rsa_recs)
-        
+        context = context or AuditContext(domain, selector)
+        if selectors:
+            found = context.discover_selectors(selectors)
+            if not found:
+                return [Message("dkim.missing", "Missing DKIM record")], []
+            vulnerabilities, recommendations = analyze_dkim_selectors(found)
+        else:
+            dkim_record = context.records(f"{selector}._domainkey.{domain}", "TXT")
+            if not dkim_record:
+                return [Message("dkim.missing", "Missing DKIM record")], []
+            vulnerabilities, recommendations = analyze_dkim(dkim_record)
+
         # Add MTA security check
-        mta_vulns, mta_recs = check_mta_security(domain)
+        mta_vulns, mta_recs = check_mta_security(domain, context)
         vulnerabilities.extend(mta_vulns)
         recommendations.extend(mta_recs)
         return vulnerabilities, recommendations
     except Exception as e:
-        return [f"DKIM check failed: {str(e)}"], []
+        return [Message("{check}.check-failed", f"DKIM check failed: {str(e)}", error=str(e))], []
 
 class SecurityAnalyzer:
-    def __init__(self, domain):
+    def __init__(self, domain, resolver=None, context=None):
         self.domain = domain
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = [
-            DNS_SERVERS['google_primary'],
-            DNS_SERVERS['cloudflare_primary']
-        ]
-        self.resolver.timeout = 2.0
-        self.resolver.lifetime = 10.0
+        self.context = context or AuditContext(domain, resolver=resolver)
+        self.resolver = self.context.resolver
 
+    @traced('check.mx_records')
     def check_mx_records(self):
         vulnerabilities = []
+        answer = self.context.lookup(self.domain, 'MX')
+        if answer.status == 'TIMEOUT':
+            logger.warning(f"DNS timeout while checking MX records of {self.domain}")
+            return vulnerabilities
+        if answer.status == 'ERROR':
+            logger.warning(f"MX record check failed for {self.domain}")
+            return vulnerabilities
+        hosts = mx_hosts(answer.records)
+        if not hosts:
+            vulnerabilities.append(Message("mx.missing", "No MX records found"))
         try:
-            mx_records = self.resolver.resolve(self.domain, 'MX')
-            if not mx_records:
-                vulnerabilities.append("No MX records found")
-            for mx in mx_records:
-                host = str(mx.exchange).rstrip('.')
+            for host in hosts:
                 vulnerabilities.extend(self.check_mx_security(host))
-        except dns.resolver.Timeout:
-            console.print(f"[yellow]Warning:[/yellow] DNS timeout while checking MX records. Try again later.")
         except Exception as e:
-            console.print(f"[yellow]Warning:[/yellow] MX record check failed: {str(e)}")
+            logger.warning(f"MX record check failed for {self.domain}: {str(e)}")
+        return vulnerabilities
+
+    @traced('check.mx_security')
+    def check_mx_security(self, host):
+        vulnerabilities, _ = mx_findings(self.context.smtp(host))
         return vulnerabilities
 
+    @traced('check.ssl_tls')
     def check_ssl_tls(self, host):
-        vulnerabilities = []
-        try:
-            context = ssl.create_default_context()
-            with socket.create_connection((host, 443)) as sock:
-                with context.wrap_socket(sock, server_hostname=host) as ssock:
-                    cert = ssock.getpeercert()
-                    # Check certificate expiration
-                    if datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z') < datetime.now():
-                        vulnerabilities.append(f"SSL certificate expired for {host}")
-                    # Check SSL version
-                    if ssock.version() < 'TLSv1.2':
-                        vulnerabilities.append(f"Weak SSL/TLS version detected: {ssock.version()}")
-        except Exception as e:
-            vulnerabilities.append(f"SSL/TLS check failed for {host}: {str(e)}")
+        vulnerabilities, _ = tls_findings(self.context.tls(host))
         return vulnerabilities
 
+    @traced('check.reverse_dns')
     def check_reverse_dns(self, host):
+        """A PTR of ``host`` should name the domain, or a known provider that the MX name does not contradict."""
         vulnerabilities = []
         try:
-            ip_address = socket.gethostbyname(host)
-            reverse_name = socket.gethostbyaddr(ip_address)[0]
-            if not reverse_name.endswith(self.domain):
-                vulnerabilities.append(f"Reverse DNS mismatch for {host}")
+            names = self.context.ptr_names(host)
         except Exception as e:
-            vulnerabilities.append(f"Reverse DNS check failed: {str(e)}")
+            vulnerabilities.append(Message("{check}.check-failed", f"Reverse DNS check failed: {str(e)}", error=str(e)))
+            return vulnerabilities
+        index = get_provider_index()
+        ptr_provider = index.match_ptr(names)
+        consistent = any(name == self.domain or name.endswith(f".{self.domain}") for name in names) or (
+            ptr_provider is not None and index.match_mx(host) in (None, ptr_provider)
+        )
+        if not consistent:
+            vulnerabilities.append(Message(
+                "{check}.reverse-dns-mismatch",
+                f"Reverse DNS mismatch for {host}",
+                host=host,
+                names=names
+            ))
         return vulnerabilities
 
+    @traced('check.email_headers')
     def check_email_headers(self):
         vulnerabilities = []
         headers = {
@@ -234,25 +563,26 @@ class SecurityAnalyzer:
             'MTA-STS': False,
             'TLS-RPT': False
         }
-        
-        try:
-            mta_sts = self.resolver.resolve(f"_mta-sts.{self.domain}", "TXT")
-            headers['MTA-STS'] = True
-        except dns.resolver.NXDOMAIN:
-            vulnerabilities.append("MTA-STS policy not configured (Recommended for enhanced security)")
-        except dns.resolver.Timeout:
-            console.print("[yellow]Warning:[/yellow] DNS timeout while checking MTA-STS. Try again later.")
-        except Exception as e:
-            console.print(f"[yellow]Warning:[/yellow] Unable to check MTA-STS: {str(e)}")
-        
-        try:
-            tls_rpt = self.resolver.resolve(f"_smtp._tls.{self.domain}", "TXT")
-            headers['TLS-RPT'] = True
-        except dns.resolver.NXDOMAIN:
-            vulnerabilities.append("TLS-RPT not configured")
-        except dns.resolver.Timeout:
-            console.print("[yellow]Warning:[/yellow] DNS timeout while checking TLS-RPT. Try again later.")
-        except Exception as e:
-            console.print(f"[yellow]Warning:[/yellow] Unable to check TLS-RPT: {str(e)}")
-        
-        return vulnerabilities, headers
\ No newline at end of file
+
+        for header, name, finding in (
+            ('MTA-STS', f"_mta-sts.{self.domain}",
+             Message("mta_sts.missing", "MTA-STS policy not configured (Recommended for enhanced security)")),
+            ('TLS-RPT', f"_smtp._tls.{self.domain}", Message("mta_sts.no-tls-rpt", "TLS-RPT not configured"))
+        ):
+            answer = self.context.lookup(name, "TXT")
+            if answer.status == 'NOERROR':
+                headers[header] = True
+            elif answer.status == 'NXDOMAIN':
+                vulnerabilities.append(finding)
+            elif answer.status == 'TIMEOUT':
+                logger.warning(f"DNS timeout while checking {header} of {self.domain}")
+            elif answer.status == 'ERROR':
+                logger.warning(f"Unable to check {header} of {self.domain}")
+
+        hosts = self.context.mx_hosts()
+        probes = [self.context.smtp(host) for host in hosts]
+        headers['STARTTLS'] = bool(hosts) and all(
+            probe.starttls and probe.tls_error is None for probe in probes
+        )
+
+        return vulnerabilities, headers
@@ -0,0 +1,157 @@
+"""Library entry points: audit domains in-process and get structured findings back
+
+    from dmarc_audit.api import audit_domain
+
+    result = audit_domain("example.com")
+    for finding in result.findings:
+        print(finding.code, finding.severity, finding.message)
+
+Nothing here writes to stdout; warnings go to the ``dmarc_audit`` logger,
+which has no handlers unless the caller configures logging.  Inside a
+running event loop use :func:`aaudit_domain` / :func:`aaudit_many`.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List
+from .config import DEFAULT_CONCURRENCY, DEFAULT_DKIM_SELECTOR
+
+SEVERITIES = {'vulnerabilities': 'ERROR', 'recommendations': 'WARNING'}
+
+@dataclass(frozen=True)
+class Finding:
+    """One audit result: ``severity`` is ``ERROR`` (vulnerability) or ``WARNING`` (recommendation)."""
+    check: str
+    code: str
+    severity: str
+    message: str
+    evidence: Dict[str, object] = field(default_factory=dict)
+
+    def to_dict(self):
+        return {'check': self.check, 'code': self.code, 'severity': self.severity,
+                'message': self.message, 'evidence': dict(self.evidence)}
+
+@dataclass
+class AuditResult:
+    """``providers`` lists the mail providers recognized per source: ``{'mx': [...], 'spf': [...], 'dkim': [...]}``."""
+    domain: str
+    findings: List[Finding]
+    providers: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def vulnerabilities(self):
+        return [f for f in self.findings if f.severity == 'ERROR']
+
+    @property
+    def recommendations(self):
+        return [f for f in self.findings if f.severity == 'WARNING']
+
+    def to_report(self):
+        """The ``{check: (vulns, recs)}`` mapping used by the writers and the CLI."""
+        report = {}
+        for finding in self.findings:
+            vulns, recs = report.setdefault(finding.check, ([], []))
+            (vulns if finding.severity == 'ERROR' else recs).append(finding.message)
+        return report
+
+    def to_dict(self):
+        return {'domain': self.domain, 'findings': [f.to_dict() for f in self.findings],
+                'providers': {source: list(ids) for source, ids in self.providers.items()}}
+
+def findings_from_report(report, records=None):
+    """Turn a ``{check: (vulns, recs)}`` report into :class:`Finding` objects.
+
+    Codes and evidence come from the :class:`~dmarc_audit.findings.Message`
+    each analyzer emits; a message that is only text (a report read back
+    from JSON) gets the code ``<check>.other``.  ``records`` optionally maps
+    a check to the DNS records it was computed from; they are attached to
+    each finding's evidence as ``records``.
+    """
+    findings = []
+    for check, (vulns, recs) in report.items():
+        for kind, messages in (('vulnerabilities', vulns), ('recommendations', recs)):
+            for message in messages:
+                code = getattr(message, 'code', '{check}.other').format(check=check)
+                evidence = dict(getattr(message, 'evidence', {}))
+                if records and records.get(check):
+                    evidence['records'] = records[check]
+                findings.append(Finding(check, code, SEVERITIES[kind], str(message), evidence))
+    return findings
+
+async def _check_records(context, domain, dkim_selector, dkim_selectors):
+    from .resolver import txt_value
+
+    # Already fetched by the audit, so these reads come from the context.
+    spf, dmarc, mta_sts, tls_rpt, mx = await asyncio.gather(
+        context.arecords(domain, "TXT"),
+        context.arecords(f"_dmarc.{domain}", "TXT"),
+        context.arecords(f"_mta-sts.{domain}", "TXT"),
+        context.arecords(f"_smtp._tls.{domain}", "TXT"),
+        context.amx_hosts()
+    )
+    # Evidence carries the record text, not the quoted TXT strings.
+    records = {
+        'spf': [r for r in map(txt_value, spf) if "v=spf1" in r.lower()],
+        'dmarc': [r for r in map(txt_value, dmarc) if "v=dmarc1" in r.lower()],
+        'mta_sts': [txt_value(r) for r in mta_sts + tls_rpt],
+        'mx': list(mx)
+    }
+    if not dkim_selectors:
+        dkim = await context.arecords(f"{dkim_selector}._domainkey.{domain}", "TXT")
+        records['dkim'] = [txt_value(r) for r in dkim]
+    return records
+
+def _auditor(dkim_selector, dkim_selectors, resolver, prober, cache):
+    from .async_analyzer import _analyzers
+    from .mta_sts import PolicyFetcher
+    from .providers import afetch_mx_ptr, classify_domain
+    from .resolver import CachingResolver, get_resolver
+    from .smtp import SMTPProber
+
+    if resolver is None:
+        resolver = CachingResolver(store=cache) if cache is not None else get_resolver()
+    if prober is None:
+        prober = SMTPProber(store=cache)
+    analyzer = _analyzers(dkim_selector, resolver, prober, dkim_selectors, PolicyFetcher(store=cache))
+
+    async def audit_one(domain):
+        audit = analyzer(domain)
+        report = await audit.check_all()
+        records = await _check_records(audit.context, domain, dkim_selector, dkim_selectors)
+        await afetch_mx_ptr(audit.context)
+        providers = classify_domain(audit.context, audit.spf_result).to_dict()
+        return AuditResult(domain, findings_from_report(report, records), providers)
+    return audit_one
+
+async def aaudit_many(domains, dkim_selector=DEFAULT_DKIM_SELECTOR, concurrency=DEFAULT_CONCURRENCY,
+                      dkim_selectors=None, resolver=None, prober=None, cache=None):
+    """Audit ``domains`` concurrently, yielding an :class:`AuditResult` per domain as it finishes.
+
+    ``resolver`` (a :class:`~dmarc_audit.resolver.CachingResolver`),
+    ``prober`` (an :class:`~dmarc_audit.smtp.SMTPProber`) and ``cache`` (a
+    :class:`~dmarc_audit.cache.PersistentCache`) default to the process-wide
+    ones; pass your own to isolate audits from each other.
+    """
+    from .async_analyzer import _pool
+
+    audit_one = _auditor(dkim_selector, dkim_selectors, resolver, prober, cache)
+    async for result in _pool(domains, concurrency, audit_one):
+        yield result
+
+async def aaudit_domain(domain, dkim_selector=DEFAULT_DKIM_SELECTOR, dkim_selectors=None,
+                        resolver=None, prober=None, cache=None):
+    """Audit one domain; see :func:`aaudit_many` for the arguments."""
+    return await _auditor(dkim_selector, dkim_selectors, resolver, prober, cache)(domain)
+
+def audit_domain(domain, dkim_selector=DEFAULT_DKIM_SELECTOR, dkim_selectors=None,
+                 resolver=None, prober=None, cache=None):
+    """Blocking :func:`aaudit_domain`; must not be called from a running event loop."""
+    return asyncio.run(aaudit_domain(domain, dkim_selector, dkim_selectors, resolver, prober, cache))
+
+def audit_many(domains, dkim_selector=DEFAULT_DKIM_SELECTOR, concurrency=DEFAULT_CONCURRENCY,
+               dkim_selectors=None, resolver=None, prober=None, cache=None):
+    """Blocking :func:`aaudit_many`; returns the results as a list in completion order."""
+    async def collect():
+        return [result async for result in aaudit_many(domains, dkim_selector, concurrency, dkim_selectors,
+                                                       resolver, prober, cache)]
+    return asyncio.run(collect())
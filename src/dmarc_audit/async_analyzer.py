@@ -1,29 +1,203 @@
 import asyncio
-import dns.asyncresolver
-from .config import DNS_TIMEOUT, DNS_SERVERS
+import time
+from collections import namedtuple
+from .config import DEFAULT_DKIM_SELECTOR, DEFAULT_CONCURRENCY, PROBE_CACHE_TTL
+from .analyzer import analyze_spf, analyze_dmarc, analyze_dkim, analyze_dkim_selectors, analyze_mta_sts, SPFEvaluator
+from .context import AuditContext
+from .findings import Message
+from .resolver import get_resolver
+from .mta_sts import PolicyFetcher
+from .portfolio import posture
+from .smtp import SMTPProber, mx_findings
+from .state import diff_reports
 from .logger import logger
+from .tracing import span
+
+CHECKS = ('spf', 'dmarc', 'dkim', 'mta_sts', 'mx')
 
 async def async_dns_lookup(domain, record_type):
-    resolver = dns.asyncresolver.Resolver()
-    resolver.timeout = DNS_TIMEOUT
-    resolver.nameservers = [DNS_SERVERS[server] for server in DNS_SERVERS]
-    
-    try:
-        answers = await resolver.resolve(domain, record_type)
-        return [str(rdata) for rdata in answers]
-    except Exception as e:
-        logger.error(f"Async DNS lookup error for {domain}: {str(e)}")
-        return []
+    return await get_resolver().aresolve(domain, record_type)
 
 class AsyncSecurityAnalyzer:
-    def __init__(self, domain):
+    def __init__(self, domain, dkim_selector=DEFAULT_DKIM_SELECTOR, spf_evaluator=None, context=None,
+                 dkim_selectors=None):
         self.domain = domain
+        self.dkim_selector = dkim_selector
+        self.dkim_selectors = dkim_selectors
+        self.context = context or AuditContext(domain, dkim_selector)
+        self.spf_evaluator = spf_evaluator or SPFEvaluator(self.context.resolver)
+        self.spf_result = None
+
+    async def check_spf(self):
+        records, evaluation = await asyncio.gather(
+            self.context.arecords(self.domain, "TXT"),
+            self.spf_evaluator.evaluate(self.domain)
+        )
+        self.spf_result = evaluation
+        return analyze_spf([r for r in records if "v=spf1" in r.lower()], evaluation)
+
+    async def check_dmarc(self):
+        records = await self.context.arecords(f"_dmarc.{self.domain}", "TXT")
+        return analyze_dmarc([r for r in records if "v=dmarc1" in r.lower()])
+
+    async def check_dkim(self):
+        if self.dkim_selectors:
+            return analyze_dkim_selectors(await self.context.adiscover_selectors(self.dkim_selectors))
+        records = await self.context.arecords(f"{self.dkim_selector}._domainkey.{self.domain}", "TXT")
+        return analyze_dkim(records)
+
+    async def check_mta_sts(self):
+        mta_sts, tls_rpt, hosts, policy = await asyncio.gather(
+            self.context.arecords(f"_mta-sts.{self.domain}", "TXT"),
+            self.context.arecords(f"_smtp._tls.{self.domain}", "TXT"),
+            self.context.amx_hosts(),
+            self.context.amta_sts_policy()
+        )
+        vulnerabilities, recommendations = analyze_mta_sts(mta_sts, policy, hosts)
+        if not tls_rpt:
+            recommendations.append(Message("mta_sts.no-tls-rpt",
+                                           "Enable TLS reporting (TLS-RPT) for monitoring mail transport security"))
+        return vulnerabilities, recommendations
+
+    async def check_mx_records(self):
+        vulnerabilities = []
+        recommendations = []
+        hosts = await self.context.amx_hosts()
+        if not hosts:
+            vulnerabilities.append(Message("mx.missing", "No MX records found"))
+            return vulnerabilities, recommendations
+        probes = await asyncio.gather(*(self.context.asmtp(host) for host in hosts))
+        for probe in probes:
+            mx_vulns, mx_recs = mx_findings(probe)
+            vulnerabilities.extend(mx_vulns)
+            recommendations.extend(mx_recs)
+        return vulnerabilities, recommendations
+
+    async def _run_check(self, check, coroutine):
+        with span(f"check.{check}", domain=self.domain):
+            return await coroutine
+
+    async def check_all(self, checks=CHECKS):
+        """Run ``checks`` (all of :data:`CHECKS` by default) concurrently and return ``{check: (vulns, recs)}``."""
+        methods = {
+            'spf': self.check_spf,
+            'dmarc': self.check_dmarc,
+            'dkim': self.check_dkim,
+            'mta_sts': self.check_mta_sts,
+            'mx': self.check_mx_records
+        }
+        with span('audit', domain=self.domain):
+            # Only the MX and MTA-STS checks need the SMTP probes and policy fetch.
+            await self.context.aprefetch(probe=not {'mta_sts', 'mx'}.isdisjoint(checks))
+            results = await asyncio.gather(
+                *(self._run_check(check, methods[check]()) for check in checks),
+                return_exceptions=True
+            )
+        self.context.log_operations()
+        report = {}
+        for check, result in zip(checks, results):
+            if isinstance(result, Exception):
+                result = ([Message("{check}.check-failed", f"{check.upper()} check failed: {str(result)}",
+                                   error=str(result))], [])
+            report[check] = result
+        return report
+
+async def _pool(domains, concurrency, audit_one):
+    """Run ``audit_one(domain)`` over ``domains`` with ``concurrency`` workers, yielding results."""
+    domains = iter(domains)
+    results = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        try:
+            for domain in domains:
+                await results.put(await audit_one(domain))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Bulk audit worker failed: {str(e)}")
+        await results.put(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    try:
+        remaining = len(workers)
+        while remaining:
+            item = await results.get()
+            if item is None:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def _analyzers(dkim_selector, resolver, prober, dkim_selectors, policy_fetcher=None):
+    # One evaluator per batch so shared SPF includes are expanded once, one
+    # prober, so MX hosts shared by many domains are probed once, and one
+    # policy fetcher bounding concurrent MTA-STS requests.
+    resolver = resolver or get_resolver()
+    spf_evaluator = SPFEvaluator(resolver)
+    prober = prober or SMTPProber()
+    policy_fetcher = policy_fetcher or PolicyFetcher()
+
+    def analyzer(domain):
+        context = AuditContext(domain, dkim_selector, resolver, prober, policy_fetcher)
+        return AsyncSecurityAnalyzer(domain, dkim_selector, spf_evaluator, context, dkim_selectors)
+    return analyzer
+
+async def audit_domains(domains, dkim_selector=DEFAULT_DKIM_SELECTOR, concurrency=DEFAULT_CONCURRENCY,
+                        resolver=None, prober=None, dkim_selectors=None, policy_fetcher=None, portfolio=None):
+    """Audit ``domains`` with at most ``concurrency`` domains in flight.
+
+    Yields ``(domain, report)`` pairs in completion order so callers can
+    stream results while slower domains are still being checked.  The input
+    iterable is consumed lazily, so arbitrarily long lists are fine.  With
+    ``dkim_selectors`` every domain is probed for all of those selectors
+    instead of ``dkim_selector`` alone.  The :class:`~dmarc_audit.portfolio.Posture`
+    of every domain is added to ``portfolio`` when one is given.
+    """
+    analyzer = _analyzers(dkim_selector, resolver, prober, dkim_selectors, policy_fetcher)
+
+    async def audit_one(domain):
+        audit = analyzer(domain)
+        report = await audit.check_all()
+        if portfolio is not None:
+            portfolio.add(posture(audit.context, report, audit.spf_result))
+        return domain, report
+
+    async for item in _pool(domains, concurrency, audit_one):
+        yield item
+
+ReauditResult = namedtuple('ReauditResult', ['domain', 'report', 'diff', 'reused'])
+
+async def reaudit_domains(domains, state, dkim_selector=DEFAULT_DKIM_SELECTOR, concurrency=DEFAULT_CONCURRENCY,
+                          resolver=None, prober=None, dkim_selectors=None, probe_ttl=PROBE_CACHE_TTL,
+                          policy_fetcher=None):
+    """Incremental :func:`audit_domains` against a :class:`~dmarc_audit.state.StateStore`.
+
+    Only the DNS records are fetched for every domain.  When their hash
+    matches the stored one and the stored probes are younger than
+    ``probe_ttl`` seconds, the stored report is reused and analysis and
+    SMTP probes are skipped.  Yields :class:`ReauditResult` tuples whose
+    ``diff`` lists new and resolved findings (see :func:`diff_reports`).
+    """
+    analyzer = _analyzers(dkim_selector, resolver, prober, dkim_selectors, policy_fetcher)
+
+    async def audit_one(domain):
+        audit = analyzer(domain)
+        await audit.context.aprefetch(probe=False)
+        if dkim_selectors:
+            await audit.context.adiscover_selectors(dkim_selectors)
+        record_hash = audit.context.record_hash()
+        previous = state.get(domain)
+        now = time.time()
+        if (previous is not None and record_hash is not None and previous.record_hash == record_hash
+                and now - previous.probed_at < probe_ttl):
+            return ReauditResult(domain, previous.report, diff_reports(previous.report, previous.report), True)
+        report = await audit.check_all()
+        if record_hash is not None:
+            state.put(domain, record_hash, report, now)
+        return ReauditResult(domain, report, diff_reports(previous.report if previous else {}, report), False)
 
-    async def check_all(self):
-        tasks = [
-            self.check_spf(),
-            self.check_dmarc(),
-            self.check_dkim(),
-            self.check_mx_records()
-        ]
-        return await asyncio.gather(*tasks) 
\ No newline at end of file
+    async for item in _pool(domains, concurrency, audit_one):
+        yield item
@@ -0,0 +1,127 @@
+"""Persistent on-disk cache for DNS answers and SMTP probe results"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from .config import CACHE_BUSY_TIMEOUT, CACHE_FILE_NAME, CACHE_COMMIT_INTERVAL, PROBE_CACHE_TTL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT NOT NULL,
+    rrtype TEXT NOT NULL,
+    status TEXT NOT NULL,
+    value TEXT NOT NULL,
+    ttl INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (name, rrtype)
+)
+"""
+
+class PersistentCache:
+    """SQLite-backed cache keyed by (name, rrtype).
+
+    Each row keeps the value, its TTL and the time it was fetched.  An entry
+    is fresh while its age is below ``max_age`` when one is given (so daily
+    re-runs can reuse records whose TTL is much shorter than a day), and
+    below its own TTL otherwise.
+
+    Writes are buffered in memory and each batch is written in one short
+    transaction, so several processes (``--workers``) can share the file:
+    the write lock is never held between batches, and a writer waits up to
+    ``CACHE_BUSY_TIMEOUT`` seconds for another one's batch.
+    """
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout={int(CACHE_BUSY_TIMEOUT * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def _remaining(self, ttl, fetched_at, now):
+        limit = self.max_age if self.max_age is not None else ttl
+        return limit - (now - fetched_at)
+
+    def get(self, name, rrtype):
+        """Return ``(status, value, remaining_ttl)`` for a fresh entry, else ``None``."""
+        with self._lock:
+            row = self._pending.get((name, rrtype))
+            if row is not None:
+                row = row[2:]
+            else:
+                row = self._conn.execute(
+                    "SELECT status, value, ttl, fetched_at FROM entries WHERE name = ? AND rrtype = ?",
+                    (name, rrtype)
+                ).fetchone()
+            remaining = None if row is None else self._remaining(row[2], row[3], time.time())
+            if remaining is None or remaining <= 0:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0], json.loads(row[1]), int(remaining)
+
+    def put(self, name, rrtype, status, value, ttl):
+        with self._lock:
+            self._pending[(name, rrtype)] = (name, rrtype, status, json.dumps(value), int(ttl), time.time())
+            if len(self._pending) >= CACHE_COMMIT_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        # One transaction per batch; the caller holds the lock.
+        if self._pending:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (name, rrtype, status, value, ttl, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    self._pending.values()
+                )
+            self._pending.clear()
+
+    def get_probe(self, host, probe):
+        entry = self.get(host, probe)
+        return None if entry is None else entry[1]
+
+    def put_probe(self, host, probe, result, ttl=PROBE_CACHE_TTL):
+        self.put(host, probe, 'OK', result, ttl)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_cache = None
+
+def open_cache(cache_dir, max_age=None):
+    """Open (and make current) the persistent cache stored in ``cache_dir``."""
+    global _cache
+    os.makedirs(cache_dir, exist_ok=True)
+    _cache = PersistentCache(os.path.join(cache_dir, CACHE_FILE_NAME), max_age=max_age)
+    return _cache
+
+def get_cache():
+    """Return the current persistent cache, or ``None`` when caching is disabled."""
+    return _cache
+
+def close_cache():
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
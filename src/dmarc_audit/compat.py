@@ -0,0 +1,44 @@
+"""Fallbacks for Python versions that lack a public API; the only place CPython internals are touched
+
+Each function checks the running version and uses the public API where it
+exists.  The private fallbacks are only taken on the versions named below
+and degrade, rather than fail, when those internals change.
+"""
+
+import asyncio
+import platform
+import sys
+from .logger import logger
+
+CPYTHON = platform.python_implementation() == 'CPython'
+
+async def start_tls(writer, context, host):
+    """Upgrade an open stream pair to TLS in place."""
+    if sys.version_info >= (3, 11):
+        await writer.start_tls(context, server_hostname=host)
+        return
+    # Python < 3.11: loop.start_tls is public, but the stream pair only
+    # writes through the new transport once its private _transport is set.
+    loop = asyncio.get_running_loop()
+    transport = await loop.start_tls(
+        writer.transport, writer.transport.get_protocol(), context, server_hostname=host
+    )
+    writer._transport = transport
+
+def unverified_chain(ssl_object):
+    """The DER certificates the peer sent, leaf first, or ``None`` when this Python cannot read them.
+
+    ``get_unverified_chain`` is public from Python 3.13.  On CPython 3.10 -
+    3.12 it only exists on the private ``_sslobj``, whose certificates are
+    encoded with the private ``_ssl.ENCODING_DER``.
+    """
+    if sys.version_info >= (3, 13):
+        return [bytes(cert) for cert in ssl_object.get_unverified_chain() or ()]
+    if not CPYTHON or sys.version_info < (3, 10):
+        return None
+    try:
+        from _ssl import ENCODING_DER
+        return [cert.public_bytes(ENCODING_DER) for cert in ssl_object._sslobj.get_unverified_chain() or ()]
+    except Exception as e:
+        logger.debug(f"Certificate chain unavailable: {str(e)}")
+        return None
@@ -8,18 +8,57 @@ DNS_SERVERS = {
     'cloudflare_secondary': '1.0.0.1'
 }
 
-DNS_TIMEOUT = 30
-DNS_LIFETIME = 30
+DNS_PORT = 53
+DNS_TIMEOUT = 2.0
+DNS_LIFETIME = 10.0
+# Seconds to wait on one upstream before also asking the next (0 disables hedging)
+DNS_HEDGE_DELAY = 0.2
+# Upstream health: EWMA weight of the latest latency sample, consecutive
+# failures before an upstream is demoted, and how long the demotion lasts
+DNS_HEALTH_ALPHA = 0.2
+DNS_MAX_FAILURES = 3
+DNS_DEMOTE_SECONDS = 30
+
+# DNS Cache Settings (seconds / entries)
+DNS_CACHE_SIZE = 100000
+DNS_CACHE_MIN_TTL = 5
+DNS_CACHE_MAX_TTL = 86400
+DNS_NEGATIVE_TTL = 300
+
+# Persistent Cache Settings
+CACHE_FILE_NAME = 'dmarc_audit_cache.sqlite3'
+CACHE_COMMIT_INTERVAL = 500
+# Seconds a write waits for another process (e.g. a --workers sibling) to finish its batch
+CACHE_BUSY_TIMEOUT = 30
+PROBE_CACHE_TTL = 86400
 
 # Report Settings
-REPORT_FORMATS = ['text', 'json', 'csv']
+REPORT_FORMATS = ['text', 'json', 'csv', 'columnar']
+WRITER_FLUSH_INTERVAL = 1000
+COLUMNAR_ROW_GROUP_SIZE = 50000
 DEFAULT_REPORT_FORMAT = 'text'
 DEFAULT_DKIM_SELECTOR = 'selector1'
+COMMON_DKIM_SELECTORS = [
+    'default', 'dkim', 'google', 'selector1', 'selector2', 'k1', 'k2', 'k3',
+    's1', 's2', 'mail', 'smtp', 'mandrill', 'mxvault', 'everlytickey1', 'everlytickey2',
+    'mailjet', 'pm', 'protonmail', 'protonmail2', 'protonmail3', 'fm1', 'fm2', 'fm3',
+    'zendesk1', 'zendesk2', 'sig1', 'key1', 'amazonses', 'cm', 'mta', 'dk'
+]
+
+# Tracing Settings
+TRACE_SAMPLE_SIZE = 1000
+
+# Record Parser Settings
+RECORD_PARSE_CACHE_SIZE = 65536
+DKIM_KEY_CACHE_SIZE = 65536
 
 # Security Settings
 MINIMUM_TLS_VERSION = 'TLSv1.2'
 MAX_FORENSIC_URIS = 2
 MAX_SPF_INCLUDES = 10
+MAX_SPF_VOID_LOOKUPS = 2
+MIN_RSA_KEY_BITS = 2048
+RECOMMENDED_RSA_KEY_BITS = 4096
 
 # Output Settings
 SEVERITY_COLORS = {
@@ -52,4 +91,179 @@ EMAIL_PORTS = {
 # Feature Flags
 ENABLE_DETAILED_REPORTING = True
 ENABLE_SSL_VERIFICATION = True
-ENABLE_MTA_STS_CHECK = True 
\ No newline at end of file
+ENABLE_MTA_STS_CHECK = True
+
+# Rate Limiting Settings
+# Starting (requests per second, burst) of the token bucket kept per DNS
+# upstream, per destination host, per network and per mail provider.  Rates
+# adapt between RATE_LIMIT_MIN_FACTOR and RATE_LIMIT_MAX_FACTOR times these.
+RATE_LIMITS = {
+    'resolver': (1000, 200),
+    'host': (5, 5),
+    'network': (20, 20),
+    'provider': (50, 50)
+}
+RATE_LIMIT_MIN_FACTOR = 0.05
+RATE_LIMIT_MAX_FACTOR = 8
+# Additive increase per success (fraction of the starting rate) and
+# multiplicative decrease per throttling signal
+RATE_LIMIT_INCREASE = 0.001
+RATE_LIMIT_DECREASE = 0.5
+# Exponential backoff after throttling signals (seconds, jittered)
+RATE_LIMIT_BACKOFF = 1.0
+RATE_LIMIT_MAX_BACKOFF = 60.0
+# Times throttled work is deferred and retried before it is reported
+RATE_LIMIT_MAX_RETRIES = 2
+RATE_LIMIT_MAX_KEYS = 100000
+# Destinations sharing this prefix count as one network
+RATE_LIMIT_IPV4_PREFIX = 24
+RATE_LIMIT_IPV6_PREFIX = 48
+
+# TLS Inspection Settings
+TLS_PORT = 443
+TLS_CONNECT_TIMEOUT = 5
+TLS_HANDSHAKE_TIMEOUT = 5
+TLS_MAX_CONCURRENCY = 100
+# Certificates expiring sooner than this many days are reported
+TLS_EXPIRY_WARNING_DAYS = 30
+TLS_CERT_CACHE_SIZE = 65536
+
+# Watch (Daemon) Mode Settings
+# A domain is re-checked when the shortest TTL of its records runs out, but
+# no sooner than DAEMON_MIN_INTERVAL and no later than DAEMON_MAX_INTERVAL
+# seconds; each interval is stretched by up to DAEMON_JITTER so domains
+# drift apart instead of coming due together
+DAEMON_MIN_INTERVAL = 60
+DAEMON_MAX_INTERVAL = 3600
+DAEMON_JITTER = 0.1
+# Checks whose records are unchanged still re-run this often (SPF includes,
+# SMTP probes and MTA-STS policies can change behind an unchanged record)
+DAEMON_REFRESH_INTERVAL = 86400
+DAEMON_CONCURRENCY = 50
+# Address of the HTTP endpoint serving /metrics, /domains and /healthz
+DAEMON_LISTEN = '127.0.0.1:9425'
+DAEMON_MAX_REQUEST_SIZE = 8192
+
+# Aggregate (RUA) Report Settings
+# Bytes read from a report per parser feed
+RUA_READ_SIZE = 65536
+# Failing sources reported individually per domain
+RUA_MAX_SOURCES = 10
+# p=none domains whose reports show at least this pass rate over at least
+# this many messages are told to enforce
+RUA_MIN_MESSAGES = 100
+RUA_ENFORCE_PASS_RATE = 0.98
+
+# Mail Provider Index
+# Known mail providers, matched by MX hostname suffix, SPF include target
+# suffix, DKIM selector or DKIM key fingerprint (SHA-256 of the decoded
+# key).  ptr lists the suffixes of the reverse DNS names of the
+# provider's mail servers, which identify MX hosts under the domain's own
+# name (an mx.example.com pointing at Google).  shared_mx lists the
+# suffixes of MX fleets that serve every tenant's own MX name (e.g.
+# contoso-com.mail.protection.outlook.com) from the same servers, so one
+# STARTTLS probe per fleet stands for all of them; providers whose tenants
+# all use the same few hostnames need none, as each host is probed once
+# anyway.  shared_spf lists include targets that authorize the provider's
+# whole shared sending pool rather than a customer-specific subset.
+PROVIDERS = {
+    'google': {
+        'name': 'Google Workspace',
+        'mx': ('google.com', 'googlemail.com'),
+        'ptr': ('1e100.net',),
+        'spf': ('_spf.google.com', 'googlemail.com'),
+        'dkim_selectors': ('google',),
+        'shared_mx': ('aspmx.l.google.com', 'googlemail.com')
+    },
+    'microsoft': {
+        'name': 'Microsoft 365',
+        'mx': ('mail.protection.outlook.com', 'mail.protection.outlook.de', 'olc.protection.outlook.com'),
+        'ptr': ('protection.outlook.com', 'protection.outlook.de'),
+        'spf': ('spf.protection.outlook.com',),
+        'shared_mx': ('mail.protection.outlook.com', 'mail.protection.outlook.de')
+    },
+    'sendgrid': {
+        'name': 'SendGrid',
+        'mx': ('sendgrid.net',),
+        'spf': ('sendgrid.net',),
+        'dkim_selectors': ('s1', 's2', 'smtpapi'),
+        'shared_spf': ('sendgrid.net',)
+    },
+    'mailgun': {
+        'name': 'Mailgun',
+        'mx': ('mailgun.org',),
+        'spf': ('mailgun.org',),
+        'dkim_selectors': ('mailo', 'mg', 'krs'),
+        'shared_spf': ('mailgun.org',)
+    },
+    'amazonses': {
+        'name': 'Amazon SES',
+        'spf': ('amazonses.com',)
+    },
+    'mailchimp': {
+        'name': 'Mailchimp',
+        'spf': ('servers.mcsv.net', 'spf.mandrillapp.com'),
+        'dkim_selectors': ('k1', 'k2', 'k3', 'mandrill')
+    },
+    'proofpoint': {
+        'name': 'Proofpoint',
+        'mx': ('pphosted.com', 'ppe-hosted.com'),
+        'ptr': ('pphosted.com', 'ppe-hosted.com'),
+        'spf': ('pphosted.com', 'ppe-hosted.com'),
+        'shared_mx': ('pphosted.com', 'ppe-hosted.com')
+    },
+    'mimecast': {
+        'name': 'Mimecast',
+        'mx': ('mimecast.com', 'mimecast.co.za'),
+        'ptr': ('mimecast.com', 'mimecast.co.za'),
+        'spf': ('mimecast.com', 'mimecast.org')
+    },
+    'zoho': {
+        'name': 'Zoho Mail',
+        'mx': ('zoho.com', 'zoho.eu', 'zoho.in'),
+        'ptr': ('zoho.com', 'zoho.eu', 'zoho.in'),
+        'spf': ('zoho.com', 'zoho.eu', 'zoho.in'),
+        'dkim_selectors': ('zmail', 'zoho')
+    },
+    'fastmail': {
+        'name': 'Fastmail',
+        'mx': ('messagingengine.com',),
+        'ptr': ('messagingengine.com',),
+        'spf': ('spf.messagingengine.com',),
+        'dkim_selectors': ('fm1', 'fm2', 'fm3')
+    }
+}
+
+# Portfolio Summary Settings
+# Percentiles reported for every numeric posture field (nearest rank)
+PORTFOLIO_PERCENTILES = (50, 90, 99)
+# Numeric fields whose full value distribution is included in the summary
+PORTFOLIO_DISTRIBUTIONS = ('dmarc_pct', 'spf_lookups', 'dkim_bits')
+# Mail providers broken down individually; the rest are summed as "other"
+PORTFOLIO_TOP_PROVIDERS = 15
+
+# MTA-STS Settings (RFC 8461)
+MTA_STS_PORT = 443
+MTA_STS_TIMEOUT = 10
+MTA_STS_MAX_CONCURRENCY = 100
+# Policy files larger than this are rejected
+MTA_STS_MAX_POLICY_SIZE = 65536
+# Largest max_age the RFC allows (one year) and the shortest we consider sensible (one day)
+MTA_STS_MAX_AGE_LIMIT = 31557600
+MTA_STS_MIN_MAX_AGE = 86400
+
+# Bulk Audit Settings
+DEFAULT_CONCURRENCY = 100
+SMTP_TIMEOUT = 5
+SMTP_HELO_NAME = 'dmarc-audit.local'
+SMTP_MAX_CONCURRENCY = 200
+SMTP_PER_HOST_CONCURRENCY = 2
+# Results buffered between audit worker processes and the writer
+RESULT_QUEUE_SIZE = 10000
+CONTEXT_PREFETCH_WORKERS = 8
+
+# Progress Journal Settings
+# Journaled results are fsynced every this many records or seconds, whichever comes first;
+# a crash loses at most that much work, which --resume audits again
+JOURNAL_SYNC_RECORDS = 1000
+JOURNAL_SYNC_INTERVAL = 1.0
@@ -0,0 +1,266 @@
+"""Per-domain audit context: every network fact an audit needs, fetched once"""
+
+import asyncio
+import hashlib
+import ipaddress
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .config import DEFAULT_DKIM_SELECTOR, CONTEXT_PREFETCH_WORKERS
+from .mta_sts import PolicyFetcher
+from .records import parse_mta_sts
+from .resolver import CACHEABLE_STATUSES, get_resolver, mx_hosts, txt_value
+from .smtp import SMTPProber
+from .tls import TLSInspector
+from .logger import logger
+from .tracing import traced
+
+def _dns_key(name, record_type):
+    return ('dns', name.lower().rstrip('.'), record_type.upper())
+
+def _records(answers):
+    return [record for answer in answers for record in answer.records]
+
+def _ptr_name(address):
+    return ipaddress.ip_address(address).reverse_pointer
+
+def _names(answers):
+    return sorted({name.lower().rstrip('.') for name in _records(answers)})
+
+def _policy_id(records):
+    # RFC 8461 3.1: anything but exactly one STSv1 record means no policy.
+    records = [value for value in map(txt_value, records) if value.lower().startswith('v=stsv1')]
+    return parse_mta_sts(records[0]).id if len(records) == 1 else None
+
+class AuditContext:
+    """Memoizes the DNS answers and SMTP probe results of one domain's audit.
+
+    Every analyzer reads its inputs through the context, so a TXT name, the
+    MX set or an MX host's EHLO reply is fetched at most once per audit no
+    matter how many checks look at it.  ``operations`` counts the fetches
+    that actually went out (per kind), for debugging.  Pass a shared
+    ``prober`` to also dedup MX probes across domains, a shared
+    ``policy_fetcher`` to share MTA-STS policy caching and limits, and a
+    shared ``tls_inspector`` to dedup HTTPS handshakes and certificates.
+    """
+
+    def __init__(self, domain, dkim_selector=DEFAULT_DKIM_SELECTOR, resolver=None, prober=None,
+                 policy_fetcher=None, tls_inspector=None):
+        self.domain = domain
+        self.dkim_selector = dkim_selector
+        self.resolver = resolver or get_resolver()
+        self.prober = prober or SMTPProber()
+        self.policy_fetcher = policy_fetcher or PolicyFetcher()
+        self._tls_inspector = tls_inspector
+        self.operations = Counter()
+        self._facts = {}
+        self._pending = {}
+
+    @property
+    def tls_inspector(self):
+        # Created on first use: most audits never inspect a host directly.
+        if self._tls_inspector is None:
+            self._tls_inspector = TLSInspector()
+        return self._tls_inspector
+
+    @property
+    def network_ops(self):
+        return sum(self.operations.values())
+
+    def plan(self):
+        """The DNS facts every audit of this domain reads."""
+        return [
+            (self.domain, 'TXT'),
+            (f"_dmarc.{self.domain}", 'TXT'),
+            (f"{self.dkim_selector}._domainkey.{self.domain}", 'TXT'),
+            (f"_mta-sts.{self.domain}", 'TXT'),
+            (f"_smtp._tls.{self.domain}", 'TXT'),
+            (self.domain, 'MX'),
+        ]
+
+    # Synchronous accessors
+
+    def _fact(self, key, fetch):
+        if key not in self._facts:
+            self.operations[key[0]] += 1
+            self._facts[key] = fetch()
+        return self._facts[key]
+
+    def lookup(self, name, record_type):
+        key = _dns_key(name, record_type)
+        return self._fact(key, lambda: self.resolver.lookup(name, record_type))
+
+    def records(self, name, record_type):
+        return list(self.lookup(name, record_type).records)
+
+    def mx_hosts(self):
+        return mx_hosts(self.lookup(self.domain, 'MX').records)
+
+    def smtp(self, host):
+        """Return the :class:`~dmarc_audit.smtp.ProbeResult` of ``host``."""
+        return self._fact(('smtp', host), lambda: asyncio.run(self.prober.probe(host)))
+
+    def ptr_names(self, host):
+        """Synchronous :meth:`aptr_names`."""
+        def fetch():
+            addresses = _records(self.resolver.lookup(host, record_type) for record_type in ('A', 'AAAA'))
+            return _names(self.resolver.lookup(_ptr_name(address), 'PTR') for address in addresses)
+        return self._fact(('ptr', host), fetch)
+
+    def tls(self, host, port=None):
+        """Synchronous :meth:`atls`."""
+        return self._fact(('tls', host, port), lambda: asyncio.run(self.tls_inspector.inspect(host, port)))
+
+    def mta_sts_policy(self):
+        """Synchronous :meth:`amta_sts_policy`."""
+        policy_id = _policy_id(self.records(f"_mta-sts.{self.domain}", "TXT"))
+        if policy_id is None:
+            return None
+        return self._fact(('mta-sts', self.domain),
+                          lambda: asyncio.run(self.policy_fetcher.fetch(self.domain, policy_id)))
+
+    def discover_selectors(self, selectors):
+        """Synchronous :meth:`adiscover_selectors`."""
+        return asyncio.run(self.adiscover_selectors(selectors))
+
+    @traced('prefetch')
+    def prefetch(self):
+        """Fetch the whole plan concurrently, then probe every MX host at once."""
+        plan = [key for key in self.plan() if _dns_key(*key) not in self._facts]
+        with ThreadPoolExecutor(max_workers=CONTEXT_PREFETCH_WORKERS) as pool:
+            for key, answer in zip(plan, pool.map(lambda k: self.resolver.lookup(*k), plan)):
+                self._facts[_dns_key(*key)] = answer
+                self.operations['dns'] += 1
+        hosts = [host for host in self.mx_hosts() if ('smtp', host) not in self._facts]
+        if hosts:
+            results = asyncio.run(self.prober.probe_all(hosts))
+            for host in hosts:
+                self._facts[('smtp', host)] = results[host]
+                self.operations['smtp'] += 1
+        self.mta_sts_policy()
+        return self
+
+    # Asynchronous accessors
+
+    async def _afact(self, key, fetch):
+        if key in self._facts:
+            return self._facts[key]
+        task = self._pending.get(key)
+        if task is None:
+            self.operations[key[0]] += 1
+            task = asyncio.ensure_future(fetch())
+            self._pending[key] = task
+        result = await asyncio.shield(task)
+        self._facts[key] = result
+        self._pending.pop(key, None)
+        return result
+
+    async def alookup(self, name, record_type):
+        key = _dns_key(name, record_type)
+        return await self._afact(key, lambda: self.resolver.alookup(name, record_type))
+
+    async def arecords(self, name, record_type):
+        return list((await self.alookup(name, record_type)).records)
+
+    async def amx_hosts(self):
+        return mx_hosts((await self.alookup(self.domain, 'MX')).records)
+
+    async def asmtp(self, host):
+        return await self._afact(('smtp', host), lambda: self.prober.probe(host))
+
+    async def aptr_names(self, host):
+        """The reverse DNS names of every address of ``host``, lowercased, without the trailing dot.
+
+        Looked up through the shared resolver, so hosts that many domains
+        share (a provider's MX fleet) are resolved once per batch.
+        """
+        async def fetch():
+            addresses = _records(
+                await asyncio.gather(*(self.resolver.alookup(host, record_type) for record_type in ('A', 'AAAA')))
+            )
+            return _names(
+                await asyncio.gather(*(self.resolver.alookup(_ptr_name(address), 'PTR') for address in addresses))
+            )
+        return await self._afact(('ptr', host), fetch)
+
+    async def atls(self, host, port=None):
+        """The :class:`~dmarc_audit.tls.TLSResult` of ``host:port`` (the inspector's port by default)."""
+        return await self._afact(('tls', host, port), lambda: self.tls_inspector.inspect(host, port))
+
+    async def amta_sts_policy(self):
+        """The :class:`~dmarc_audit.mta_sts.PolicyResult` for the published MTA-STS id, or ``None``."""
+        policy_id = _policy_id(await self.arecords(f"_mta-sts.{self.domain}", "TXT"))
+        if policy_id is None:
+            return None
+        return await self._afact(('mta-sts', self.domain),
+                                 lambda: self.policy_fetcher.fetch(self.domain, policy_id))
+
+    @traced('dkim.discover')
+    async def adiscover_selectors(self, selectors):
+        """Return ``{selector: records}`` for every selector publishing a DKIM record.
+
+        ``_domainkey.<domain>`` is looked up first: an NXDOMAIN there means no
+        selector can exist below it (RFC 8020), so the guesses are skipped.
+        Otherwise all selectors are queried at once.
+        """
+        parent = await self.alookup(f"_domainkey.{self.domain}", 'TXT')
+        if parent.status == 'NXDOMAIN':
+            return {}
+        selectors = list(dict.fromkeys(selectors))
+        answers = await asyncio.gather(
+            *(self.alookup(f"{selector}._domainkey.{self.domain}", 'TXT') for selector in selectors)
+        )
+        return {selector: list(answer.records) for selector, answer in zip(selectors, answers) if answer.records}
+
+    @traced('prefetch')
+    async def aprefetch(self, probe=True):
+        """Fetch the DNS plan concurrently, then (with ``probe``) every MX host and the MTA-STS policy."""
+        await asyncio.gather(*(self.alookup(*key) for key in self.plan()))
+        if probe:
+            await asyncio.gather(*(self.asmtp(host) for host in await self.amx_hosts()), self.amta_sts_policy())
+        return self
+
+    def fetched_answer(self, name, record_type):
+        """The memoized answer of ``name``/``record_type``, or ``None`` if it was never fetched."""
+        return self._facts.get(_dns_key(name, record_type))
+
+    def fetched_ptr_names(self, host):
+        """The memoized :meth:`aptr_names` of ``host``, or ``None`` if they were never looked up."""
+        return self._facts.get(('ptr', host))
+
+    def fetched_policy(self):
+        """The memoized MTA-STS :class:`~dmarc_audit.mta_sts.PolicyResult`, or ``None``."""
+        return self._facts.get(('mta-sts', self.domain))
+
+    def dns_keys(self):
+        """``(name, type)`` of every DNS answer fetched so far."""
+        return [key[1:] for key in self._facts if key[0] == 'dns']
+
+    def record_hash(self, keys=None):
+        """SHA-256 over every DNS answer fetched so far, or ``None`` if any failed.
+
+        Two audits with the same hash saw identical SPF, DMARC, DKIM, MX,
+        MTA-STS and TLS-RPT records.  ``keys`` limits the hash to those
+        ``(name, type)`` answers (``None`` as well if one was not fetched).
+        """
+        if keys is None:
+            keys = [key for key in self._facts if key[0] == 'dns']
+        else:
+            keys = [_dns_key(*key) for key in keys]
+            if any(key not in self._facts for key in keys):
+                return None
+        digest = hashlib.sha256()
+        for key in sorted(keys):
+            answer = self._facts[key]
+            if answer.status in ('TIMEOUT', 'ERROR'):
+                return None
+            digest.update(repr((key[1:], answer.status, sorted(answer.records))).encode())
+        return digest.hexdigest()
+
+    def min_ttl(self):
+        """Smallest TTL among the authoritative DNS answers fetched so far, or ``None``."""
+        ttls = [answer.ttl for key, answer in self._facts.items()
+                if key[0] == 'dns' and answer.status in CACHEABLE_STATUSES]
+        return min(ttls, default=None)
+
+    def log_operations(self):
+        logger.debug(f"{self.domain}: {self.network_ops} network operations ({dict(self.operations)})")
@@ -0,0 +1,358 @@
+"""Watch mode: keep a domain inventory and re-audit each domain as its DNS records expire"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from .analyzer import SPFEvaluator
+from .async_analyzer import CHECKS, AsyncSecurityAnalyzer
+from .config import (
+    DEFAULT_DKIM_SELECTOR,
+    DAEMON_MIN_INTERVAL,
+    DAEMON_MAX_INTERVAL,
+    DAEMON_JITTER,
+    DAEMON_REFRESH_INTERVAL,
+    DAEMON_CONCURRENCY,
+    DAEMON_MAX_REQUEST_SIZE
+)
+from .context import AuditContext
+from .mta_sts import PolicyFetcher
+from .resolver import get_resolver
+from .smtp import SMTPProber
+from .state import diff_reports
+from .logger import logger
+
+def check_inputs(domain, dkim_selector=DEFAULT_DKIM_SELECTOR):
+    """The DNS ``(name, type)`` answers each check's findings are computed from."""
+    return {
+        'spf': [(domain, 'TXT')],
+        'dmarc': [(f"_dmarc.{domain}", 'TXT')],
+        'dkim': [(f"{dkim_selector}._domainkey.{domain}", 'TXT')],
+        'mta_sts': [(f"_mta-sts.{domain}", 'TXT'), (f"_smtp._tls.{domain}", 'TXT'), (domain, 'MX')],
+        'mx': [(domain, 'MX')]
+    }
+
+class WatchedDomain:
+    """One domain of the inventory: its current report and when each check last ran."""
+
+    __slots__ = ('domain', 'report', 'fingerprints', 'refreshed', 'due', 'checked_at', 'audits', 'changes', 'error')
+
+    def __init__(self, domain, report=None):
+        self.domain = domain
+        self.report = report or {}
+        # check -> hash of the answers it last ran on / when it last ran
+        self.fingerprints = {}
+        self.refreshed = {}
+        self.due = None
+        self.checked_at = None
+        self.audits = 0
+        self.changes = 0
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'domain': self.domain,
+            'checked_at': self.checked_at,
+            'due': self.due,
+            'audits': self.audits,
+            'changes': self.changes,
+            'error': self.error,
+            'vulnerabilities': sum(len(vulns) for vulns, _ in self.report.values()),
+            'recommendations': sum(len(recs) for _, recs in self.report.values())
+        }
+
+class Watcher:
+    """Re-audit an inventory of domains, each one when the TTLs of its records run out.
+
+    Domains wait in a heap ordered by due time.  When one comes due only its
+    DNS records are fetched; a check runs again when the answers it reads
+    (:func:`check_inputs`) changed or it has not run for ``refresh_interval``
+    seconds.  A check whose answers could not be fetched keeps its findings
+    and the domain is retried after ``min_interval``.  Otherwise the next
+    check is due after the shortest TTL among the domain's answers, clamped
+    to ``[min_interval, max_interval]`` and stretched by up to ``jitter``, so
+    checks spread out over time instead of coming due together.  At most
+    ``concurrency`` domains are checked at once.
+
+    ``on_change(domain, diff)`` is called with the new and resolved findings
+    (see :func:`~dmarc_audit.state.diff_reports`) whenever a report changes.
+    With a ``state`` store (:class:`~dmarc_audit.state.StateStore`) the last
+    reports survive restarts, so findings are not all reported as new again.
+    """
+
+    def __init__(self, domains=(), dkim_selector=DEFAULT_DKIM_SELECTOR, dkim_selectors=None,
+                 concurrency=DAEMON_CONCURRENCY, min_interval=DAEMON_MIN_INTERVAL, max_interval=DAEMON_MAX_INTERVAL,
+                 jitter=DAEMON_JITTER, refresh_interval=DAEMON_REFRESH_INTERVAL, resolver=None, prober=None,
+                 policy_fetcher=None, state=None, on_change=None, clock=time.time):
+        self.dkim_selector = dkim_selector
+        self.dkim_selectors = dkim_selectors
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.refresh_interval = refresh_interval
+        self.resolver = resolver or get_resolver()
+        self.prober = prober or SMTPProber()
+        self.policy_fetcher = policy_fetcher or PolicyFetcher()
+        self.state = state
+        self.on_change = on_change
+        self.clock = clock
+        self.domains = {}
+        self.counters = Counter()
+        self.checks = Counter()
+        self.lag = 0.0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._probed = {}
+        self._running = set()
+        self._wakeup = None
+        self._stopping = False
+        self.set_domains(domains)
+
+    # Inventory
+
+    def add(self, domain, due=None):
+        """Watch ``domain``, first checking it at ``due`` (now by default)."""
+        domain = domain.lower().rstrip('.')
+        watch = self.domains.get(domain)
+        if watch is None:
+            previous = self.state.get(domain) if self.state is not None else None
+            watch = self.domains[domain] = WatchedDomain(domain, previous.report if previous else None)
+            self._schedule(watch, self.clock() if due is None else due)
+        return watch
+
+    def remove(self, domain):
+        # Its heap entry is skipped when it comes up.
+        self.domains.pop(domain.lower().rstrip('.'), None)
+
+    def set_domains(self, domains):
+        """Make ``domains`` the inventory: new ones are checked right away, missing ones dropped."""
+        wanted = dict.fromkeys(domain.lower().rstrip('.') for domain in domains)
+        for domain in [domain for domain in self.domains if domain not in wanted]:
+            self.remove(domain)
+        for domain in wanted:
+            self.add(domain)
+
+    def _schedule(self, watch, due):
+        watch.due = due
+        heapq.heappush(self._heap, (due, next(self._sequence), watch))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def interval(self, ttl):
+        """Seconds until a domain whose shortest record TTL is ``ttl`` is checked again."""
+        base = self.max_interval if ttl is None else min(self.max_interval, max(self.min_interval, ttl))
+        return base * (1 + random.uniform(0, self.jitter))
+
+    # Checking
+
+    def _forget_probes(self, hosts, now):
+        # Hosts shared by many domains are probed once per min_interval.
+        for host in hosts:
+            if now - self._probed.get(host, float('-inf')) >= self.min_interval:
+                self.prober.forget(host)
+                self._probed[host] = now
+
+    async def check(self, watch):
+        """Bring ``watch`` up to date; return ``(diff, seconds until its next check)``.
+
+        ``diff`` is ``None`` when no check had to run.
+        """
+        now = self.clock()
+        context = AuditContext(watch.domain, self.dkim_selector, self.resolver, self.prober, self.policy_fetcher)
+        # A fresh evaluator, so SPF includes are re-read once their TTLs run out.
+        audit = AsyncSecurityAnalyzer(watch.domain, self.dkim_selector, SPFEvaluator(self.resolver), context,
+                                      self.dkim_selectors)
+        await context.aprefetch(probe=False)
+        inputs = check_inputs(watch.domain, self.dkim_selector)
+        if self.dkim_selectors:
+            await context.adiscover_selectors(self.dkim_selectors)
+            suffix = f"_domainkey.{watch.domain}"
+            inputs['dkim'] = [key for key in context.dns_keys() if key[0].endswith(suffix)]
+        fingerprints = {check: context.record_hash(inputs[check]) for check in CHECKS}
+        failed = [check for check in CHECKS if fingerprints[check] is None]
+        due = [check for check in CHECKS if check not in failed and (
+            fingerprints[check] != watch.fingerprints.get(check)
+            or now - watch.refreshed.get(check, float('-inf')) >= self.refresh_interval
+        )]
+        for check in CHECKS:
+            self.checks[(check, 'failed' if check in failed else 'run' if check in due else 'unchanged')] += 1
+        self.counters['audits'] += 1
+        watch.audits += 1
+        watch.checked_at = now
+        watch.error = f"DNS lookup failed for {', '.join(failed)}" if failed else None
+
+        diff = None
+        if due:
+            if 'mx' in due:
+                self._forget_probes(await context.amx_hosts(), now)
+            results = await audit.check_all(due)
+            report = {check: results[check] if check in results else watch.report[check]
+                      for check in CHECKS if check in results or check in watch.report}
+            diff = diff_reports(watch.report, report)
+            watch.report = report
+            for check in due:
+                watch.fingerprints[check] = fingerprints[check]
+                watch.refreshed[check] = now
+            record_hash = context.record_hash()
+            if self.state is not None and record_hash is not None:
+                self.state.put(watch.domain, record_hash, report, now)
+                # Re-checks come minutes apart; a batch would sit uncommitted
+                # until the daemon exits, and be lost if it is killed.
+                self.state.commit()
+        return diff, self.min_interval if failed else self.interval(context.min_ttl())
+
+    async def _process(self, watch):
+        try:
+            diff, delay = await self.check(watch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Watch check of {watch.domain} failed: {str(e)}")
+            self.counters['errors'] += 1
+            watch.error = str(e)
+            diff, delay = None, self.min_interval
+        if diff is not None and (diff['new'] or diff['resolved']):
+            watch.changes += 1
+            for change in ('new', 'resolved'):
+                self.counters[change] += sum(len(v) + len(r) for v, r in diff[change].values())
+            if self.on_change is not None:
+                self.on_change(watch.domain, diff)
+        if self.domains.get(watch.domain) is watch:
+            self._schedule(watch, self.clock() + delay)
+
+    # Scheduling loop
+
+    def _finished(self, task):
+        self._running.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        """Check domains as they come due until :meth:`stop` is called."""
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        try:
+            while not self._stopping:
+                now = self.clock()
+                while self._heap and self._heap[0][0] <= now and len(self._running) < self.concurrency:
+                    due, _, watch = heapq.heappop(self._heap)
+                    if self.domains.get(watch.domain) is not watch or watch.due != due:
+                        continue
+                    watch.due = None
+                    self.lag = now - due
+                    task = asyncio.ensure_future(self._process(watch))
+                    self._running.add(task)
+                    task.add_done_callback(self._finished)
+                timeout = None
+                if self._heap and len(self._running) < self.concurrency:
+                    timeout = max(0.0, self._heap[0][0] - self.clock())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+            self._wakeup = None
+
+    def stop(self):
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def overdue(self):
+        now = self.clock()
+        return sum(1 for watch in self.domains.values() if watch.due is not None and watch.due <= now)
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+def metrics_text(watcher):
+    """The watcher's counters in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append(f"# HELP dmarc_audit_{name} {description}")
+        lines.append(f"# TYPE dmarc_audit_{name} {kind}")
+        lines.extend(f"dmarc_audit_{name}{_labels(labels)} {value}" for labels, value in samples)
+
+    findings = Counter()
+    for watch in watcher.domains.values():
+        for check, (vulns, recs) in watch.report.items():
+            findings[(check, 'ERROR')] += len(vulns)
+            findings[(check, 'WARNING')] += len(recs)
+    metric('domains', 'gauge', "Domains in the inventory", [({}, len(watcher.domains))])
+    metric('overdue_domains', 'gauge', "Domains past their due time", [({}, watcher.overdue())])
+    metric('running_checks', 'gauge', "Domains being checked", [({}, len(watcher._running))])
+    metric('schedule_lag_seconds', 'gauge', "How late the last domain check started", [({}, round(watcher.lag, 3))])
+    metric('audits_total', 'counter', "Domain checks started", [({}, watcher.counters['audits'])])
+    metric('errors_total', 'counter', "Domain checks that failed", [({}, watcher.counters['errors'])])
+    metric('checks_total', 'counter', "Checks by outcome: run, unchanged (records unchanged) or failed (DNS error)",
+           [({'check': check, 'outcome': outcome}, count) for (check, outcome), count in sorted(watcher.checks.items())])
+    metric('finding_changes_total', 'counter', "Findings that appeared or were resolved",
+           [({'change': change}, watcher.counters[change]) for change in ('new', 'resolved')])
+    metric('findings', 'gauge', "Current findings",
+           [({'check': check, 'severity': severity}, count) for (check, severity), count in sorted(findings.items())])
+    stats = watcher.resolver.stats() if hasattr(watcher.resolver, 'stats') else {}
+    for key in ('hits', 'misses', 'queries'):
+        if key in stats:
+            metric(f"dns_cache_{key}_total", 'counter', f"Resolver cache {key}", [({}, stats[key])])
+    return "\n".join(lines) + "\n"
+
+def _route(watcher, method, path):
+    """Return ``(status, content type, body)`` for a request."""
+    if method != 'GET':
+        return "405 Method Not Allowed", "text/plain", b"method not allowed\n"
+    if path == '/metrics':
+        return "200 OK", "text/plain; version=0.0.4", metrics_text(watcher).encode()
+    if path == '/healthz':
+        return "200 OK", "text/plain", b"ok\n"
+    if path == '/domains':
+        body = [watch.to_dict() for watch in sorted(watcher.domains.values(), key=lambda w: w.domain)]
+        return "200 OK", "application/json", json.dumps(body).encode()
+    if path.startswith('/domains/'):
+        from .api import findings_from_report
+
+        watch = watcher.domains.get(path[len('/domains/'):].lower().rstrip('.'))
+        if watch is None:
+            return "404 Not Found", "application/json", b'{"error": "unknown domain"}'
+        body = watch.to_dict()
+        body['findings'] = [finding.to_dict() for finding in findings_from_report(watch.report)]
+        return "200 OK", "application/json", json.dumps(body).encode()
+    return "404 Not Found", "text/plain", b"not found\n"
+
+async def _handle(watcher, reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        writer.close()
+        return
+    method, _, rest = request.decode('latin-1').partition(' ')
+    path = rest.split(' ', 1)[0].split('?', 1)[0]
+    status, content_type, body = _route(watcher, method, path)
+    writer.write(
+        f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+async def serve_http(watcher, host, port):
+    """Serve ``/metrics`` (Prometheus), ``/domains``, ``/domains/<domain>`` and ``/healthz``.
+
+    Returns the :class:`asyncio.Server`.  There is no authentication, so
+    keep it on a local address.
+    """
+    return await asyncio.start_server(lambda r, w: _handle(watcher, r, w), host, port,
+                                      limit=DAEMON_MAX_REQUEST_SIZE)
@@ -0,0 +1,81 @@
+"""DKIM public key decoding with results memoized by key fingerprint"""
+
+import base64
+import binascii
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+from .config import DKIM_KEY_CACHE_SIZE
+
+@dataclass
+class DKIMKey:
+    __slots__ = ('key_type', 'bits', 'fingerprint', 'error')
+    key_type: str
+    bits: Optional[int]
+    fingerprint: Optional[str]
+    error: Optional[str]
+
+# (key type, SHA-256 of the decoded key) -> DKIMKey.  ESPs publish the same
+# key for thousands of customer domains, so bulk runs decode each key once.
+_keys = {}
+
+def _decode_rsa(data):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    try:
+        key = serialization.load_der_public_key(data)
+    except ValueError:
+        # Some signers publish a bare PKCS#1 RSAPublicKey instead of the
+        # SubjectPublicKeyInfo that RFC 6376 specifies.
+        pem = (b"-----BEGIN RSA PUBLIC KEY-----\n" + base64.encodebytes(data) +
+               b"-----END RSA PUBLIC KEY-----\n")
+        key = serialization.load_pem_public_key(pem)
+    if not isinstance(key, rsa.RSAPublicKey):
+        raise ValueError("key is not an RSA key")
+    return key.key_size
+
+def _decode_ed25519(data):
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    # RFC 8463: p= is the raw 32-byte public key, not a DER structure.
+    ed25519.Ed25519PublicKey.from_public_bytes(data)
+    return len(data) * 8
+
+DECODERS = {
+    'rsa': _decode_rsa,
+    'ed25519': _decode_ed25519
+}
+
+def load_dkim_key(key_type, public_key):
+    """Decode the base64 ``p=`` value of a DKIM record into a :class:`DKIMKey`.
+
+    Decoding failures are reported in ``error`` rather than raised.
+    """
+    try:
+        data = base64.b64decode(public_key, validate=True)
+    except (binascii.Error, ValueError):
+        return DKIMKey(key_type, None, None, "public key is not valid base64")
+    fingerprint = hashlib.sha256(data).hexdigest()
+    cache_key = (key_type, fingerprint)
+    key = _keys.get(cache_key)
+    if key is not None:
+        return key
+    decoder = DECODERS.get(key_type)
+    if decoder is None:
+        key = DKIMKey(key_type, None, fingerprint, f"unsupported key type k={key_type}")
+    else:
+        # cryptography is imported only once a key actually needs decoding.
+        from cryptography.exceptions import UnsupportedAlgorithm
+
+        try:
+            key = DKIMKey(key_type, decoder(data), fingerprint, None)
+        except (ValueError, TypeError, UnsupportedAlgorithm) as e:
+            key = DKIMKey(key_type, None, fingerprint, str(e) or e.__class__.__name__)
+    if len(_keys) >= DKIM_KEY_CACHE_SIZE:
+        del _keys[next(iter(_keys))]
+    _keys[cache_key] = key
+    return key
+
+def clear_key_cache():
+    _keys.clear()
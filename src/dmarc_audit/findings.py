@@ -0,0 +1,28 @@
+"""Finding messages that carry their stable code from the check that emits them"""
+
+class Message(str):
+    """The text of one finding, plus its ``code`` and ``evidence``.
+
+    Every analyzer emits these, so the code is fixed where the finding is
+    made rather than read back from the wording.  A message is still a
+    ``str``: reports stay ``{check: (vulns, recs)}`` lists of text for the
+    writers, the state store and the journal, and the code is dropped when
+    a report is serialized.  ``{check}`` in a code stands for the check that
+    reports the finding, for findings several checks share (TLS, failures).
+
+        Message("dmarc.partial-enforcement", "Partial policy enforcement (pct=50)", pct=50)
+    """
+
+    def __new__(cls, code, text, **evidence):
+        message = super().__new__(cls, text)
+        message.code = code
+        message.evidence = evidence
+        return message
+
+    def __reduce__(self):
+        # Keeps the code when reports are sent between worker processes.
+        return self.__class__, (self.code, str(self)), self.__dict__
+
+    def prefixed(self, prefix, **evidence):
+        """This finding with ``prefix`` before its text and ``evidence`` added."""
+        return Message(self.code, prefix + self, **self.evidence, **evidence)
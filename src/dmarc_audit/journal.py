@@ -0,0 +1,155 @@
+"""Progress journal of bulk audits: finished domains and their results, for --resume"""
+
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from .config import JOURNAL_SYNC_INTERVAL, JOURNAL_SYNC_RECORDS
+from .portfolio import Posture
+
+JOURNAL_VERSION = 1
+
+JournalRecord = namedtuple('JournalRecord', ['domain', 'report', 'scan_time', 'posture'])
+
+class JournalError(ValueError):
+    """The journal cannot be used for this run (it exists without resume, or was written with other options)."""
+
+class Journal:
+    """Append-only JSON-lines file with one line per finished domain.
+
+    The first line records the options that decide which domains are audited
+    and how; every other line holds a domain's report, scan time and
+    :class:`~dmarc_audit.portfolio.Posture`.  Lines are buffered and written
+    with one ``fsync`` every ``sync_records`` records or ``sync_interval``
+    seconds, so journaling costs a few microseconds per domain and a crash
+    loses at most that much work.  A line torn by a crash is dropped when the
+    journal is reopened.
+
+    Usage: :meth:`start`, :meth:`replay` (when resuming), :meth:`open`, then
+    :meth:`record` for each finished domain and :meth:`close`.  The journal
+    can also stand in for a :class:`~dmarc_audit.portfolio.Portfolio`: postures
+    passed to :meth:`add` are written with their domain's record and forwarded
+    to ``portfolio``.
+    """
+
+    def __init__(self, path, options=None, portfolio=None, sync_records=JOURNAL_SYNC_RECORDS,
+                 sync_interval=JOURNAL_SYNC_INTERVAL):
+        self.path = path
+        self.options = options or {}
+        self.portfolio = portfolio
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        self.records = 0
+        self.syncs = 0
+        self._file = None
+        self._buffer = []
+        self._postures = {}
+        self._end = None
+        self._last_sync = time.monotonic()
+
+    def start(self, resume=False):
+        """Check that the journal can be used; raises :class:`JournalError` before anything is written.
+
+        An existing journal is only continued with ``resume``, and only if it
+        was written with the same options.  Returns whether there is one to continue.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return False
+        if not first:
+            return False
+        if not resume:
+            raise JournalError(f"Journal {self.path} already exists; pass --resume to continue it or remove it")
+        try:
+            header = json.loads(first)
+        except ValueError:
+            header = None
+        if not first.endswith(b'\n') or not isinstance(header, dict) or header.get('journal') != JOURNAL_VERSION:
+            raise JournalError(f"{self.path} is not a dmarc-audit journal")
+        if header.get('options') != self.options:
+            raise JournalError(f"Journal {self.path} was written with different options: {header.get('options')}")
+        return True
+
+    def replay(self):
+        """Yield a :class:`JournalRecord` for every domain the journal holds.
+
+        Reading stops at the first incomplete line: whatever follows it was
+        never synced, and :meth:`open` truncates it away.
+        """
+        self._end = 0
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            first = f.readline()
+            if not first.endswith(b'\n'):
+                return
+            self._end = f.tell()
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    break
+                self._end += len(line)
+                report = {check: (vulns, recs) for check, (vulns, recs) in data['report'].items()}
+                posture = Posture(data['domain'], *data['posture']) if data.get('posture') else None
+                yield JournalRecord(data['domain'], report, data['scan_time'], posture)
+
+    def open(self):
+        """Open the journal for appending, after any torn tail left by a crash."""
+        if self._end:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._end)
+            self._file = open(self.path, 'ab')
+        else:
+            self._file = open(self.path, 'wb')
+            self._buffer.append(json.dumps({'journal': JOURNAL_VERSION, 'options': self.options}) + '\n')
+            self.sync()
+        return self
+
+    def add(self, posture):
+        # Held until the domain's report is recorded: an audit that never
+        # finishes must not count in a resumed summary.
+        self._postures[posture.domain] = posture
+        if self.portfolio is not None:
+            self.portfolio.add(posture)
+
+    def record(self, domain, report, scan_time=None):
+        posture = self._postures.pop(domain, None)
+        self._buffer.append(json.dumps({
+            'domain': domain,
+            'report': report,
+            'scan_time': scan_time or datetime.now().isoformat(),
+            'posture': list(posture[1:]) if posture is not None else None
+        }) + '\n')
+        self.records += 1
+        if len(self._buffer) >= self.sync_records or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Write buffered records and ``fsync`` them."""
+        if self._buffer:
+            self._file.write(''.join(self._buffer).encode())
+            self._buffer.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,17 +1,35 @@
-from rich.console import Console
 import logging
+import sys
 from .config import LOG_FORMAT, LOG_LEVEL, LOG_FILE
 
-def setup_logger():
-    logging.basicConfig(
-        level=getattr(logging, LOG_LEVEL),
-        format=LOG_FORMAT,
-        handlers=[
-            logging.FileHandler(LOG_FILE),
-            logging.StreamHandler()
-        ]
-    )
-    return logging.getLogger(__name__)
+# Handlers are attached by setup_logger() when the CLI starts, so importing
+# the package never opens a log file and library callers see no output
+# unless they configure logging themselves.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
-logger = setup_logger()
-console = Console() 
\ No newline at end of file
+# How setup_logger() configured this process, for worker processes to repeat.
+_options = None
+
+def setup_logger(quiet=False, level=None):
+    """Log to the console and ``LOG_FILE``; with ``quiet``, only warnings to stderr."""
+    global _options
+    formatter = logging.Formatter(LOG_FORMAT)
+    if quiet:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setLevel(logging.WARNING)
+        handlers = [handler]
+    else:
+        handlers = [logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.setLevel(level if level is not None else getattr(logging, LOG_LEVEL))
+    logger.propagate = False
+    _options = {'quiet': quiet}
+    return logger
+
+def logger_options():
+    """Keyword arguments that repeat this process's :func:`setup_logger` call
+    (with its current level) in a spawned process, or ``None`` if it was never called."""
+    return None if _options is None else dict(_options, level=logger.level)
@@ -7,65 +7,519 @@ Created by: Sevban Dönmez
 
 import sys
 import argparse
-from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
+import logging
 from datetime import datetime
-from dmarc_audit.utils import print_banner, create_report, print_results_table
-from dmarc_audit.analyzer import (
-    analyze_spf, 
-    analyze_dmarc, 
-    check_dkim,
-    SecurityAnalyzer,
-    get_dns_record
+from dmarc_audit import __version__
+from dmarc_audit.utils import (
+    console,
+    print_banner,
+    create_report,
+    print_results_table,
+    print_bulk_result,
+    print_bulk_diff,
+    print_portfolio_summary,
+    PLAIN_COLUMNS,
+    print_plain_rows,
+    print_profile,
+    progress,
+    read_domains,
+    set_quiet
 )
+from dmarc_audit.config import (
+    DEFAULT_CONCURRENCY,
+    REPORT_FORMATS,
+    COMMON_DKIM_SELECTORS,
+    DNS_TIMEOUT,
+    DNS_LIFETIME,
+    DNS_HEDGE_DELAY,
+    PROBE_CACHE_TTL,
+    DAEMON_LISTEN,
+    DAEMON_MIN_INTERVAL,
+    DAEMON_MAX_INTERVAL
+)
+from dmarc_audit.writers import DIFF_COLUMNS, diff_rows, file_extension, finding_rows, merge_outputs, open_writer
+from dmarc_audit.parallel import audit_parallel, parse_shard, select_shard
+from dmarc_audit.cache import open_cache, close_cache
+from dmarc_audit.tracing import Tracer, get_tracer, set_tracer, span
+from dmarc_audit.logger import logger, setup_logger
+
+# The analyzers, resolver (dnspython) and stores are imported inside the
+# functions that use them, so --version, --help and --merge start fast.
+
+def shard_argument(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def dkim_selectors(args):
+    """Selectors to probe when ``--discover-selectors`` is set, else ``None``."""
+    if not args.discover_selectors:
+        return None
+    selectors = list(read_domains(args.selectors_file)) if args.selectors_file else COMMON_DKIM_SELECTORS
+    return [args.dkim_selector] + list(selectors)
+
+def bulk_domains(args):
+    """The domains of ``--domains-file`` that belong to this machine's ``--shard``."""
+    return select_shard(read_domains(args.domains_file), *args.shard)
+
+def journal_options(args):
+    """The options a ``--journal`` must have been written with to be resumed."""
+    return {'shard': list(args.shard), 'dkim_selector': args.dkim_selector, 'dkim_selectors': dkim_selectors(args)}
+
+def emit(domain, report, writer, quiet=False, journal=None, scan_time=None):
+    scan_time = scan_time or datetime.now().isoformat()
+    if writer is not None:
+        writer.write_report(domain, report, scan_time)
+    elif quiet:
+        print_plain_rows(finding_rows(domain, report, scan_time))
+    else:
+        print_bulk_result(domain, report)
+    if journal is not None:
+        journal.record(domain, report, scan_time)
+
+def run_parallel(args, writer=None, portfolio=None, journal=None, done=frozenset()):
+    count = 0
+    for domain, report in audit_parallel(
+        args.domains_file,
+        args.workers,
+        shard=args.shard,
+        dkim_selector=args.dkim_selector,
+        concurrency=args.concurrency,
+        dkim_selectors=dkim_selectors(args),
+        resolvers=args.resolver,
+        resolver_options={'timeout': args.dns_timeout, 'lifetime': args.dns_lifetime, 'hedge_delay': args.hedge_delay},
+        cache_dir=args.cache_dir,
+        max_age=args.max_age,
+        portfolio=portfolio,
+        skip=done
+    ):
+        emit(domain, report, writer, args.quiet, journal)
+        count += 1
+    return count
+
+async def run_bulk(args, writer=None, portfolio=None, journal=None, done=frozenset()):
+    from dmarc_audit.async_analyzer import audit_domains
+    from dmarc_audit.ratelimit import get_scheduler
+    from dmarc_audit.resolver import get_resolver
+
+    domains = bulk_domains(args)
+    if done:
+        domains = (domain for domain in domains if domain not in done)
+    count = 0
+    async for domain, report in audit_domains(
+        domains,
+        dkim_selector=args.dkim_selector,
+        concurrency=args.concurrency,
+        dkim_selectors=dkim_selectors(args),
+        portfolio=portfolio
+    ):
+        emit(domain, report, writer, args.quiet, journal)
+        count += 1
+    logger.debug(f"DNS cache stats: {get_resolver().stats()}")
+    logger.debug(f"Rate limiter stats: {get_scheduler().stats()}")
+    return count
+
+def run_journaled(args, run, writer=None, portfolio=None, journal=None):
+    """Run a bulk audit, replaying ``--journal`` first when resuming and journaling every result.
+
+    The journaled domains are written to ``writer`` (or stdout with
+    ``--quiet``) and added to ``portfolio`` again, then skipped.  Returns
+    the number of domains, including the replayed ones.
+    """
+    if journal is None:
+        return run(args, writer, portfolio)
+    done = set()
+    for record in journal.replay():
+        done.add(record.domain)
+        if writer is not None:
+            writer.write_report(record.domain, record.report, record.scan_time)
+        elif args.quiet:
+            print_plain_rows(finding_rows(record.domain, record.report, record.scan_time))
+        if portfolio is not None and record.posture is not None:
+            portfolio.add(record.posture)
+    if done:
+        logger.info(f"Resuming {args.journal}: {len(done)} domains already audited")
+        if writer is None and not args.quiet:
+            console.print(f"Resuming: {len(done)} domains already audited", style="cyan")
+    with journal.open():
+        # The journal stands in for the portfolio: it records each posture and passes it on.
+        return len(done) + run(args, writer, journal, journal, done)
+
+async def run_reaudit(args, writer=None, diff_writer=None):
+    """Incremental bulk audit against ``--state``; returns ``(audited, reused)`` counts."""
+    from dmarc_audit.async_analyzer import reaudit_domains
+    from dmarc_audit.ratelimit import get_scheduler
+    from dmarc_audit.resolver import get_resolver
+    from dmarc_audit.state import StateStore
+
+    count = reused = 0
+    with StateStore(args.state) as state:
+        async for result in reaudit_domains(
+            bulk_domains(args),
+            state,
+            dkim_selector=args.dkim_selector,
+            concurrency=args.concurrency,
+            dkim_selectors=dkim_selectors(args),
+            probe_ttl=args.probe_ttl
+        ):
+            if writer is not None:
+                writer.write_report(result.domain, result.report)
+                if diff_writer is not None:
+                    diff_writer.write_diff(result.domain, result.diff)
+            elif args.quiet:
+                print_plain_rows(diff_rows(result.domain, result.diff), ('change',) + PLAIN_COLUMNS)
+            else:
+                print_bulk_diff(result.domain, result.diff, result.reused)
+            count += 1
+            reused += result.reused
+    logger.debug(f"DNS cache stats: {get_resolver().stats()}")
+    logger.debug(f"Rate limiter stats: {get_scheduler().stats()}")
+    return count, reused
+
+def report_summary(args, portfolio):
+    """Print the portfolio summary (``--summary``) and/or write it as JSON (``--summary-output``)."""
+    import json
+
+    summary = portfolio.summary()
+    if args.summary:
+        print_portfolio_summary(summary)
+    if args.summary_output:
+        with open(args.summary_output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Portfolio summary of {summary['domains']} domains written to {args.summary_output}")
+
+def listen_address(value):
+    host, _, port = value.rpartition(':')
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {value!r}")
+    return host.strip('[]'), int(port)
+
+async def run_watch(args, writer=None):
+    """Watch mode: re-audit ``--domains-file`` as records expire until SIGINT/SIGTERM; SIGHUP reloads the list."""
+    import asyncio
+    import signal
+    from dmarc_audit.daemon import Watcher, serve_http
+    from dmarc_audit.state import StateStore
+
+    def changed(domain, diff):
+        if writer is not None:
+            writer.write_diff(domain, diff)
+        elif args.quiet:
+            print_plain_rows(diff_rows(domain, diff), ('change',) + PLAIN_COLUMNS)
+            sys.stdout.flush()
+        else:
+            print_bulk_diff(domain, diff, False)
+
+    state = StateStore(args.state) if args.state else None
+    watcher = Watcher(
+        list(bulk_domains(args)),
+        dkim_selector=args.dkim_selector,
+        dkim_selectors=dkim_selectors(args),
+        concurrency=args.concurrency,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        refresh_interval=args.probe_ttl,
+        state=state,
+        on_change=changed
+    )
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGINT, watcher.stop)
+    loop.add_signal_handler(signal.SIGTERM, watcher.stop)
+    if args.domains_file != '-':
+        loop.add_signal_handler(signal.SIGHUP, lambda: watcher.set_domains(list(bulk_domains(args))))
+    host, port = args.listen
+    server = await serve_http(watcher, host, port)
+    logger.info(f"Watching {len(watcher.domains)} domains; metrics on http://{args.listen[0]}:{args.listen[1]}/metrics")
+    try:
+        await watcher.run()
+    finally:
+        server.close()
+        await server.wait_closed()
+        if state is not None:
+            state.close()
+    return len(watcher.domains)
+
+def ingest_main(argv):
+    """``dmarc-audit ingest PATH...``: aggregate DMARC reports and cross-reference them with DNS."""
+    import asyncio
+    from dmarc_audit.resolver import CachingResolver, set_resolver
+    from dmarc_audit.rua import AGGREGATE_COLUMNS, audit_aggregate, ingest
+    from dmarc_audit.utils import print_aggregate_table
 
-console = Console()
+    parser = argparse.ArgumentParser(prog="dmarc-audit ingest",
+                                     description="Ingest DMARC aggregate (RUA) reports: XML, .gz or .zip files or directories of them")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="Report file or directory")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default='text', help="Output format of the findings")
+    parser.add_argument("--output", help="Write findings to this file instead of stdout")
+    parser.add_argument("--aggregate-output", help="Also write the pass/fail totals per source IP, header-from and disposition to this file (--format json, csv or columnar)")
+    parser.add_argument("--no-dns", action="store_true", help="Do not look up the domains' SPF and DMARC records; judge the reports on their own")
+    parser.add_argument("--resolver", action="append", metavar="ADDRESS", help="Upstream DNS resolver to use; repeat for several")
+    parser.add_argument("--top", type=int, default=10, help="Text output: source rows shown per domain")
+    parser.add_argument("--debug", action="store_true", help="Log debug details")
+    parser.add_argument("--quiet", action="store_true", help="Machine mode: findings as tab-separated lines, warnings only on stderr")
+    args = parser.parse_args(argv)
+    if args.aggregate_output and args.format == 'text':
+        parser.error("--aggregate-output needs --format json, csv or columnar")
+    if args.format == 'columnar' and not args.output:
+        parser.error("--format columnar requires --output")
+
+    setup_logger(quiet=args.quiet)
+    if args.quiet:
+        set_quiet()
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+    try:
+        aggregate = ingest(args.paths)
+        set_resolver(CachingResolver(args.resolver))
+
+        async def collect():
+            return [item async for item in audit_aggregate(aggregate, lookup=not args.no_dns)]
+        results = asyncio.run(collect())
+
+        if args.format != 'text':
+            with open_writer(args.format, args.output) as writer:
+                for domain, report in results:
+                    writer.write_report(domain, report)
+            if args.aggregate_output:
+                with open_writer(args.format, args.aggregate_output, columns=AGGREGATE_COLUMNS) as writer:
+                    writer.write_rows(list(aggregate.rows()))
+        elif args.quiet:
+            for domain, report in results:
+                print_plain_rows(finding_rows(domain, report))
+        else:
+            for domain, report in results:
+                messages, dmarc_pass = aggregate.totals(domain)[:2]
+                console.print(f"\n[bold cyan]{domain}[/bold cyan]: {messages} messages, "
+                              f"{dmarc_pass / messages if messages else 0:.1%} passing DMARC, "
+                              f"reported by {len(aggregate.reporters.get(domain, ()))} receivers")
+                print_aggregate_table(list(aggregate.rows(domain))[:args.top])
+                for check, (vulns, recs) in report.items():
+                    if vulns or recs:
+                        print_results_table(f"{check.upper()} Analysis", vulns, recs)
+            console.print(f"\n=== Ingested {aggregate.records} records from {aggregate.reports} reports "
+                          f"({aggregate.duplicates} duplicates, {len(aggregate.errors)} unreadable) ===",
+                          style="cyan bold")
+    except Exception as e:
+        if args.quiet:
+            print(f"Error during ingestion: {str(e)}", file=sys.stderr)
+        else:
+            console.print(f"\nError during ingestion: {str(e)}", style="bold red")
+        sys.exit(1)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'ingest':
+        return ingest_main(sys.argv[2:])
+    args = None
     try:
         parser = argparse.ArgumentParser(description="DMARC Security Audit Tool")
-        parser.add_argument("domain", help="Domain to audit")
+        parser.add_argument("domain", nargs="?", help="Domain to audit")
+        parser.add_argument("--domains-file", help="Audit every domain listed in this file ('-' reads stdin)")
+        parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum domains audited at once in bulk mode")
+        parser.add_argument("--workers", type=int, default=1, help="Bulk mode: split the domains across this many processes")
+        parser.add_argument("--shard", type=shard_argument, default=(0, 1), metavar="INDEX/COUNT", help="Bulk mode: only audit this machine's share of the list (0-based, e.g. 0/4)")
+        parser.add_argument("--merge", nargs="+", metavar="FILE", help="Merge shard outputs of the same --format into --output and exit")
         parser.add_argument("--dkim-selector", help="DKIM selector (default: selector1)", default="selector1")
-        parser.add_argument("--format", choices=['text', 'json', 'csv'], default='text', help="Output format")
+        parser.add_argument("--discover-selectors", action="store_true", help="Probe common DKIM selectors and report every one found")
+        parser.add_argument("--selectors-file", help="Selectors to probe with --discover-selectors, one per line")
+        parser.add_argument("--format", choices=REPORT_FORMATS, default='text', help="Output format")
+        parser.add_argument("--output", help="Bulk mode: append findings to this file instead of stdout")
+        parser.add_argument("--state", help="Bulk mode: incremental re-audit, skipping domains whose records are unchanged since the run recorded in this file")
+        parser.add_argument("--probe-ttl", type=int, default=PROBE_CACHE_TTL, help="With --state: re-probe unchanged domains whose last SMTP/TLS probes are older than this many seconds; with --watch: re-run checks at least this often")
+        parser.add_argument("--diff-output", help="With --state: write new/resolved findings to this file (default: report_diff_<timestamp>)")
+        parser.add_argument("--watch", action="store_true", help="Daemon mode: keep re-auditing --domains-file, each domain when its records' TTLs run out, printing findings as they appear or resolve")
+        parser.add_argument("--listen", type=listen_address, default=DAEMON_LISTEN, metavar="HOST:PORT", help=f"With --watch: serve /metrics, /domains and /healthz here (default: {DAEMON_LISTEN})")
+        parser.add_argument("--min-interval", type=float, default=DAEMON_MIN_INTERVAL, help="With --watch: never re-check a domain sooner than this many seconds")
+        parser.add_argument("--max-interval", type=float, default=DAEMON_MAX_INTERVAL, help="With --watch: re-check every domain at least this often (seconds), whatever its TTLs")
+        parser.add_argument("--summary", action="store_true", help="Bulk mode: print posture statistics of all audited domains at the end (DMARC policy and pct, SPF lookups, DKIM key sizes, MTA-STS adoption, per mail provider)")
+        parser.add_argument("--summary-output", help="Bulk mode: write the posture statistics to this file as JSON")
+        parser.add_argument("--journal", help="Bulk mode: record every finished domain in this progress journal (fsynced in batches) so an interrupted run can be resumed")
+        parser.add_argument("--resume", action="store_true", help="With --journal: skip the domains the journal already holds, rebuilding --output and the summary from it, and audit the rest")
         parser.add_argument("--detailed", action="store_true", help="Generate detailed security report")
-        parser.add_argument("--dns-timeout", type=int, default=10, help="DNS query timeout in seconds")
+        parser.add_argument("--resolver", action="append", metavar="ADDRESS", help="Upstream DNS resolver to use; repeat for several (default: public resolvers from config)")
+        parser.add_argument("--dns-timeout", type=float, default=DNS_TIMEOUT, help="Seconds to wait for one upstream before failing over")
+        parser.add_argument("--dns-lifetime", type=float, default=DNS_LIFETIME, help="Total seconds allowed per DNS query across upstreams")
+        parser.add_argument("--hedge-delay", type=float, default=DNS_HEDGE_DELAY, help="Seconds before a slow query is also sent to the next upstream (0 disables)")
+        parser.add_argument("--cache-dir", help="Persist DNS answers and SMTP probe results in this directory")
+        parser.add_argument("--max-age", type=int, help="Reuse cached results younger than this many seconds (default: record TTL)")
+        parser.add_argument("--profile", action="store_true", help="Print per-check and per-network-operation timings at the end")
+        parser.add_argument("--trace-file", help="Append every timing span to this file as OpenTelemetry-style JSON lines")
+        parser.add_argument("--debug", action="store_true", help="Log debug details such as network operations per audit")
+        parser.add_argument("--quiet", action="store_true", help="Machine mode: no banner, progress or colors; text output as tab-separated lines, warnings only on stderr and no log file")
+        parser.add_argument("--version", action="version", version=f"dmarc-audit {__version__}")
         args = parser.parse_args()
 
-        print_banner()
+        setup_logger(quiet=args.quiet)
+        if args.quiet:
+            set_quiet()
+        if args.debug:
+            logger.setLevel(logging.DEBUG)
+
+        if args.merge:
+            if args.format == 'text' or not args.output:
+                parser.error("--merge needs a --format other than text and an --output file")
+            rows = merge_outputs(args.format, args.merge, args.output)
+            console.print(f"Merged {len(args.merge)} files ({rows} rows) into {args.output}")
+            return
+
+        if not args.domain and not args.domains_file:
+            parser.error("a domain or --domains-file is required")
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        if args.workers > 1 and (args.domains_file == '-' or args.state):
+            parser.error("--workers needs a domains file (not stdin) and cannot be combined with --state")
+        if args.concurrency < 1:
+            parser.error("--concurrency must be at least 1")
+        if args.format == 'columnar' and not args.output and args.domains_file:
+            parser.error("--format columnar requires --output in bulk mode")
+        if args.state and not args.domains_file:
+            parser.error("--state requires --domains-file")
+        if args.watch:
+            if not args.domains_file or args.workers > 1:
+                parser.error("--watch needs --domains-file and a single worker")
+            if args.format == 'columnar':
+                parser.error("--watch writes changes as they happen; use --format text, json or csv")
+            if args.min_interval <= 0 or args.max_interval < args.min_interval:
+                parser.error("--min-interval must be positive and no longer than --max-interval")
+        if args.summary or args.summary_output:
+            if not args.domains_file or args.state or args.watch:
+                parser.error("--summary and --summary-output need --domains-file and cannot be combined with --state or --watch")
+            if args.summary and args.quiet:
+                parser.error("--summary prints tables; use --summary-output with --quiet")
+        if args.resume and not args.journal:
+            parser.error("--resume requires --journal")
+        if args.journal and (not args.domains_file or args.state or args.watch):
+            parser.error("--journal needs --domains-file and cannot be combined with --state or --watch")
+        if args.max_age is not None and not args.cache_dir:
+            parser.error("--max-age requires --cache-dir")
+
+        if args.dns_timeout <= 0 or args.dns_lifetime < args.dns_timeout:
+            parser.error("--dns-timeout must be positive and no longer than --dns-lifetime")
+        if args.hedge_delay < 0:
+            parser.error("--hedge-delay cannot be negative")
+
+        import asyncio
+        from dmarc_audit.analyzer import analyze_spf, analyze_dmarc, check_dkim, SecurityAnalyzer, evaluate_spf
+        from dmarc_audit.context import AuditContext
+        from dmarc_audit.resolver import CachingResolver, set_resolver
 
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            transient=False,
-            refresh_per_second=1,
-            disable=False
-        ) as progress:
+        if args.profile or args.trace_file:
+            set_tracer(Tracer(open(args.trace_file, 'a', encoding='utf-8') if args.trace_file else None))
+        set_resolver(CachingResolver(
+            args.resolver,
+            timeout=args.dns_timeout,
+            lifetime=args.dns_lifetime,
+            hedge_delay=args.hedge_delay,
+            # Watch mode must see changes within --max-interval even behind long TTLs.
+            **({'max_ttl': args.max_interval} if args.watch else {})
+        ))
+        if args.cache_dir:
+            open_cache(args.cache_dir, max_age=args.max_age)
+
+        if args.watch:
+            if args.format == 'text':
+                if not args.quiet:
+                    print_banner()
+                count = asyncio.run(run_watch(args))
+                console.print(f"\n=== Watch Stopped ({count} domains) ===", style="cyan bold")
+            else:
+                with open_writer(args.format, args.output, columns=DIFF_COLUMNS) as writer:
+                    writer.flush_interval = 1
+                    asyncio.run(run_watch(args, writer))
+            return
+
+        if args.domains_file and args.state:
+            if args.format == 'text':
+                if not args.quiet:
+                    print_banner()
+                count, reused = asyncio.run(run_reaudit(args))
+                console.print(f"\n=== Incremental Audit Complete ({count} domains, {reused} unchanged) ===", style="cyan bold")
+            else:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                diff_path = args.diff_output or f"report_diff_{timestamp}.{file_extension(args.format)}"
+                with open_writer(args.format, args.output) as writer, \
+                        open_writer(args.format, diff_path, columns=DIFF_COLUMNS) as diff_writer:
+                    asyncio.run(run_reaudit(args, writer, diff_writer))
+            return
+
+        if args.domains_file:
+            from dmarc_audit.journal import Journal, JournalError
+            from dmarc_audit.portfolio import Portfolio
+
+            run = run_parallel if args.workers > 1 else lambda *a: asyncio.run(run_bulk(*a))
+            portfolio = Portfolio() if args.summary or args.summary_output else None
+            journal = None
+            if args.journal:
+                journal = Journal(args.journal, journal_options(args), portfolio)
+                try:
+                    resuming = journal.start(args.resume)
+                except JournalError as e:
+                    parser.error(str(e))
+                if resuming and args.format != 'text' and args.output:
+                    # Writers append, so the output is rebuilt from the journal instead.
+                    open(args.output, 'w').close()
+            if args.format == 'text':
+                if not args.quiet:
+                    print_banner()
+                count = run_journaled(args, run, None, portfolio, journal)
+                console.print(f"\n=== Bulk Audit Complete ({count} domains) ===", style="cyan bold")
+            else:
+                with open_writer(args.format, args.output) as writer:
+                    run_journaled(args, run, writer, portfolio, journal)
+            if portfolio is not None:
+                report_summary(args, portfolio)
+            return
+
+        if not args.quiet:
+            print_banner()
+
+        with span('audit', domain=args.domain), progress(args.quiet) as progress_bar:
             # Tüm taskları başlangıçta oluştur
             tasks = {}
-            
+
+            # Ağ verilerini tek seferde topla
+            tasks['fetch'] = progress_bar.add_task("[cyan]Fetching DNS records and probing mail servers...", total=1)
+            context = AuditContext(args.domain, args.dkim_selector).prefetch()
+            progress_bar.update(tasks['fetch'], completed=1)
+
             # SPF Analizi
-            tasks['spf'] = progress.add_task("[cyan]Analyzing SPF records...", total=1)
-            spf_record = get_dns_record(args.domain, "TXT")
-            spf_vulns, spf_recs = analyze_spf([r for r in spf_record if "v=spf1" in r.lower()])
-            progress.update(tasks['spf'], completed=1)
+            tasks['spf'] = progress_bar.add_task("[cyan]Analyzing SPF records...", total=1)
+            spf_record = context.records(args.domain, "TXT")
+            spf_vulns, spf_recs = analyze_spf(
+                [r for r in spf_record if "v=spf1" in r.lower()],
+                evaluate_spf(args.domain)
+            )
+            progress_bar.update(tasks['spf'], completed=1)
             
             # DMARC Analizi
-            tasks['dmarc'] = progress.add_task("[cyan]Analyzing DMARC records...", total=1)
-            dmarc_record = get_dns_record(f"_dmarc.{args.domain}", "TXT")
+            tasks['dmarc'] = progress_bar.add_task("[cyan]Analyzing DMARC records...", total=1)
+            dmarc_record = context.records(f"_dmarc.{args.domain}", "TXT")
             dmarc_vulns, dmarc_recs = analyze_dmarc([r for r in dmarc_record if "v=dmarc1" in r.lower()])
-            progress.update(tasks['dmarc'], completed=1)
+            progress_bar.update(tasks['dmarc'], completed=1)
             
             # DKIM Analizi
-            tasks['dkim'] = progress.add_task("[cyan]Analyzing DKIM records...", total=1)
-            dkim_vulns, dkim_recs = check_dkim(args.domain, args.dkim_selector)
-            progress.update(tasks['dkim'], completed=1)
+            tasks['dkim'] = progress_bar.add_task("[cyan]Analyzing DKIM records...", total=1)
+            selectors = dkim_selectors(args)
+            dkim_vulns, dkim_recs = check_dkim(args.domain, args.dkim_selector, context, selectors)
+            progress_bar.update(tasks['dkim'], completed=1)
             
             # Güvenlik Analizi
-            tasks['security'] = progress.add_task("[cyan]Performing security analysis...", total=1)
-            security_analyzer = SecurityAnalyzer(args.domain)
+            tasks['security'] = progress_bar.add_task("[cyan]Performing security analysis...", total=1)
+            security_analyzer = SecurityAnalyzer(args.domain, context=context)
             mx_vulns = security_analyzer.check_mx_records()
             email_vulns, headers = security_analyzer.check_email_headers()
-            progress.update(tasks['security'], completed=1)
+            progress_bar.update(tasks['security'], completed=1)
+
+        context.log_operations()
+
+        report = {
+            'spf': (spf_vulns, spf_recs),
+            'dmarc': (dmarc_vulns, dmarc_recs),
+            'dkim': (dkim_vulns, dkim_recs),
+            'mx': (mx_vulns + email_vulns, [])
+        }
+        if args.quiet and args.format == 'text':
+            print_plain_rows(finding_rows(args.domain, report))
 
         # Sonuçları göster
         console.print("\n[bold cyan]Results:[/bold cyan]")
@@ -83,7 +537,14 @@ def main():
             console.print("[yellow]No DMARC records found[/yellow]")
         
         # DKIM Sonuçları
-        if dkim_vulns or dkim_recs:
+        if selectors:
+            found = context.discover_selectors(selectors)
+            console.print(f"[cyan]DKIM selectors found:[/cyan] {', '.join(found) or 'none'}")
+            if dkim_vulns or dkim_recs:
+                print_results_table("DKIM Analysis", dkim_vulns, dkim_recs)
+            else:
+                console.print("[green]No DKIM issues found[/green]")
+        elif dkim_vulns or dkim_recs:
             print_results_table(f"DKIM Analysis ({args.dkim_selector})", dkim_vulns, dkim_recs)
         else:
             console.print(f"[yellow]No DKIM records found for selector: {args.dkim_selector}[/yellow]")
@@ -95,15 +556,24 @@ def main():
             console.print("[green]No additional security issues found[/green]")
 
         # Rapor oluştur
-        if args.format in ['json', 'csv']:
-            create_report(args.domain, spf_vulns, dmarc_vulns, dkim_vulns, args.format)
+        if args.format != 'text':
+            create_report(args.domain, spf_vulns, dmarc_vulns, dkim_vulns, args.format, report=report)
             console.print(f"\n[green]Report saved in {args.format} format[/green]")
 
         console.print("\n=== Audit Complete ===", style="cyan bold")
 
     except Exception as e:
-        console.print(f"\nError during scan: {str(e)}", style="bold red")
+        if args is not None and args.quiet:
+            print(f"Error during scan: {str(e)}", file=sys.stderr)
+        else:
+            console.print(f"\nError during scan: {str(e)}", style="bold red")
         sys.exit(1)
+    finally:
+        close_cache()
+        tracer = get_tracer()
+        if tracer.enabled and args.profile:
+            print_profile(tracer.summary())
+        tracer.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""Concurrent HTTPS fetching of MTA-STS policies (RFC 8461), cached per policy id and max_age"""
+
+import asyncio
+import ssl
+import time
+from .cache import get_cache
+from .config import (
+    MTA_STS_PORT,
+    MTA_STS_TIMEOUT,
+    MTA_STS_MAX_CONCURRENCY,
+    MTA_STS_MAX_POLICY_SIZE
+)
+from .records import parse_mta_sts_policy
+from .tls import TLSResult
+from .tracing import span
+
+POLICY_PATH = '/.well-known/mta-sts.txt'
+
+def policy_host(domain):
+    return f"mta-sts.{domain}"
+
+def mx_matches(pattern, host):
+    """Whether MX ``host`` matches a policy ``mx`` pattern (``*.`` covers exactly one label)."""
+    pattern = pattern.lower().rstrip('.')
+    host = host.lower().rstrip('.')
+    if pattern.startswith('*.'):
+        label, _, parent = host.partition('.')
+        return bool(label) and parent == pattern[2:]
+    return host == pattern
+
+class PolicyResult:
+    """The policy served for one domain and policy id, or why it could not be fetched.
+
+    ``tls`` is the :class:`~dmarc_audit.tls.TLSResult` of the connection the
+    policy came over, so the policy host's certificate is inspected without
+    a second handshake.
+    """
+
+    __slots__ = ('domain', 'policy_id', 'text', 'error', 'fetched_at', 'tls')
+
+    def __init__(self, domain, policy_id, text=None, error=None, fetched_at=None, tls=None):
+        self.domain = domain
+        self.policy_id = policy_id
+        self.text = text
+        self.error = error
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.tls = tls
+
+    @property
+    def policy(self):
+        """The parsed :class:`~dmarc_audit.records.MTASTSPolicy`, or ``None`` on error."""
+        return None if self.text is None else parse_mta_sts_policy(self.text)
+
+    def fresh(self, policy_id, now=None):
+        """Whether this result can stand in for ``policy_id`` (same id, within ``max_age``)."""
+        if self.policy_id != policy_id or self.error is not None:
+            return False
+        max_age = self.policy.max_age or 0
+        return (now or time.time()) - self.fetched_at < max_age
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['tls'] = self.tls.to_dict() if self.tls is not None else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if data.get('tls') is not None:
+            data['tls'] = TLSResult.from_dict(data['tls'])
+        return cls(**data)
+
+class _HTTPError(Exception):
+    pass
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b""
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b"0", 16)
+            if size == 0:
+                return body
+            # Checked before reading: the server chooses the chunk size.
+            if size > MTA_STS_MAX_POLICY_SIZE - len(body):
+                raise _HTTPError("policy too large")
+            body += await reader.readexactly(size)
+            await reader.readline()
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        if length > MTA_STS_MAX_POLICY_SIZE:
+            raise _HTTPError("policy too large")
+        return await reader.readexactly(length)
+    # Neither framing: the body runs until the server closes the connection.
+    body = b""
+    while True:
+        data = await reader.read(MTA_STS_MAX_POLICY_SIZE + 1 - len(body))
+        if not data:
+            return body
+        body += data
+        if len(body) > MTA_STS_MAX_POLICY_SIZE:
+            raise _HTTPError("policy too large")
+
+class PolicyFetcher:
+    """Fetch ``https://mta-sts.<domain>/.well-known/mta-sts.txt`` for many domains at once.
+
+    At most ``max_concurrency`` requests are in flight.  A policy is kept
+    per domain together with the TXT ``id`` it was fetched for and reused
+    while that id is unchanged and the policy's ``max_age`` has not passed,
+    both in memory and in the persistent cache (``store``, else the
+    process-wide one).  Redirects are not followed and the certificate
+    must be valid for the policy host, as RFC 8461 requires.
+    ``connect_host`` sends every request to that address instead of the
+    policy host (for local stand-ins).
+
+    The HTTP/1.1 client is only as large as a policy fetch needs: one
+    ``GET`` per connection with ``Connection: close``, a status line and
+    headers without obsolete line folding, and a body framed by
+    ``Content-Length``, chunked transfer coding (extensions and trailers
+    ignored) or the end of the connection.  Bodies over
+    ``MTA_STS_MAX_POLICY_SIZE`` are refused however they are framed.
+    """
+
+    def __init__(self, port=MTA_STS_PORT, timeout=MTA_STS_TIMEOUT, max_concurrency=MTA_STS_MAX_CONCURRENCY,
+                 ssl_context=None, store=None, connect_host=None):
+        self.port = port
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.store = store
+        self.connect_host = connect_host
+        self.requests = 0
+        self._results = {}
+        self._pending = {}
+        self._loop = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = {}
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return loop
+
+    async def fetch(self, domain, policy_id):
+        """Return the :class:`PolicyResult` of ``domain`` for TXT ``policy_id``."""
+        domain = domain.lower().rstrip('.')
+        with span('mta_sts.fetch', domain=domain) as trace:
+            result = self._results.get(domain)
+            if result is not None and result.fresh(policy_id):
+                trace.set(cache='hit')
+                return result
+            self._bind_loop()
+            key = (domain, policy_id)
+            task = self._pending.get(key)
+            if task is None:
+                trace.set(cache='miss')
+                task = asyncio.ensure_future(self._fetch_cached(domain, policy_id))
+                self._pending[key] = task
+            else:
+                trace.set(cache='coalesced')
+            result = await asyncio.shield(task)
+            self._results[domain] = result
+            self._pending.pop(key, None)
+            if result.error is not None:
+                trace.set(status='error')
+            return result
+
+    async def _fetch_cached(self, domain, policy_id):
+        store = self.store if self.store is not None else get_cache()
+        if store is not None:
+            cached = store.get_probe(domain, 'MTA-STS')
+            if cached is not None:
+                result = PolicyResult.from_dict(cached)
+                if result.fresh(policy_id):
+                    return result
+        result = await self._fetch(domain, policy_id)
+        if store is not None and result.error is None and result.policy.max_age:
+            store.put_probe(domain, 'MTA-STS', result.to_dict(), ttl=result.policy.max_age)
+        return result
+
+    async def _fetch(self, domain, policy_id):
+        async with self._semaphore:
+            try:
+                text, tls = await asyncio.wait_for(self._get(policy_host(domain)), self.timeout)
+            except asyncio.TimeoutError:
+                return PolicyResult(domain, policy_id, error="Timed out")
+            except (OSError, ConnectionError, ssl.SSLError, asyncio.IncompleteReadError, ValueError,
+                    _HTTPError) as e:
+                return PolicyResult(domain, policy_id, error=str(e) or e.__class__.__name__)
+        return PolicyResult(domain, policy_id, text, tls=tls)
+
+    async def _get(self, host):
+        reader, writer = await asyncio.open_connection(
+            self.connect_host or host, self.port, ssl=self.ssl_context, server_hostname=host
+        )
+        self.requests += 1
+        tls = TLSResult.from_connection(host, self.port, writer.get_extra_info('ssl_object'),
+                                        verified=self.ssl_context.verify_mode != ssl.CERT_NONE)
+        try:
+            writer.write(
+                f"GET {POLICY_PATH} HTTP/1.1\r\nHost: {host}\r\nAccept: text/plain\r\n"
+                f"User-Agent: dmarc-audit\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status_line = (await reader.readline()).decode('latin-1').split(' ', 2)
+            if len(status_line) < 2 or not status_line[1].isdigit():
+                raise _HTTPError("invalid HTTP response")
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            status = int(status_line[1])
+            if status != 200:
+                # RFC 8461 3.3: redirects must not be followed.
+                raise _HTTPError(f"HTTP {status}")
+            content_type = headers.get('content-type', '').split(';', 1)[0].strip().lower()
+            if content_type != 'text/plain':
+                raise _HTTPError(f"policy served as {content_type or 'unknown type'}, expected text/plain")
+            return (await _read_body(reader, headers)).decode('utf-8', errors='replace'), tls
+        finally:
+            writer.close()
@@ -0,0 +1,135 @@
+"""Multi-process and multi-machine sharding of bulk audits"""
+
+import zlib
+from .config import DEFAULT_CONCURRENCY, DEFAULT_DKIM_SELECTOR, RESULT_QUEUE_SIZE
+from .logger import logger, logger_options, setup_logger
+
+def shard_of(domain, count):
+    """Stable shard number of ``domain`` in ``range(count)`` (the same on every machine)."""
+    return zlib.crc32(domain.encode()) % count
+
+def parse_shard(value):
+    """Parse ``INDEX/COUNT`` (0-based, e.g. ``0/4``) into ``(index, count)``."""
+    index, separator, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}: expected INDEX/COUNT such as 0/4")
+    if not separator or count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}: INDEX must be in 0..COUNT-1")
+    return index, count
+
+def select_shard(domains, index, count, worker=0, workers=1):
+    """Yield the domains of machine shard ``index`` and, within it, of process ``worker``.
+
+    Both splits come from one CRC32 so each domain lands in exactly one
+    (shard, worker) slot however the list is ordered.
+    """
+    for domain in domains:
+        slot = zlib.crc32(domain.encode())
+        if slot % count == index and (slot // count) % workers == worker:
+            yield domain
+
+class _PostureQueue:
+    # Stands in for a Portfolio in a worker: each posture goes to the parent
+    # ahead of its domain's report.
+    def __init__(self, results):
+        self.results = results
+
+    def add(self, posture):
+        self.results.put(posture)
+
+def _worker_main(path, shard, worker, workers, options, results):
+    # Imported here: each spawned process builds its own resolver, cache and loop.
+    import asyncio
+    from .async_analyzer import audit_domains
+    from .cache import close_cache, open_cache
+    from .resolver import CachingResolver, set_resolver
+    from .utils import read_domains
+
+    # A spawned process starts with the logger unconfigured: without this,
+    # every line logged here (failures included) would be dropped.
+    if options['logging'] is not None:
+        setup_logger(**options['logging'])
+    try:
+        set_resolver(CachingResolver(options['resolvers'], **options['resolver']))
+        if options['cache_dir']:
+            open_cache(options['cache_dir'], max_age=options['max_age'])
+        portfolio = _PostureQueue(results) if options['portfolio'] else None
+        skip = options['skip']
+
+        async def run():
+            domains = select_shard(read_domains(path), shard[0], shard[1], worker, workers)
+            if skip:
+                domains = (domain for domain in domains if domain not in skip)
+            async for item in audit_domains(domains, options['dkim_selector'], options['concurrency'],
+                                            dkim_selectors=options['dkim_selectors'], portfolio=portfolio):
+                # Blocks when the parent's writer falls behind: that is the backpressure.
+                results.put(item)
+
+        asyncio.run(run())
+    except Exception as e:
+        logger.error(f"Audit worker {worker} failed: {str(e)}")
+    finally:
+        close_cache()
+        results.put(None)
+
+def audit_parallel(path, workers, shard=(0, 1), dkim_selector=DEFAULT_DKIM_SELECTOR,
+                   concurrency=DEFAULT_CONCURRENCY, dkim_selectors=None, resolvers=None,
+                   resolver_options=None, cache_dir=None, max_age=None, portfolio=None, skip=frozenset()):
+    """Audit the domains in ``path`` across ``workers`` processes.
+
+    Each process reads the file itself, keeps its slice (see
+    :func:`select_shard`) and runs :func:`~dmarc_audit.async_analyzer.audit_domains`
+    with ``concurrency`` domains in flight.  Yields ``(domain, report)``
+    pairs as they arrive over a bounded queue, so one writer in this
+    process can stream them.  With a ``portfolio``, each domain's posture
+    is sent back too and added to it here.  Domains in ``skip`` (e.g.
+    finished in an earlier run) are left out.
+    """
+    import multiprocessing
+    import queue
+    from .portfolio import Posture
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue(maxsize=RESULT_QUEUE_SIZE)
+    options = {
+        'resolvers': resolvers,
+        'resolver': resolver_options or {},
+        'cache_dir': cache_dir,
+        'max_age': max_age,
+        'dkim_selector': dkim_selector,
+        'dkim_selectors': dkim_selectors,
+        'concurrency': concurrency,
+        'portfolio': portfolio is not None,
+        'skip': frozenset(skip),
+        'logging': logger_options()
+    }
+    processes = [
+        context.Process(target=_worker_main, args=(path, shard, worker, workers, options, results), daemon=True)
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        remaining = workers
+        while remaining:
+            try:
+                item = results.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    logger.error("Audit workers exited without finishing")
+                    break
+                continue
+            if item is None:
+                remaining -= 1
+                continue
+            if isinstance(item, Posture):
+                portfolio.add(item)
+                continue
+            yield item
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -0,0 +1,232 @@
+"""Mail provider index: classify MX hosts, SPF includes and DKIM keys by provider"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from .config import PROVIDERS
+from .dkim import load_dkim_key
+from .records import parse_dkim, parse_spf
+
+class SuffixTrie:
+    """Domain-name suffixes mapped to values, matched label by label from the right.
+
+    :meth:`match` costs one dict step per label of the name, however many
+    suffixes are stored, and ``mail.google.com`` matches ``google.com`` but
+    ``notgoogle.com`` does not.
+    """
+
+    __slots__ = ('_root', 'size')
+
+    # Key of a node's value; labels are never empty, so it cannot collide.
+    _VALUE = ''
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, suffix, value):
+        node = self._root
+        for label in reversed(suffix.lower().rstrip('.').split('.')):
+            node = node.setdefault(label, {})
+        if self._VALUE not in node:
+            self.size += 1
+        node[self._VALUE] = value
+
+    def match(self, name):
+        """The value of the longest stored suffix of ``name``, or ``None``."""
+        node = self._root
+        found = None
+        for label in reversed(name.lower().rstrip('.').split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(self._VALUE, found)
+        return found
+
+@dataclass
+class Provider:
+    __slots__ = ('id', 'name', 'mx', 'spf', 'dkim_selectors', 'dkim_keys', 'shared_mx', 'shared_spf', 'ptr')
+    id: str
+    name: str
+    mx: Tuple[str, ...]
+    spf: Tuple[str, ...]
+    dkim_selectors: Tuple[str, ...]
+    dkim_keys: Tuple[str, ...]
+    shared_mx: Tuple[str, ...]
+    shared_spf: Tuple[str, ...]
+    ptr: Tuple[str, ...]
+
+@dataclass
+class Infrastructure:
+    """Provider ids recognized in a domain's MX hosts, SPF includes and DKIM keys."""
+    mx: List[str] = field(default_factory=list)
+    spf: List[str] = field(default_factory=list)
+    dkim: List[str] = field(default_factory=list)
+
+    @property
+    def providers(self):
+        return list(dict.fromkeys(self.mx + self.spf + self.dkim))
+
+    def to_dict(self):
+        return {'mx': list(self.mx), 'spf': list(self.spf), 'dkim': list(self.dkim)}
+
+class ProviderIndex:
+    """Lookup tables built once from a ``{id: settings}`` mapping shaped like :data:`~dmarc_audit.config.PROVIDERS`."""
+
+    def __init__(self, providers=PROVIDERS):
+        self.providers = {}
+        self._mx = SuffixTrie()
+        self._spf = SuffixTrie()
+        self._fleets = SuffixTrie()
+        self._ptr = SuffixTrie()
+        self._selectors = {}
+        self._keys = {}
+        self._shared_spf = {}
+        for provider_id, settings in providers.items():
+            provider = Provider(
+                provider_id,
+                settings.get('name', provider_id),
+                tuple(settings.get('mx', ())),
+                tuple(settings.get('spf', ())),
+                tuple(settings.get('dkim_selectors', ())),
+                tuple(settings.get('dkim_keys', ())),
+                tuple(settings.get('shared_mx', ())),
+                tuple(settings.get('shared_spf', ())),
+                tuple(settings.get('ptr', ()))
+            )
+            self.providers[provider_id] = provider
+            for suffix in provider.mx:
+                self._mx.add(suffix, provider)
+            for suffix in provider.spf:
+                self._spf.add(suffix, provider)
+            for suffix in provider.ptr:
+                self._ptr.add(suffix, provider)
+            for suffix in provider.shared_mx:
+                self._fleets.add(suffix, suffix.lower().rstrip('.'))
+            for selector in provider.dkim_selectors:
+                self._selectors.setdefault(selector.lower(), provider)
+            for fingerprint in provider.dkim_keys:
+                self._keys[fingerprint.lower()] = provider
+            for target in provider.shared_spf:
+                self._shared_spf[target.lower().rstrip('.')] = provider
+
+    def match_mx(self, host) -> Optional[Provider]:
+        return self._mx.match(host)
+
+    def match_ptr(self, names) -> Optional[Provider]:
+        """The provider whose mail servers the reverse DNS ``names`` of a host belong to."""
+        for name in names:
+            provider = self._ptr.match(name)
+            if provider is not None:
+                return provider
+        return None
+
+    def mx_fleet(self, host) -> Optional[str]:
+        """The ``shared_mx`` suffix of the fleet that serves ``host``, if any.
+
+        Names under the same fleet suffix are served by the same servers;
+        other MX hosts of the same provider (``smtp.google.com``) are not.
+        """
+        return self._fleets.match(host)
+
+    def match_spf(self, target) -> Optional[Provider]:
+        return self._spf.match(target)
+
+    def match_dkim(self, selector, fingerprint=None) -> Optional[Provider]:
+        """A key fingerprint identifies its provider; a selector name only suggests one."""
+        if fingerprint is not None and fingerprint.lower() in self._keys:
+            return self._keys[fingerprint.lower()]
+        return self._selectors.get(selector.lower())
+
+    def shared_spf(self, target) -> Optional[Provider]:
+        """The provider whose whole shared sending pool ``include:target`` authorizes, if any.
+
+        Matched exactly: a customer-specific subdomain of the same provider
+        (``u123.wl.sendgrid.net``) authorizes only that customer's senders.
+        """
+        return self._shared_spf.get(target.lower().rstrip('.'))
+
+    def classify(self, mx_hosts=(), spf_targets=(), dkim_keys=(), ptr_names=None):
+        """:class:`Infrastructure` of MX hostnames, SPF include/redirect targets and
+        ``(selector, fingerprint)`` DKIM keys.
+
+        ``ptr_names`` maps MX hosts to their reverse DNS names, which identify
+        the hosts whose own names match no provider.
+        """
+        ptr_names = ptr_names or {}
+
+        def ids(providers):
+            return list(dict.fromkeys(provider.id for provider in providers if provider is not None))
+        return Infrastructure(
+            mx=ids(self.match_mx(host) or self.match_ptr(ptr_names.get(host, ())) for host in mx_hosts),
+            spf=ids(map(self.match_spf, spf_targets)),
+            dkim=ids(self.match_dkim(selector, fingerprint) for selector, fingerprint in dkim_keys)
+        )
+
+def _spf_targets(tree):
+    # SPFResult.tree maps "include:x" / "redirect=x" terms to their subtrees.
+    for term, subtree in tree.items():
+        yield term.partition(':' if term.startswith('include:') else '=')[2]
+        yield from _spf_targets(subtree)
+
+async def afetch_mx_ptr(context, index=None):
+    """Look up the reverse DNS names of the domain's MX hosts that no provider's MX suffix matches.
+
+    Memoized in ``context`` for :func:`classify_domain`.  Hosts of a known
+    provider (every tenant's ``*.mail.protection.outlook.com``) are already
+    classified by name and are not looked up.
+    """
+    index = index or get_provider_index()
+    hosts = [host for host in await context.amx_hosts() if index.match_mx(host) is None]
+    await asyncio.gather(*(context.aptr_names(host) for host in hosts))
+
+def classify_domain(context, spf_evaluation=None, index=None):
+    """:class:`Infrastructure` of an audited domain, from its
+    :class:`~dmarc_audit.context.AuditContext`'s memoized answers (nothing is fetched).
+
+    With ``spf_evaluation`` (an :class:`~dmarc_audit.analyzer.SPFResult`)
+    nested includes count too, not only the domain's own record.  MX hosts
+    are also matched by the reverse DNS names :func:`afetch_mx_ptr` fetched.
+    """
+    # Imported here: the resolver imports the rate limiter, which imports this module.
+    from .resolver import mx_hosts, txt_value
+
+    index = index or get_provider_index()
+    domain = context.domain
+    mx = context.fetched_answer(domain, 'MX')
+    if spf_evaluation is not None and spf_evaluation.tree:
+        targets = list(_spf_targets(spf_evaluation.tree))
+    else:
+        txt = context.fetched_answer(domain, 'TXT')
+        records = [r for r in map(txt_value, txt.records if txt is not None else ()) if "v=spf1" in r.lower()]
+        targets = []
+        if len(records) == 1:
+            spf = parse_spf(records[0])
+            targets = [m.value for m in spf.named('include')] + ([spf.redirect] if spf.redirect else [])
+    suffix = f"._domainkey.{domain}"
+    keys = []
+    for name, record_type in context.dns_keys():
+        if record_type == 'TXT' and name.endswith(suffix):
+            answer = context.fetched_answer(name, record_type)
+            if answer.records:
+                dkim = parse_dkim(txt_value(answer.records[0]))
+                key = load_dkim_key(dkim.key_type, dkim.public_key) if dkim.public_key else None
+                keys.append((name[:-len(suffix)], key.fingerprint if key is not None else None))
+    hosts = mx_hosts(mx.records) if mx is not None else []
+    ptr_names = {host: context.fetched_ptr_names(host) or () for host in hosts}
+    return index.classify(hosts, targets, keys, ptr_names)
+
+_default_index = None
+
+def get_provider_index():
+    """Return the process-wide index built from :data:`~dmarc_audit.config.PROVIDERS`."""
+    global _default_index
+    if _default_index is None:
+        _default_index = ProviderIndex()
+    return _default_index
+
+def set_provider_index(index):
+    """Replace the process-wide index (e.g. with more providers)."""
+    global _default_index
+    _default_index = index
+    return index
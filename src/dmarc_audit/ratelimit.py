@@ -0,0 +1,255 @@
+"""Adaptive rate limiting of DNS queries and outbound connections"""
+
+import asyncio
+import ipaddress
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from .config import (
+    RATE_LIMITS,
+    RATE_LIMIT_MIN_FACTOR,
+    RATE_LIMIT_MAX_FACTOR,
+    RATE_LIMIT_INCREASE,
+    RATE_LIMIT_DECREASE,
+    RATE_LIMIT_BACKOFF,
+    RATE_LIMIT_MAX_BACKOFF,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_IPV4_PREFIX,
+    RATE_LIMIT_IPV6_PREFIX
+)
+from .logger import logger
+from .providers import get_provider_index
+from .tracing import current_span
+
+# Second-level labels under which registrations happen one level deeper
+# (example.co.uk, example.com.au).
+_SECOND_LEVEL = frozenset(('ac', 'co', 'com', 'edu', 'gov', 'ne', 'net', 'or', 'org'))
+
+class Throttled(Exception):
+    """Raised by scheduled work when the remote side signalled it is being overloaded."""
+
+def provider_of(host):
+    """The registered domain of ``host``, used to group MX hosts of one mail provider."""
+    labels = host.lower().rstrip('.').split('.')
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+def network_of(address):
+    """The ``/24`` (IPv4) or ``/48`` (IPv6) network of ``address``, or ``None``."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except (TypeError, ValueError):
+        return None
+    prefix = RATE_LIMIT_IPV6_PREFIX if ip.version == 6 else RATE_LIMIT_IPV4_PREFIX
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+def destination_keys(host, address=None):
+    """Bucket keys of a connection to ``host`` at ``address``: host, network and provider."""
+    host = host.lower().rstrip('.')
+    keys = [('host', host)]
+    network = network_of(address or host)
+    if network is not None:
+        keys.append(('network', network))
+    if network_of(host) is None:
+        # Known providers group all their MX domains (google.com and googlemail.com).
+        provider = get_provider_index().match_mx(host)
+        keys.append(('provider', provider.id if provider is not None else provider_of(host)))
+    return keys
+
+async def resolve_address(host, port):
+    """First stream address of ``host`` from the system resolver, or ``None`` if it has none."""
+    if network_of(host) is not None:
+        return host
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return None
+    return infos[0][4][0] if infos else None
+
+class TokenBucket:
+    """Token bucket whose rate adapts to throttling (AIMD) and that can be paused.
+
+    :meth:`reserve` takes a token and returns how long the caller must wait
+    for it, so waiters are served in order without a loop-bound primitive
+    (the bucket is shared by threads and event loops).  Every success adds
+    ``increase`` to the rate up to ``max_rate``; a throttling signal multiplies
+    it by ``decrease`` down to ``min_rate`` and pauses the bucket for an
+    exponentially growing, jittered backoff.
+    """
+
+    def __init__(self, rate, burst, min_rate=None, max_rate=None, increase=None, decrease=RATE_LIMIT_DECREASE,
+                 backoff=RATE_LIMIT_BACKOFF, max_backoff=RATE_LIMIT_MAX_BACKOFF, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate * RATE_LIMIT_MIN_FACTOR
+        self.max_rate = max_rate if max_rate is not None else rate * RATE_LIMIT_MAX_FACTOR
+        self.increase = increase if increase is not None else rate * RATE_LIMIT_INCREASE
+        self.decrease = decrease
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; return the seconds until it may be used."""
+        with self._lock:
+            now = self.clock()
+            if now > self.updated:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            paused = self.updated - now
+            return paused + (-self.tokens / self.rate if self.tokens < 0 else 0.0)
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        """Slow down and pause; return the seconds until the bucket resumes.
+
+        Signals arriving while the bucket is already paused belong to the
+        same episode (work sent before the pause) and change nothing.
+        """
+        with self._lock:
+            now = self.clock()
+            if self.updated > now:
+                return self.updated - now
+            self.failures += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            backoff = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1)) * random.uniform(0.5, 1.0)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now + backoff
+            return backoff
+
+class Scheduler:
+    """Token-bucket limits per DNS upstream and per destination host, network and provider.
+
+    Work names the buckets it draws from (``[('host', name), ...]``, see
+    :func:`destination_keys`) and waits until every one of them has a token.
+    :meth:`run` retries work that raised :class:`Throttled` after the
+    buckets' backoff, up to ``max_retries`` times, so throttled probes are
+    deferred rather than reported.  ``limits`` maps a bucket kind to its
+    starting ``(rate, burst)``; kinds without an entry are not limited.  The
+    least recently used buckets are dropped beyond ``max_keys``.  Limits
+    are per process.
+    """
+
+    def __init__(self, limits=None, max_keys=RATE_LIMIT_MAX_KEYS, max_retries=RATE_LIMIT_MAX_RETRIES,
+                 clock=time.monotonic, **bucket_options):
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self.max_keys = max_keys
+        self.max_retries = max_retries
+        self.clock = clock
+        self.bucket_options = bucket_options
+        self.waited = 0.0
+        self.throttles = 0
+        self.deferred = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, kind, name):
+        """The bucket of ``(kind, name)``, or ``None`` if ``kind`` is not limited."""
+        if kind not in self.limits:
+            return None
+        key = (kind, name)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = self.limits[kind]
+                bucket = self._buckets[key] = TokenBucket(rate, burst, clock=self.clock, **self.bucket_options)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def _buckets_of(self, keys):
+        return [bucket for bucket in (self.bucket(*key) for key in keys) if bucket is not None]
+
+    def delay(self, keys):
+        """Take a token from every bucket of ``keys``; return the seconds to wait."""
+        wait = max((bucket.reserve() for bucket in self._buckets_of(keys)), default=0.0)
+        if wait > 0:
+            self.waited += wait
+            current_span().incr('rate_limited')
+        return wait
+
+    async def acquire(self, keys):
+        wait = self.delay(keys)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, keys):
+        wait = self.delay(keys)
+        if wait > 0:
+            time.sleep(wait)
+
+    def succeeded(self, keys):
+        for bucket in self._buckets_of(keys):
+            bucket.succeeded()
+
+    def throttled(self, keys):
+        self.throttles += 1
+        current_span().incr('throttled')
+        backoff = max((bucket.throttled() for bucket in self._buckets_of(keys)), default=0.0)
+        logger.debug(f"Throttled by {', '.join(name for _, name in keys)}; backing off {backoff:.1f}s")
+
+    def defer(self):
+        """Count work put back in the queue after a throttling signal."""
+        self.deferred += 1
+        current_span().incr('deferred')
+
+    async def run(self, keys, attempt):
+        """Await ``attempt()`` within the limits of ``keys``, deferring it while it raises :class:`Throttled`."""
+        for retry in range(self.max_retries + 1):
+            await self.acquire(keys)
+            try:
+                result = await attempt()
+            except Throttled:
+                self.throttled(keys)
+                if retry == self.max_retries:
+                    raise
+                self.defer()
+                continue
+            self.succeeded(keys)
+            return result
+
+    def stats(self):
+        with self._lock:
+            buckets = list(self._buckets.items())
+        slowed = {f"{kind}:{name}": round(bucket.rate, 2) for (kind, name), bucket in buckets
+                  if bucket.rate < self.limits[kind][0]}
+        return {
+            'buckets': len(buckets),
+            'waited_s': round(self.waited, 3),
+            'throttled': self.throttles,
+            'deferred': self.deferred,
+            'slowed': slowed
+        }
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler shared by the resolver, prober and TLS inspector."""
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = Scheduler()
+    return _default_scheduler
+
+def set_scheduler(scheduler):
+    """Replace the process-wide scheduler (e.g. with different limits)."""
+    global _default_scheduler
+    _default_scheduler = scheduler
+    return scheduler
@@ -0,0 +1,286 @@
+"""Single-pass parsers turning SPF, DMARC, DKIM and MTA-STS records into structured objects"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from .config import RECORD_PARSE_CACHE_SIZE, MTA_STS_MAX_AGE_LIMIT
+from .findings import Message
+
+SPF_MECHANISMS = ('all', 'include', 'a', 'mx', 'ptr', 'ip4', 'ip6', 'exists')
+SPF_LOOKUP_MECHANISMS = ('include', 'a', 'mx', 'ptr', 'exists')
+SPF_QUALIFIERS = '+-~?'
+
+DKIM_KEY_TYPES = ('rsa', 'ed25519')
+
+DMARC_POLICIES = ('none', 'quarantine', 'reject')
+DMARC_ALIGNMENT_MODES = ('r', 's')
+
+MTA_STS_MODES = ('enforce', 'testing', 'none')
+
+@dataclass
+class SPFMechanism:
+    __slots__ = ('qualifier', 'name', 'value')
+    qualifier: str
+    name: str
+    value: str
+
+    def split_cidr(self, default_domain):
+        """Split ``domain/24//64`` into the target domain and IPv4/IPv6 prefix lengths."""
+        target, _, cidrs = self.value.partition('/')
+        ip4_cidr, _, ip6_cidr = cidrs.partition('//')
+        if cidrs.startswith('/'):
+            ip4_cidr, ip6_cidr = '', cidrs[1:]
+        return (target or default_domain).lower().rstrip('.'), ip4_cidr or '32', ip6_cidr or '128'
+
+@dataclass
+class SPFRecord:
+    __slots__ = ('raw', 'mechanisms', 'modifiers', 'errors')
+    raw: str
+    mechanisms: Tuple[SPFMechanism, ...]
+    modifiers: Dict[str, str]
+    errors: Tuple[str, ...]
+
+    def named(self, name):
+        return [m for m in self.mechanisms if m.name == name]
+
+    def has(self, name):
+        return any(m.name == name for m in self.mechanisms)
+
+    @property
+    def all_qualifier(self):
+        """Qualifier of the ``all`` mechanism, or ``None`` when there is none."""
+        for mechanism in self.mechanisms:
+            if mechanism.name == 'all':
+                return mechanism.qualifier
+        return None
+
+    @property
+    def redirect(self):
+        # RFC 7208 section 6.1: redirect is ignored when "all" is present.
+        return None if self.has('all') else self.modifiers.get('redirect')
+
+    def lookup_count(self):
+        """DNS lookups this record needs on its own, without following includes."""
+        count = sum(1 for m in self.mechanisms if m.name in SPF_LOOKUP_MECHANISMS)
+        return count + (1 if self.redirect else 0)
+
+@dataclass
+class DMARCRecord:
+    __slots__ = ('raw', 'tags', 'policy', 'subdomain_policy', 'pct', 'rua', 'ruf',
+                 'adkim', 'aspf', 'errors')
+    raw: str
+    tags: Dict[str, str]
+    policy: Optional[str]
+    subdomain_policy: Optional[str]
+    pct: Optional[int]
+    rua: Tuple[str, ...]
+    ruf: Tuple[str, ...]
+    adkim: Optional[str]
+    aspf: Optional[str]
+    errors: Tuple[str, ...]
+
+@dataclass
+class DKIMRecord:
+    __slots__ = ('raw', 'tags', 'key_type', 'public_key', 'errors')
+    raw: str
+    tags: Dict[str, str]
+    key_type: str
+    public_key: Optional[str]
+    errors: Tuple[str, ...]
+
+@dataclass
+class MTASTSRecord:
+    __slots__ = ('raw', 'tags', 'id', 'errors')
+    raw: str
+    tags: Dict[str, str]
+    id: Optional[str]
+    errors: Tuple[str, ...]
+
+@dataclass
+class MTASTSPolicy:
+    __slots__ = ('raw', 'version', 'mode', 'mx', 'max_age', 'errors')
+    raw: str
+    version: Optional[str]
+    mode: Optional[str]
+    mx: Tuple[str, ...]
+    max_age: Optional[int]
+    errors: Tuple[str, ...]
+
+@lru_cache(maxsize=RECORD_PARSE_CACHE_SIZE)
+def parse_spf(record):
+    """Parse an SPF record (``v=spf1 ...``) into an :class:`SPFRecord`."""
+    mechanisms = []
+    modifiers = {}
+    errors = []
+    for token in record.split()[1:]:
+        first = token[0]
+        qualifier = '+'
+        if first in SPF_QUALIFIERS:
+            qualifier, token = first, token[1:]
+            if not token:
+                errors.append(Message("spf.invalid-term", f"Invalid SPF term: {first}", term=first))
+                continue
+        # A modifier is "name=value" where name has no ":" or "/" before the "=".
+        end = len(token)
+        for i, char in enumerate(token):
+            if char in ':/=':
+                end = i
+                break
+        name = token[:end].lower()
+        separator = token[end:end + 1]
+        if separator == '=':
+            if first in SPF_QUALIFIERS:
+                errors.append(Message("spf.invalid-term", f"Invalid SPF term: {first}{token}", term=first + token))
+            elif name in modifiers:
+                errors.append(Message("spf.duplicate-modifier", f"Duplicate SPF modifier: {name}", modifier=name))
+            else:
+                modifiers[name] = token[end + 1:]
+            continue
+        value = token[end + 1:] if separator == ':' else token[end:]
+        if name not in SPF_MECHANISMS:
+            errors.append(Message("spf.unknown-mechanism", f"Unknown SPF mechanism: {name}", mechanism=name))
+            continue
+        mechanisms.append(SPFMechanism(qualifier, name, value))
+    return SPFRecord(record, tuple(mechanisms), modifiers, tuple(errors))
+
+def _uri_list(value):
+    return tuple(uri.strip() for uri in value.split(',') if uri.strip())
+
+@lru_cache(maxsize=RECORD_PARSE_CACHE_SIZE)
+def parse_dmarc(record):
+    """Parse a DMARC record (``v=DMARC1; ...``) into a :class:`DMARCRecord`."""
+    tags = {}
+    errors = []
+    for part in record.split(';'):
+        key, separator, value = part.partition('=')
+        key = key.strip().lower()
+        if not separator:
+            if key:
+                errors.append(Message("dmarc.invalid-tag", f"Invalid DMARC tag: {key}", tag=key))
+            continue
+        tags.setdefault(key, value.strip())
+
+    policy = tags.get('p', '').lower() or None
+    if policy is not None and policy not in DMARC_POLICIES:
+        errors.append(Message("dmarc.invalid-policy", f"Invalid DMARC policy: p={policy}", policy=policy))
+    subdomain_policy = tags.get('sp', '').lower() or None
+    if subdomain_policy is not None and subdomain_policy not in DMARC_POLICIES:
+        errors.append(Message(
+            "dmarc.invalid-subdomain-policy",
+            f"Invalid DMARC subdomain policy: sp={subdomain_policy}",
+            policy=subdomain_policy
+        ))
+    pct = None
+    if 'pct' in tags:
+        try:
+            pct = int(tags['pct'])
+            if not 0 <= pct <= 100:
+                raise ValueError
+        except ValueError:
+            errors.append(Message("dmarc.invalid-pct", f"Invalid DMARC pct value: {tags['pct']}", pct=tags['pct']))
+            pct = None
+    alignment = {}
+    for key in ('adkim', 'aspf'):
+        alignment[key] = tags.get(key, '').lower() or None
+        if alignment[key] is not None and alignment[key] not in DMARC_ALIGNMENT_MODES:
+            errors.append(Message("dmarc.invalid-alignment", f"Invalid DMARC alignment mode: {key}={alignment[key]}",
+                                  tag=key, value=alignment[key]))
+    return DMARCRecord(
+        record, tags, policy, subdomain_policy, pct,
+        _uri_list(tags.get('rua', '')), _uri_list(tags.get('ruf', '')),
+        alignment['adkim'], alignment['aspf'], tuple(errors)
+    )
+
+@lru_cache(maxsize=RECORD_PARSE_CACHE_SIZE)
+def parse_dkim(record):
+    """Parse a DKIM key record (``v=DKIM1; k=rsa; p=...``) into a :class:`DKIMRecord`.
+
+    Tag values keep their case, since ``p=`` is base64; whitespace inside
+    ``p=`` is removed as RFC 6376 allows folding there.
+    """
+    tags = {}
+    errors = []
+    for part in record.split(';'):
+        key, separator, value = part.partition('=')
+        key = key.strip().lower()
+        if not separator:
+            if key:
+                errors.append(Message("dkim.invalid-tag", f"Invalid DKIM tag: {key}", tag=key))
+            continue
+        tags.setdefault(key, value.strip())
+
+    version = tags.get('v')
+    if version is not None and version != 'DKIM1':
+        errors.append(Message("dkim.invalid-version", f"Invalid DKIM version: v={version}", version=version))
+    key_type = tags.get('k', 'rsa').lower()
+    public_key = tags.get('p')
+    if public_key is not None:
+        public_key = ''.join(public_key.split())
+    return DKIMRecord(record, tags, key_type, public_key, tuple(errors))
+
+@lru_cache(maxsize=RECORD_PARSE_CACHE_SIZE)
+def parse_mta_sts(record):
+    """Parse an MTA-STS TXT record (``v=STSv1; id=...``) into an :class:`MTASTSRecord`."""
+    tags = {}
+    errors = []
+    for part in record.split(';'):
+        key, separator, value = part.partition('=')
+        key = key.strip().lower()
+        if not separator:
+            if key:
+                errors.append(Message("mta_sts.invalid-record", f"Invalid MTA-STS tag: {key}", value=key))
+            continue
+        tags.setdefault(key, value.strip())
+
+    if tags.get('v') != 'STSv1':
+        errors.append(Message("mta_sts.invalid-record", f"Invalid MTA-STS version: v={tags.get('v', '')}",
+                              value=tags.get('v', '')))
+    policy_id = tags.get('id') or None
+    # RFC 8461 3.1: 1 to 32 alphanumeric characters.
+    if policy_id is None or len(policy_id) > 32 or not policy_id.isalnum() or not policy_id.isascii():
+        errors.append(Message("mta_sts.invalid-record", f"Invalid MTA-STS policy id: id={policy_id or ''}",
+                              value=policy_id or ''))
+        policy_id = None
+    return MTASTSRecord(record, tags, policy_id, tuple(errors))
+
+@lru_cache(maxsize=RECORD_PARSE_CACHE_SIZE)
+def parse_mta_sts_policy(text):
+    """Parse an MTA-STS policy file (``key: value`` lines) into an :class:`MTASTSPolicy`."""
+    fields = {}
+    mx = []
+    errors = []
+    for line in text.splitlines():
+        key, separator, value = line.partition(':')
+        key = key.strip().lower()
+        if not separator:
+            if key:
+                errors.append(Message("mta_sts.invalid-policy", f"Invalid MTA-STS policy line: {line.strip()}",
+                                      value=line.strip()))
+            continue
+        if key == 'mx':
+            mx.append(value.strip().lower().rstrip('.'))
+        else:
+            fields.setdefault(key, value.strip())
+
+    version = fields.get('version')
+    if version != 'STSv1':
+        errors.append(Message("mta_sts.invalid-policy", f"Invalid MTA-STS policy version: {version or 'missing'}",
+                              value=version or 'missing'))
+    mode = fields.get('mode', '').lower() or None
+    if mode not in MTA_STS_MODES:
+        errors.append(Message("mta_sts.invalid-policy", f"Invalid MTA-STS policy mode: {mode or 'missing'}",
+                              value=mode or 'missing'))
+    max_age = None
+    try:
+        max_age = int(fields['max_age'])
+        if not 0 <= max_age <= MTA_STS_MAX_AGE_LIMIT:
+            raise ValueError
+    except KeyError:
+        errors.append(Message("mta_sts.invalid-policy", "Invalid MTA-STS policy max_age: missing", value='missing'))
+    except ValueError:
+        errors.append(Message("mta_sts.invalid-policy", f"Invalid MTA-STS policy max_age: {fields['max_age']}",
+                              value=fields['max_age']))
+        max_age = None
+    if not mx and mode != 'none':
+        errors.append(Message("mta_sts.invalid-policy", "MTA-STS policy lists no mx patterns"))
+    return MTASTSPolicy(text, version, mode, tuple(mx), max_age, tuple(errors))
@@ -0,0 +1,433 @@
+"""Shared DNS resolver with an in-process, TTL-aware answer cache"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+import dns.asyncresolver
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+from .config import (
+    DNS_PORT,
+    DNS_TIMEOUT,
+    DNS_LIFETIME,
+    DNS_SERVERS,
+    DNS_HEDGE_DELAY,
+    DNS_HEALTH_ALPHA,
+    DNS_MAX_FAILURES,
+    DNS_DEMOTE_SECONDS,
+    DNS_CACHE_SIZE,
+    DNS_CACHE_MIN_TTL,
+    DNS_CACHE_MAX_TTL,
+    DNS_NEGATIVE_TTL,
+    RATE_LIMIT_MAX_RETRIES
+)
+from .cache import get_cache
+from .logger import logger
+from .ratelimit import get_scheduler
+from .tracing import current_span, span
+
+# status is one of NOERROR, NXDOMAIN, NODATA, TIMEOUT or ERROR.  Only the
+# first three are authoritative answers and therefore cacheable.
+DNSAnswer = namedtuple('DNSAnswer', ['records', 'ttl', 'status'])
+
+CACHEABLE_STATUSES = ('NOERROR', 'NXDOMAIN', 'NODATA')
+
+TXT_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+TXT_ESCAPE = re.compile(r'\\(\d{3}|.)')
+
+def cache_key(name, record_type):
+    return name.lower().rstrip('.'), record_type.upper()
+
+def txt_value(record):
+    """Join the quoted character-strings of a TXT rdata into its text value."""
+    strings = TXT_STRING.findall(record)
+    if not strings:
+        return record
+    return "".join(TXT_ESCAPE.sub(_unescape, string) for string in strings)
+
+def _unescape(match):
+    escaped = match.group(1)
+    return chr(int(escaped)) if escaped.isdigit() else escaped
+
+def mx_hosts(records):
+    """Return the exchange hostnames of ``10 mx.example.com.`` style records, by preference."""
+    parsed = []
+    for record in records:
+        parts = record.split()
+        if len(parts) == 2 and parts[0].isdigit():
+            parsed.append((int(parts[0]), parts[1].rstrip('.').lower()))
+    return [host for _, host in sorted(parsed) if host]
+
+def _negative_ttl(response, default):
+    """RFC 2308: negative answers live for min(SOA TTL, SOA MINIMUM)."""
+    if response is None:
+        return default
+    for rrset in response.authority:
+        if rrset.rdtype == dns.rdatatype.SOA and len(rrset):
+            return min(rrset.ttl, rrset[0].minimum)
+    return default
+
+class Upstream:
+    """One upstream nameserver with its own resolvers and health record.
+
+    ``latency`` is an exponentially weighted moving average of successful
+    query times.  After ``max_failures`` consecutive timeouts or errors the
+    upstream is demoted (tried last) for ``demote_seconds``.
+    """
+
+    def __init__(self, address, port, timeout, alpha=DNS_HEALTH_ALPHA,
+                 max_failures=DNS_MAX_FAILURES, demote_seconds=DNS_DEMOTE_SECONDS):
+        self.address = address
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.demote_seconds = demote_seconds
+        self.latency = None
+        self.queries = 0
+        self.errors = 0
+        self.failures = 0
+        self.demoted_until = 0.0
+        # One attempt per upstream: failover and hedging happen above us.
+        self.sync_resolver = self._configure(dns.resolver.Resolver(configure=False), port, timeout)
+        self.async_resolver = self._configure(dns.asyncresolver.Resolver(configure=False), port, timeout)
+
+    def _configure(self, resolver, port, timeout):
+        resolver.nameservers = [self.address]
+        resolver.port = port
+        resolver.timeout = timeout
+        resolver.lifetime = timeout
+        return resolver
+
+    @property
+    def healthy(self):
+        return self.demoted_until <= time.monotonic()
+
+    def succeeded(self, elapsed):
+        self.queries += 1
+        self.failures = 0
+        self.latency = elapsed if self.latency is None else (
+            self.alpha * elapsed + (1 - self.alpha) * self.latency
+        )
+
+    def failed(self):
+        self.queries += 1
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.demoted_until = time.monotonic() + self.demote_seconds
+            logger.warning(f"Demoting unhealthy DNS upstream {self.address} for {self.demote_seconds}s")
+
+    def stats(self):
+        return {
+            'queries': self.queries,
+            'errors': self.errors,
+            'latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+            'healthy': self.healthy
+        }
+
+class CachingResolver:
+    """Resolver shared by every check, caching positive and negative answers.
+
+    Entries are evicted least-recently-used once ``max_entries`` is reached
+    and expire after the record TTL (clamped to ``min_ttl``/``max_ttl``).
+    Concurrent async lookups of the same (name, type) share one query.
+    Misses fall back to the persistent cache (see :mod:`dmarc_audit.cache`)
+    before going to the network.
+
+    Upstreams are tried healthiest first, each for ``timeout`` seconds, until
+    one answers or ``lifetime`` runs out.  Async lookups are hedged: when the
+    current upstream has not answered after ``hedge_delay`` seconds the next
+    one is asked too and the first answer wins (``hedge_delay=0`` disables it).
+
+    Queries to each upstream are paced by its ``('resolver', address)``
+    bucket of ``scheduler`` (else the process-wide one); SERVFAIL and
+    REFUSED answers slow that upstream down and back it off.
+    """
+
+    def __init__(self, nameservers=None, timeout=DNS_TIMEOUT, lifetime=DNS_LIFETIME,
+                 max_entries=DNS_CACHE_SIZE, min_ttl=DNS_CACHE_MIN_TTL,
+                 max_ttl=DNS_CACHE_MAX_TTL, negative_ttl=DNS_NEGATIVE_TTL, store=None,
+                 port=DNS_PORT, hedge_delay=DNS_HEDGE_DELAY, scheduler=None):
+        self.nameservers = list(nameservers or DNS_SERVERS.values())
+        self.port = port
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.hedge_delay = hedge_delay
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.store = store
+        self.scheduler = scheduler
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.hedged = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.upstreams = [Upstream(address, port, timeout) for address in self.nameservers]
+
+    def _ranked_upstreams(self):
+        # Healthy upstreams first, fastest first; unmeasured ones keep their
+        # configured order ahead of measured ones so they get tried.
+        return sorted(self.upstreams, key=lambda u: (not u.healthy, u.latency or 0.0))
+
+    def _scheduler(self):
+        return self.scheduler if self.scheduler is not None else get_scheduler()
+
+    def _persistent_store(self):
+        return self.store if self.store is not None else get_cache()
+
+    def _get_cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                answer, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return answer
+                del self._cache[key]
+        store = self._persistent_store()
+        if store is None:
+            return None
+        entry = store.get(*key)
+        if entry is None:
+            return None
+        status, records, ttl = entry
+        answer = DNSAnswer(tuple(records), ttl, status)
+        self._remember(key, answer)
+        self.hits += 1
+        return answer
+
+    def _remember(self, key, answer):
+        ttl = max(self.min_ttl, min(answer.ttl, self.max_ttl))
+        with self._lock:
+            self._cache[key] = (answer, time.monotonic() + ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _store(self, key, answer):
+        if answer.status not in CACHEABLE_STATUSES:
+            return
+        self._remember(key, answer)
+        store = self._persistent_store()
+        if store is not None:
+            store.put(*key, answer.status, list(answer.records), answer.ttl)
+
+    def _answer_from_exception(self, name, record_type, error):
+        if isinstance(error, dns.resolver.NXDOMAIN):
+            logger.info(f"No DNS record found for {name} ({record_type})")
+            responses = list(error.kwargs.get('responses', {}).values())
+            response = responses[0] if responses else None
+            return DNSAnswer((), _negative_ttl(response, self.negative_ttl), 'NXDOMAIN')
+        if isinstance(error, dns.resolver.NoAnswer):
+            logger.info(f"No DNS record found for {name} ({record_type})")
+            response = error.kwargs.get('response')
+            return DNSAnswer((), _negative_ttl(response, self.negative_ttl), 'NODATA')
+        if isinstance(error, (dns.resolver.LifetimeTimeout, dns.exception.Timeout)):
+            logger.warning(f"DNS timeout while querying {name} ({record_type})")
+            return DNSAnswer((), 0, 'TIMEOUT')
+        logger.error(f"DNS lookup error for {name}: {str(error)}")
+        return DNSAnswer((), 0, 'ERROR')
+
+    @staticmethod
+    def _answer_from_response(answers):
+        ttl = max(0, int(answers.expiration - time.time()))
+        return DNSAnswer(tuple(str(rdata) for rdata in answers), ttl, 'NOERROR')
+
+    def _query(self, key):
+        """Ask upstreams one at a time until one answers; raises the last error."""
+        deadline = time.monotonic() + self.lifetime
+        error = None
+        for upstream in self._ranked_upstreams():
+            if time.monotonic() >= deadline:
+                break
+            limits = [('resolver', upstream.address)]
+            self._scheduler().acquire_sync(limits)
+            start = time.monotonic()
+            try:
+                answer = self._answer_from_response(upstream.sync_resolver.resolve(*key))
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+                answer = self._answer_from_exception(*key, e)
+            except Exception as e:
+                upstream.failed()
+                if isinstance(e, dns.resolver.NoNameservers):
+                    self._scheduler().throttled(limits)
+                current_span().incr('retries')
+                error = e
+                continue
+            upstream.succeeded(time.monotonic() - start)
+            self._scheduler().succeeded(limits)
+            return answer
+        raise error or dns.resolver.LifetimeTimeout(timeout=self.lifetime, errors=[])
+
+    async def _aquery_upstream(self, upstream, key):
+        limits = [('resolver', upstream.address)]
+        await self._scheduler().acquire(limits)
+        start = time.monotonic()
+        try:
+            answer = self._answer_from_response(await upstream.async_resolver.resolve(*key))
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            answer = self._answer_from_exception(*key, e)
+        except asyncio.CancelledError:
+            raise
+        except dns.resolver.NoNameservers:
+            # The upstream answered SERVFAIL or REFUSED: likely rate limiting us.
+            upstream.failed()
+            self._scheduler().throttled(limits)
+            raise
+        except Exception:
+            upstream.failed()
+            raise
+        upstream.succeeded(time.monotonic() - start)
+        self._scheduler().succeeded(limits)
+        return answer
+
+    async def _aquery(self, key):
+        """Async :meth:`_query`, hedging slow upstreams with the next one.
+
+        An upstream that throttled the query is queued again behind the
+        others (up to ``RATE_LIMIT_MAX_RETRIES`` times), to be retried once
+        its backoff has passed if the lifetime allows.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lifetime
+        candidates = deque(self._ranked_upstreams())
+        pending = {}
+        deferrals = 0
+        error = None
+
+        def launch():
+            if not candidates:
+                return False
+            upstream = candidates.popleft()
+            pending[asyncio.ensure_future(self._aquery_upstream(upstream, key))] = upstream
+            return True
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait = min(remaining, self.hedge_delay) if self.hedge_delay else remaining
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    upstream = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    if isinstance(error, dns.resolver.NoNameservers) and deferrals < RATE_LIMIT_MAX_RETRIES:
+                        deferrals += 1
+                        candidates.append(upstream)
+                        self._scheduler().defer()
+                if done:
+                    # Failed outright: move on to the next upstream now.
+                    if not pending and launch():
+                        current_span().incr('retries')
+                elif self.hedge_delay and launch():
+                    self.hedged += 1
+                    current_span().incr('hedged')
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error or dns.resolver.LifetimeTimeout(timeout=self.lifetime, errors=[])
+
+    def lookup(self, name, record_type):
+        """Resolve ``name``/``record_type`` and return a :class:`DNSAnswer`."""
+        key = cache_key(name, record_type)
+        with span('dns.lookup', name=key[0], type=key[1]) as trace:
+            answer = self._get_cached(key)
+            if answer is not None:
+                trace.set(cache='hit', status=answer.status)
+                return answer
+            self.misses += 1
+            self.queries += 1
+            try:
+                answer = self._query(key)
+            except Exception as e:
+                answer = self._answer_from_exception(*key, e)
+            self._store(key, answer)
+            trace.set(cache='miss', status=answer.status)
+            return answer
+
+    async def alookup(self, name, record_type):
+        """Awaitable :meth:`lookup`; concurrent identical lookups share one query."""
+        key = cache_key(name, record_type)
+        with span('dns.lookup', name=key[0], type=key[1]) as trace:
+            answer = self._get_cached(key)
+            if answer is not None:
+                trace.set(cache='hit', status=answer.status)
+                return answer
+            loop = asyncio.get_running_loop()
+            pending = self._inflight.get(key)
+            if pending is not None and pending.get_loop() is loop:
+                self.hits += 1
+                answer = await asyncio.shield(pending)
+                trace.set(cache='coalesced', status=answer.status)
+                return answer
+            self.misses += 1
+            self.queries += 1
+            future = loop.create_future()
+            self._inflight[key] = future
+            try:
+                try:
+                    answer = await self._aquery(key)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    answer = self._answer_from_exception(*key, e)
+                self._store(key, answer)
+                future.set_result(answer)
+                trace.set(cache='miss', status=answer.status)
+                return answer
+            finally:
+                if not future.done():
+                    future.cancel()
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def resolve(self, name, record_type):
+        return list(self.lookup(name, record_type).records)
+
+    async def aresolve(self, name, record_type):
+        return list((await self.alookup(name, record_type)).records)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._cache)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'queries': self.queries,
+            'hedged': self.hedged,
+            'entries': entries,
+            'upstreams': {upstream.address: upstream.stats() for upstream in self.upstreams}
+        }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+_default_resolver = None
+_default_lock = threading.Lock()
+
+def get_resolver():
+    """Return the process-wide resolver shared by every check."""
+    global _default_resolver
+    if _default_resolver is None:
+        with _default_lock:
+            if _default_resolver is None:
+                _default_resolver = CachingResolver()
+    return _default_resolver
+
+def set_resolver(resolver):
+    """Replace the process-wide resolver (e.g. with differently configured upstreams)."""
+    global _default_resolver
+    _default_resolver = resolver
+    return resolver
@@ -0,0 +1,451 @@
+"""Streaming ingestion of DMARC aggregate (RUA) reports (RFC 7489 appendix C)
+
+Reports are read incrementally with an expat pull parser and every
+``<record>`` is dropped from the tree once counted, so memory stays flat
+no matter how large a receiver's report is.  Plain XML, gzip and zip
+attachments (and directories of them) are accepted.
+"""
+
+import asyncio
+import gzip
+import ipaddress
+import os
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+from xml.etree import ElementTree
+from .config import RUA_READ_SIZE, RUA_MAX_SOURCES, RUA_MIN_MESSAGES, RUA_ENFORCE_PASS_RATE
+from .findings import Message
+from .logger import logger
+
+# Rows of an ingested aggregate, one per (domain, source IP, header-from, disposition).
+AGGREGATE_COLUMNS = ('domain', 'source_ip', 'header_from', 'disposition', 'messages', 'dmarc_pass',
+                     'dmarc_fail', 'spf_aligned', 'dkim_aligned', 'spf_auth')
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZIP_MAGIC = b'PK\x03\x04'
+
+class ReportError(ValueError):
+    """Raised for input that is not a DMARC aggregate report."""
+
+@dataclass
+class ReportInfo:
+    __slots__ = ('org_name', 'report_id', 'begin', 'end', 'domain', 'policy', 'subdomain_policy', 'pct')
+    org_name: Optional[str]
+    report_id: Optional[str]
+    begin: Optional[int]
+    end: Optional[int]
+    domain: Optional[str]
+    policy: Optional[str]
+    subdomain_policy: Optional[str]
+    pct: Optional[int]
+
+@dataclass
+class ReportRecord:
+    """One ``<record>``: ``count`` messages from ``source_ip`` with the same results.
+
+    ``dkim`` and ``spf`` are the DMARC-aligned results receivers evaluated;
+    ``spf_auth`` and ``dkim_auth`` the raw SPF result and DKIM signature
+    results, aligned or not.
+    """
+    __slots__ = ('report', 'source_ip', 'count', 'disposition', 'dkim', 'spf', 'header_from',
+                 'envelope_from', 'spf_auth', 'dkim_auth')
+    report: ReportInfo
+    source_ip: str
+    count: int
+    disposition: str
+    dkim: str
+    spf: str
+    header_from: str
+    envelope_from: Optional[str]
+    spf_auth: Optional[str]
+    dkim_auth: Tuple[str, ...]
+
+    @property
+    def dmarc_pass(self):
+        return self.dkim == 'pass' or self.spf == 'pass'
+
+def _integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Leaf elements of a <record> kept by their local name.  policy_evaluated's
+# <dkim>/<spf> hold a result directly; auth_results' wrap a <result>.
+_RECORD_FIELDS = ('source_ip', 'count', 'disposition', 'header_from', 'envelope_from')
+
+@lru_cache(maxsize=8)
+def _paths(ns):
+    """ElementTree paths of the report-level fields, for the document namespace ``ns``."""
+    def path(*tags):
+        return '/'.join(ns + tag for tag in tags)
+    return {
+        'org_name': path('org_name'),
+        'report_id': path('report_id'),
+        'begin': path('date_range', 'begin'),
+        'end': path('date_range', 'end'),
+        'domain': path('domain'),
+        'p': path('p'),
+        'sp': path('sp'),
+        'pct': path('pct')
+    }
+
+def _text(element, path):
+    value = element.findtext(path)
+    return value.strip().lower() if value else None
+
+def _result(value):
+    return value.strip().lower() if value else None
+
+def _record(info, fields, dkim_auth):
+    count = _integer(fields.get('count'))
+    source_ip = (fields.get('source_ip') or '').strip()
+    if count is None or not source_ip:
+        logger.debug(f"Skipping malformed record in report {info.report_id}")
+        return None
+    header_from = _result(fields.get('header_from')) or info.domain or ''
+    return ReportRecord(
+        info,
+        source_ip.lower(),
+        count,
+        _result(fields.get('disposition')) or 'none',
+        fields.get('dkim') or 'fail',
+        fields.get('spf') or 'fail',
+        header_from.rstrip('.'),
+        _result(fields.get('envelope_from')),
+        fields.get('spf_auth'),
+        tuple(dkim_auth)
+    )
+
+def parse_report(stream, read_size=RUA_READ_SIZE):
+    """Yield the :class:`ReportRecord` of one aggregate report read from binary ``stream``.
+
+    Record fields are picked up from the parser's events as they stream
+    past, and each finished ``<record>`` is cleared from the tree.
+    Documents with a DTD are refused (:class:`ReportError`) so entity
+    expansion cannot be used against the ingester.  Malformed XML raises
+    :class:`xml.etree.ElementTree.ParseError`.
+    """
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    root = None
+    info = ReportInfo(None, None, None, None, None, None, None, None)
+    fields = {}
+    dkim_auth = []
+    result = None
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        if root is None and b'<!DOCTYPE' in chunk:
+            raise ReportError("XML document type declarations are not accepted")
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event != 'end':
+                if root is None:
+                    root = element
+                    ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+                    if root.tag != ns + 'feedback':
+                        raise ReportError(f"not a DMARC aggregate report (root element {root.tag})")
+                    paths = _paths(ns)
+                    names = {ns + name: name for name in _RECORD_FIELDS}
+                    record_tag, result_tag, dkim_tag, spf_tag = (
+                        ns + 'record', ns + 'result', ns + 'dkim', ns + 'spf'
+                    )
+                continue
+            tag = element.tag
+            name = names.get(tag)
+            if name is not None:
+                fields[name] = element.text
+            elif tag == result_tag:
+                result = _result(element.text)
+            elif tag == dkim_tag or tag == spf_tag:
+                text = element.text
+                if text and not text.isspace():
+                    fields['dkim' if tag == dkim_tag else 'spf'] = _result(text)
+                elif tag == dkim_tag:
+                    if result:
+                        dkim_auth.append(result)
+                elif 'spf_auth' not in fields:
+                    fields['spf_auth'] = result
+                result = None
+            elif tag == record_tag:
+                record = _record(info, fields, dkim_auth)
+                if record is not None:
+                    yield record
+                fields = {}
+                dkim_auth = []
+                # Records are consumed one at a time; drop them from the tree.
+                root.clear()
+            elif tag == ns + 'report_metadata':
+                info.org_name = _text(element, paths['org_name'])
+                info.report_id = (element.findtext(paths['report_id']) or '').strip() or None
+                info.begin = _integer(element.findtext(paths['begin']))
+                info.end = _integer(element.findtext(paths['end']))
+                root.clear()
+            elif tag == ns + 'policy_published':
+                info.domain = (_text(element, paths['domain']) or '').rstrip('.') or None
+                info.policy = _text(element, paths['p'])
+                info.subdomain_policy = _text(element, paths['sp'])
+                info.pct = _integer(element.findtext(paths['pct']))
+                root.clear()
+    parser.close()
+    if root is None:
+        raise ReportError("empty report")
+
+def _walk(path):
+    if os.path.isdir(path):
+        for directory, _, names in sorted(os.walk(path)):
+            for name in sorted(names):
+                yield os.path.join(directory, name)
+    else:
+        yield path
+
+def open_reports(path):
+    """Yield ``(name, binary stream)`` for every report in ``path``.
+
+    ``path`` may be a report (``.xml``, ``.xml.gz`` or a ``.zip`` of
+    reports, recognized by content rather than extension) or a directory
+    searched recursively.  Each stream is closed once the next one is
+    requested.
+    """
+    for file_path in _walk(path):
+        with open(file_path, 'rb') as f:
+            magic = f.read(4)
+        if magic.startswith(_ZIP_MAGIC):
+            with zipfile.ZipFile(file_path) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    with archive.open(member) as stream:
+                        yield f"{file_path}:{member.filename}", stream
+        elif magic.startswith(_GZIP_MAGIC):
+            with gzip.open(file_path, 'rb') as stream:
+                yield file_path, stream
+        else:
+            with open(file_path, 'rb') as stream:
+                yield file_path, stream
+
+class Aggregate:
+    """Running totals of ingested records by domain, source IP, header-from and disposition.
+
+    Each group counts ``[messages, dmarc_pass, spf_aligned, dkim_aligned,
+    spf_auth]`` messages.  Reports already seen (same reporting
+    organization and report id) are skipped, so overlapping mailbox
+    exports can be ingested together.  Memory grows with the number of
+    distinct groups, not with the size of the reports.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.policies = {}
+        self.reporters = {}
+        self.reports = 0
+        self.records = 0
+        self.duplicates = 0
+        self.errors = []
+        self._seen = set()
+
+    def add(self, record):
+        domain = record.report.domain or record.header_from
+        key = (domain, record.source_ip, record.header_from, record.disposition)
+        counts = self.groups.get(key)
+        if counts is None:
+            counts = self.groups[key] = [0, 0, 0, 0, 0]
+        counts[0] += record.count
+        if record.dmarc_pass:
+            counts[1] += record.count
+        if record.spf == 'pass':
+            counts[2] += record.count
+        if record.dkim == 'pass':
+            counts[3] += record.count
+        if record.spf_auth == 'pass':
+            counts[4] += record.count
+        self.records += 1
+
+    def _report_started(self, info):
+        """Account for report ``info``; return ``False`` if it was ingested before."""
+        key = (info.org_name, info.report_id)
+        if info.report_id is not None and key in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(key)
+        self.reports += 1
+        if info.domain is not None:
+            self.reporters.setdefault(info.domain, set()).add(info.org_name)
+            latest = self.policies.get(info.domain)
+            if info.policy is not None and (latest is None or (info.end or 0) >= (latest.end or 0)):
+                self.policies[info.domain] = info
+        return True
+
+    def ingest_stream(self, stream):
+        """Add every record of the report read from ``stream``; return the records added."""
+        added = 0
+        current = None
+        for record in parse_report(stream):
+            if record.report is not current:
+                current = record.report
+                if not self._report_started(current):
+                    return 0
+            self.add(record)
+            added += 1
+        return added
+
+    def ingest(self, path):
+        """Ingest every report under ``path``; unreadable reports are logged and listed in ``errors``."""
+        for name, stream in self._open(path):
+            try:
+                self.ingest_stream(stream)
+            except (ReportError, ElementTree.ParseError, OSError, EOFError, zipfile.BadZipFile) as e:
+                logger.warning(f"Skipping report {name}: {e}")
+                self.errors.append((name, str(e)))
+        return self
+
+    def _open(self, path):
+        try:
+            yield from open_reports(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning(f"Cannot read {path}: {e}")
+            self.errors.append((path, str(e)))
+
+    def domains(self):
+        return sorted({key[0] for key in self.groups})
+
+    def totals(self, domain):
+        """``[messages, dmarc_pass, spf_aligned, dkim_aligned, spf_auth]`` of ``domain``."""
+        totals = [0, 0, 0, 0, 0]
+        for key, counts in self.groups.items():
+            if key[0] == domain:
+                totals = [a + b for a, b in zip(totals, counts)]
+        return totals
+
+    def rows(self, domain=None):
+        """Yield :data:`AGGREGATE_COLUMNS` row dicts, most messages first within each domain."""
+        groups = sorted(
+            ((key, counts) for key, counts in self.groups.items() if domain is None or key[0] == domain),
+            key=lambda item: (item[0][0], -item[1][0], item[0][1:])
+        )
+        for (group_domain, source_ip, header_from, disposition), counts in groups:
+            messages, dmarc_pass, spf_aligned, dkim_aligned, spf_auth = counts
+            yield {'domain': group_domain, 'source_ip': source_ip, 'header_from': header_from,
+                   'disposition': disposition, 'messages': messages, 'dmarc_pass': dmarc_pass,
+                   'dmarc_fail': messages - dmarc_pass, 'spf_aligned': spf_aligned,
+                   'dkim_aligned': dkim_aligned, 'spf_auth': spf_auth}
+
+def ingest(paths):
+    """Return the :class:`Aggregate` of every report under ``paths``."""
+    aggregate = Aggregate()
+    for path in paths:
+        aggregate.ingest(path)
+    return aggregate
+
+def _authorized(address, networks):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks if network.version == ip.version)
+
+def aggregate_findings(domain, aggregate, dmarc=None, evaluation=None):
+    """Findings of the ``rua`` check: what receivers saw, against the published records.
+
+    ``dmarc`` is the domain's parsed :class:`~dmarc_audit.records.DMARCRecord`
+    and ``evaluation`` its :class:`~dmarc_audit.analyzer.SPFResult`; without
+    them the policy is taken from the reports and a source counts as
+    authorized when receivers saw it pass SPF.
+    """
+    vulnerabilities = []
+    recommendations = []
+    networks = evaluation.authorized_networks() if evaluation is not None else None
+
+    failing = {}
+    for row in aggregate.rows(domain):
+        if not row['dmarc_fail']:
+            continue
+        key = (row['source_ip'], row['header_from'])
+        entry = failing.setdefault(key, {'failed': 0, 'delivered': 0, 'authorized': False})
+        entry['failed'] += row['dmarc_fail']
+        if row['disposition'] == 'none':
+            entry['delivered'] += row['dmarc_fail']
+        if networks is not None:
+            entry['authorized'] = _authorized(row['source_ip'], networks)
+        elif row['spf_auth']:
+            entry['authorized'] = True
+
+    ranked = sorted(failing.items(), key=lambda item: (-item[1]['failed'], item[0]))
+    for (source_ip, header_from), entry in ranked[:RUA_MAX_SOURCES]:
+        if entry['authorized']:
+            recommendations.append(Message(
+                "rua.unaligned-source",
+                f"Source {source_ip} is authorized by SPF but failed DMARC for {header_from} "
+                f"({entry['failed']} messages); align its envelope sender or sign with DKIM",
+                source_ip=source_ip, header_from=header_from, messages=entry['failed']
+            ))
+        elif entry['delivered']:
+            vulnerabilities.append(Message(
+                "rua.unauthenticated-delivered",
+                f"Unauthenticated mail from {source_ip} delivered as {header_from} ({entry['delivered']} messages)",
+                source_ip=source_ip, header_from=header_from, messages=entry['delivered']
+            ))
+    if len(ranked) > RUA_MAX_SOURCES:
+        rest = ranked[RUA_MAX_SOURCES:]
+        failed = sum(entry['failed'] for _, entry in rest)
+        recommendations.append(Message(
+            "rua.more-failing-sources",
+            f"{len(rest)} more sources failed DMARC ({failed} messages)",
+            sources=len(rest), messages=failed
+        ))
+
+    reported = aggregate.policies.get(domain)
+    policy = dmarc.policy if dmarc is not None else reported.policy if reported is not None else None
+    if dmarc is not None and reported is not None and dmarc.policy and reported.policy != dmarc.policy:
+        recommendations.append(Message(
+            "rua.policy-changed",
+            f"Receivers last reported policy p={reported.policy}, the published record has p={dmarc.policy}",
+            reported=reported.policy, policy=dmarc.policy
+        ))
+    messages, dmarc_pass = aggregate.totals(domain)[:2]
+    if policy == 'none' and messages >= RUA_MIN_MESSAGES and dmarc_pass / messages >= RUA_ENFORCE_PASS_RATE:
+        recommendations.append(Message(
+            "rua.ready-to-enforce",
+            f"{dmarc_pass / messages:.1%} of {messages} reported messages pass DMARC; "
+            f"move the policy from p=none to quarantine or reject",
+            pass_rate=dmarc_pass / messages, messages=messages
+        ))
+    return vulnerabilities, recommendations
+
+async def audit_aggregate(aggregate, resolver=None, lookup=True):
+    """Yield ``(domain, report)`` for every domain of ``aggregate``.
+
+    The report holds the ``spf`` and ``dmarc`` findings of the domain's
+    current records next to the ``rua`` findings they are cross-referenced
+    with.  With ``lookup=False`` no DNS is queried and only ``rua`` findings
+    (against the policy the reports carry) are produced.
+    """
+    from .analyzer import SPFEvaluator, analyze_dmarc, analyze_spf
+    from .context import AuditContext
+    from .records import parse_dmarc
+    from .resolver import get_resolver, txt_value
+
+    if not lookup:
+        for domain in aggregate.domains():
+            yield domain, {'rua': aggregate_findings(domain, aggregate)}
+        return
+    resolver = resolver or get_resolver()
+    evaluator = SPFEvaluator(resolver)
+    for domain in aggregate.domains():
+        context = AuditContext(domain, resolver=resolver)
+        txt, dmarc_txt, evaluation = await asyncio.gather(
+            context.arecords(domain, "TXT"),
+            context.arecords(f"_dmarc.{domain}", "TXT"),
+            evaluator.evaluate(domain)
+        )
+        spf_records = [r for r in txt if "v=spf1" in r.lower()]
+        dmarc_records = [r for r in dmarc_txt if "v=dmarc1" in r.lower()]
+        dmarc = parse_dmarc(txt_value(dmarc_records[0])) if dmarc_records else None
+        yield domain, {
+            'spf': analyze_spf(spf_records, evaluation),
+            'dmarc': analyze_dmarc(dmarc_records),
+            'rua': aggregate_findings(domain, aggregate, dmarc, evaluation if spf_records else None)
+        }
@@ -0,0 +1,297 @@
+"""SMTP probes: EHLO, STARTTLS negotiation and certificate capture for MX hosts"""
+
+import asyncio
+import ssl
+from collections import defaultdict
+from .cache import get_cache
+from .compat import start_tls
+from .findings import Message
+from .providers import get_provider_index
+from .ratelimit import Throttled, destination_keys, get_scheduler, resolve_address
+from .tls import CertificateInfo, certificate_findings, certificate_info, tls_version_below
+from .tracing import current_span, span
+from .config import (
+    EMAIL_PORTS,
+    SMTP_TIMEOUT,
+    SMTP_HELO_NAME,
+    SMTP_MAX_CONCURRENCY,
+    SMTP_PER_HOST_CONCURRENCY,
+    MINIMUM_TLS_VERSION
+)
+
+def certificate_summary(der):
+    """Subject, issuer, expiry, key and SHA-256 fingerprint of a DER certificate."""
+    return certificate_info(der).to_dict()
+
+class ProbeResult:
+    """What an MX host said on port 25 and what STARTTLS negotiated."""
+
+    __slots__ = ('host', 'ehlo', 'starttls', 'tls_version', 'cipher', 'certificate', 'error', 'tls_error')
+
+    def __init__(self, host, ehlo=None, starttls=False, tls_version=None, cipher=None,
+                 certificate=None, error=None, tls_error=None):
+        self.host = host
+        self.ehlo = ehlo or []
+        self.starttls = starttls
+        self.tls_version = tls_version
+        self.cipher = cipher
+        self.certificate = certificate
+        self.error = error
+        self.tls_error = tls_error
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def for_host(self, host):
+        """This result reported for ``host``, another MX name served by the same machines."""
+        return ProbeResult.from_dict(dict(self.to_dict(), host=host))
+
+def mx_findings(result):
+    """Translate a :class:`ProbeResult` into ``(vulnerabilities, recommendations)``."""
+    vulnerabilities = []
+    recommendations = []
+    host = result.host
+    if result.error is not None:
+        vulnerabilities.append(Message("mx.starttls-unchecked", f"Unable to check STARTTLS on {host}", host=host))
+    elif not result.starttls:
+        vulnerabilities.append(Message("mx.no-starttls", f"STARTTLS not supported on {host}", host=host))
+        recommendations.append(Message("mx.no-starttls", f"Enable STARTTLS on mail server {host}", host=host))
+    elif result.tls_error is not None:
+        vulnerabilities.append(Message(
+            "mx.starttls-failed",
+            f"STARTTLS negotiation failed on {host}: {result.tls_error}",
+            host=host, error=result.tls_error
+        ))
+    elif tls_version_below(result.tls_version):
+        vulnerabilities.append(Message("mx.weak-tls", f"Weak TLS version negotiated on {host}: {result.tls_version}",
+                                       host=host, tls_version=result.tls_version))
+        recommendations.append(Message("mx.weak-tls", f"Require {MINIMUM_TLS_VERSION} or later on mail server {host}",
+                                       host=host, tls_version=MINIMUM_TLS_VERSION))
+    if result.certificate and result.certificate.get('not_after'):
+        cert_vulns, cert_recs = certificate_findings(host, CertificateInfo.from_dict(result.certificate))
+        vulnerabilities.extend(cert_vulns)
+        recommendations.extend(cert_recs)
+    return vulnerabilities, recommendations
+
+async def _read_reply(reader):
+    code, lines = None, []
+    while True:
+        line = (await reader.readline()).decode(errors='replace').rstrip()
+        if not line:
+            raise ConnectionError("Connection closed during SMTP reply")
+        code = line[:3]
+        lines.append(line[4:])
+        # Multi-line replies use "250-..." and end with "250 ..."
+        if len(line) < 4 or line[3] != '-':
+            return code, lines
+
+async def _command(reader, writer, command):
+    writer.write(command.encode() + b"\r\n")
+    await writer.drain()
+    return await _read_reply(reader)
+
+def _supports_starttls(ehlo):
+    return any(line.split(' ', 1)[0].upper() == 'STARTTLS' for line in ehlo)
+
+class SMTPProber:
+    """Probe MX hosts concurrently: EHLO, then STARTTLS and a TLS handshake.
+
+    Results are memoized per host, so MX hosts shared by many domains (Google,
+    Microsoft, ...) are probed once per prober.  ``max_concurrency`` caps open
+    connections overall and ``per_host_concurrency`` per host; ``deadline``
+    (seconds from creation) bounds the whole run, after which outstanding
+    probes fail fast instead of waiting for their own timeout.  ``store`` is
+    a :class:`~dmarc_audit.cache.PersistentCache` to use instead of the
+    process-wide one.  Connections are paced per host, network and provider
+    by ``scheduler`` (else the process-wide one); a 4xx greeting or a reset
+    connection defers the probe and retries it after a backoff.
+
+    MX names under one ``shared_mx`` fleet suffix in ``providers`` (a
+    :class:`~dmarc_audit.providers.ProviderIndex`, else the process-wide
+    one), such as every tenant's ``*.mail.protection.outlook.com``, share
+    the probe of the first such name; a tenant is only probed itself if
+    that probe failed.
+    """
+
+    def __init__(self, port=EMAIL_PORTS['smtp'], timeout=SMTP_TIMEOUT,
+                 max_concurrency=SMTP_MAX_CONCURRENCY, per_host_concurrency=SMTP_PER_HOST_CONCURRENCY,
+                 deadline=None, ssl_context=None, store=None, scheduler=None, providers=None):
+        self.port = port
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.deadline = deadline
+        self.ssl_context = ssl_context or self._default_ssl_context()
+        self.store = store
+        self.scheduler = scheduler
+        self.providers = providers if providers is not None else get_provider_index()
+        self.connections = 0
+        self._representatives = {}
+        self._results = {}
+        self._pending = {}
+        self._loop = None
+        self._expires_at = None
+
+    @staticmethod
+    def _default_ssl_context():
+        # Opportunistic STARTTLS: record whatever certificate is presented
+        # instead of refusing to talk to hosts with self-signed certificates.
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = {}
+            self._global = asyncio.Semaphore(self.max_concurrency)
+            self._per_host = defaultdict(lambda: asyncio.Semaphore(self.per_host_concurrency))
+            if self.deadline is not None and self._expires_at is None:
+                self._expires_at = loop.time() + self.deadline
+        return loop
+
+    def _shared_host(self, host):
+        """The host whose probe stands for ``host``: itself, or the first probed MX of its fleet."""
+        fleet = self.providers.mx_fleet(host)
+        if fleet is None:
+            return host
+        return self._representatives.setdefault(fleet, host)
+
+    async def _memoized(self, host, trace):
+        if host in self._results:
+            trace.set(cache='hit')
+            return self._results[host]
+        self._bind_loop()
+        task = self._pending.get(host)
+        if task is None:
+            trace.set(cache='miss')
+            task = asyncio.ensure_future(self._probe_cached(host))
+            self._pending[host] = task
+        else:
+            trace.set(cache='coalesced')
+        result = await asyncio.shield(task)
+        self._results[host] = result
+        self._pending.pop(host, None)
+        return result
+
+    async def probe(self, host):
+        """Return the :class:`ProbeResult` of ``host``, probing it at most once."""
+        host = host.lower().rstrip('.')
+        with span('smtp.probe', host=host) as trace:
+            shared = self._shared_host(host)
+            result = await self._memoized(shared, trace)
+            if shared != host:
+                if result.error is None:
+                    trace.set(shared_with=shared)
+                    return result.for_host(host)
+                result = await self._memoized(host, trace)
+            if result.error is not None:
+                trace.set(status='error')
+            return result
+
+    def forget(self, host):
+        """Drop the remembered result of ``host`` so the next :meth:`probe` connects again."""
+        host = host.lower().rstrip('.')
+        self._results.pop(host, None)
+        self._results.pop(self._shared_host(host), None)
+
+    async def probe_all(self, hosts):
+        results = await asyncio.gather(*(self.probe(host) for host in hosts))
+        return {result.host: result for result in results}
+
+    async def _probe_cached(self, host):
+        cache = self.store if self.store is not None else get_cache()
+        if cache is not None:
+            cached = cache.get_probe(host, 'SMTP-STARTTLS')
+            if cached is not None:
+                current_span().set(cache='persistent')
+                return ProbeResult.from_dict(cached)
+        result = await self._probe(host)
+        if cache is not None and result.error is None:
+            cache.put_probe(host, 'SMTP-STARTTLS', result.to_dict())
+        return result
+
+    def _budget(self):
+        if self._expires_at is None:
+            return self.timeout
+        return min(self.timeout, self._expires_at - self._loop.time())
+
+    async def _probe(self, host):
+        try:
+            address = await asyncio.wait_for(resolve_address(host, self.port), self.timeout)
+        except asyncio.TimeoutError:
+            return ProbeResult(host, error="Timed out")
+        scheduler = self.scheduler if self.scheduler is not None else get_scheduler()
+        try:
+            return await scheduler.run(destination_keys(host, address),
+                                       lambda: self._attempt(host, address or host))
+        except Throttled as e:
+            return ProbeResult(host, error=str(e))
+
+    async def _attempt(self, host, address):
+        async with self._global, self._per_host[host]:
+            budget = self._budget()
+            if budget <= 0:
+                return ProbeResult(host, error="Probe deadline exceeded")
+            try:
+                return await asyncio.wait_for(self._converse(host, address), budget)
+            except asyncio.TimeoutError:
+                return ProbeResult(host, error="Timed out")
+            except ConnectionResetError as e:
+                raise Throttled(str(e) or "Connection reset")
+            except (OSError, ConnectionError, ssl.SSLError) as e:
+                return ProbeResult(host, error=str(e) or e.__class__.__name__)
+
+    async def _converse(self, host, address):
+        reader, writer = await asyncio.open_connection(address, self.port)
+        self.connections += 1
+        result = ProbeResult(host)
+        try:
+            code, _ = await _read_reply(reader)
+            if code.startswith('4'):
+                # 421 and friends: too many connections from us right now.
+                raise Throttled(f"Unexpected greeting ({code})")
+            if code != '220':
+                result.error = f"Unexpected greeting ({code})"
+                return result
+            code, result.ehlo = await _command(reader, writer, f"EHLO {SMTP_HELO_NAME}")
+            if code != '250':
+                result.error = f"EHLO rejected ({code})"
+                return result
+            result.starttls = _supports_starttls(result.ehlo)
+            if not result.starttls:
+                await _command(reader, writer, "QUIT")
+                return result
+            code, lines = await _command(reader, writer, "STARTTLS")
+            if code != '220':
+                result.tls_error = f"STARTTLS refused ({code} {' '.join(lines)})"
+                return result
+            try:
+                await start_tls(writer, self.ssl_context, host)
+            except (ssl.SSLError, ConnectionError, OSError) as e:
+                result.tls_error = str(e) or e.__class__.__name__
+                return result
+            ssl_object = writer.get_extra_info('ssl_object')
+            result.tls_version = ssl_object.version()
+            result.cipher = ssl_object.cipher()[0]
+            der = ssl_object.getpeercert(binary_form=True)
+            if der:
+                result.certificate = certificate_summary(der)
+            await _command(reader, writer, f"EHLO {SMTP_HELO_NAME}")
+            await _command(reader, writer, "QUIT")
+            return result
+        except ConnectionError:
+            # The server hung up after we learned what we needed (e.g. on QUIT).
+            if not result.ehlo:
+                raise
+            if result.starttls and result.tls_version is None and result.tls_error is None:
+                result.tls_error = "Connection closed during STARTTLS"
+            return result
+        finally:
+            writer.close()
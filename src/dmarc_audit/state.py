@@ -0,0 +1,93 @@
+"""Audit state store for incremental re-audits: record hashes and last findings per domain"""
+
+import json
+import sqlite3
+import threading
+from collections import namedtuple
+from .config import CACHE_COMMIT_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    record_hash TEXT NOT NULL,
+    report TEXT NOT NULL,
+    probed_at REAL NOT NULL
+)
+"""
+
+DomainState = namedtuple('DomainState', ['record_hash', 'report', 'probed_at'])
+
+class StateStore:
+    """SQLite table of ``domain -> (record hash, report, probed_at)``.
+
+    ``record_hash`` fingerprints the DNS answers a report was computed from
+    (see :meth:`~dmarc_audit.context.AuditContext.record_hash`) and
+    ``probed_at`` is when its SMTP/TLS probes ran.  Writes are committed in
+    batches; call :meth:`commit` to make them durable sooner.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def get(self, domain):
+        """Return the :class:`DomainState` of ``domain``, or ``None`` if never audited."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record_hash, report, probed_at FROM domains WHERE domain = ?", (domain,)
+            ).fetchone()
+        if row is None:
+            return None
+        report = {check: (vulns, recs) for check, (vulns, recs) in json.loads(row[1]).items()}
+        return DomainState(row[0], report, row[2])
+
+    def put(self, domain, record_hash, report, probed_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO domains (domain, record_hash, report, probed_at) VALUES (?, ?, ?, ?)",
+                (domain, record_hash, json.dumps(report), probed_at)
+            )
+            self._pending += 1
+            if self._pending >= CACHE_COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending = 0
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def diff_reports(old, new):
+    """Compare two ``{check: (vulns, recs)}`` reports.
+
+    Returns ``{'new': report, 'resolved': report}`` holding only the findings
+    that appeared in ``new`` or disappeared from ``old``.
+    """
+    diff = {'new': {}, 'resolved': {}}
+    for check in dict.fromkeys(list(new) + list(old)):
+        new_vulns, new_recs = new.get(check, ([], []))
+        old_vulns, old_recs = old.get(check, ([], []))
+        added = ([v for v in new_vulns if v not in old_vulns], [r for r in new_recs if r not in old_recs])
+        removed = ([v for v in old_vulns if v not in new_vulns], [r for r in old_recs if r not in new_recs])
+        if added[0] or added[1]:
+            diff['new'][check] = added
+        if removed[0] or removed[1]:
+            diff['resolved'][check] = removed
+    return diff
@@ -0,0 +1,332 @@
+"""Concurrent TLS inspection: protocol version, certificate chain, expiry and key size"""
+
+import asyncio
+import hashlib
+import ssl
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+from .compat import start_tls, unverified_chain
+from .config import (
+    MINIMUM_TLS_VERSION,
+    MIN_RSA_KEY_BITS,
+    TLS_PORT,
+    TLS_CONNECT_TIMEOUT,
+    TLS_HANDSHAKE_TIMEOUT,
+    TLS_MAX_CONCURRENCY,
+    TLS_EXPIRY_WARNING_DAYS,
+    TLS_CERT_CACHE_SIZE
+)
+from .findings import Message
+from .ratelimit import Throttled, destination_keys, get_scheduler, resolve_address
+from .tracing import span
+
+TLS_VERSION_ORDER = ('SSLv2', 'SSLv3', 'TLSv1', 'TLSv1.1', 'TLSv1.2', 'TLSv1.3')
+
+def tls_version_below(version, minimum=MINIMUM_TLS_VERSION):
+    if version not in TLS_VERSION_ORDER:
+        return False
+    return TLS_VERSION_ORDER.index(version) < TLS_VERSION_ORDER.index(minimum)
+
+@dataclass
+class CertificateInfo:
+    __slots__ = ('fingerprint', 'subject', 'issuer', 'not_after', 'key_type', 'key_bits', 'self_signed')
+    fingerprint: str
+    subject: str
+    issuer: str
+    not_after: str
+    key_type: Optional[str]
+    key_bits: Optional[int]
+    self_signed: bool
+
+    def expires_in(self, now=None):
+        """Days until ``not_after`` (negative once expired)."""
+        not_after = datetime.fromisoformat(self.not_after)
+        if not_after.tzinfo is None:
+            not_after = not_after.replace(tzinfo=timezone.utc)
+        return (not_after - (now or datetime.now(timezone.utc))).total_seconds() / 86400
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from :meth:`to_dict` output; fields missing from older summaries become ``None``."""
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+# SHA-256 fingerprint -> CertificateInfo.  Shared hosting serves one
+# certificate for many hosts, so each is parsed once per process.
+_certificates = {}
+
+def certificate_info(der):
+    """Parse a DER certificate into a :class:`CertificateInfo`, memoized by fingerprint."""
+    fingerprint = hashlib.sha256(der).hexdigest()
+    info = _certificates.get(fingerprint)
+    if info is not None:
+        return info
+    from cryptography import x509
+    from cryptography.hazmat.primitives.asymmetric import dsa, ec, ed25519, ed448, rsa
+
+    cert = x509.load_der_x509_certificate(der)
+    try:
+        not_after = cert.not_valid_after_utc.isoformat()
+    except AttributeError:  # cryptography < 42
+        not_after = cert.not_valid_after.isoformat()
+    key = cert.public_key()
+    if isinstance(key, rsa.RSAPublicKey):
+        key_type, key_bits = 'rsa', key.key_size
+    elif isinstance(key, ec.EllipticCurvePublicKey):
+        key_type, key_bits = 'ec', key.curve.key_size
+    elif isinstance(key, dsa.DSAPublicKey):
+        key_type, key_bits = 'dsa', key.key_size
+    elif isinstance(key, ed25519.Ed25519PublicKey):
+        key_type, key_bits = 'ed25519', 256
+    elif isinstance(key, ed448.Ed448PublicKey):
+        key_type, key_bits = 'ed448', 456
+    else:
+        key_type, key_bits = None, None
+    info = CertificateInfo(
+        fingerprint,
+        cert.subject.rfc4514_string(),
+        cert.issuer.rfc4514_string(),
+        not_after,
+        key_type,
+        key_bits,
+        cert.subject == cert.issuer
+    )
+    if len(_certificates) >= TLS_CERT_CACHE_SIZE:
+        del _certificates[next(iter(_certificates))]
+    _certificates[fingerprint] = info
+    return info
+
+def clear_certificate_cache():
+    _certificates.clear()
+
+def peer_chain(ssl_object):
+    """``(certificates, complete)``: the DER certificates the peer sent, leaf first.
+
+    When this Python cannot read the full chain (see
+    :func:`~dmarc_audit.compat.unverified_chain`), only the leaf is returned
+    and ``complete`` is ``False``.
+    """
+    chain = unverified_chain(ssl_object)
+    if chain is not None:
+        return chain, True
+    der = ssl_object.getpeercert(binary_form=True)
+    return ([der] if der else []), False
+
+class TLSResult:
+    """What a TLS handshake with ``host:port`` negotiated and which chain was served."""
+
+    __slots__ = ('host', 'port', 'version', 'cipher', 'chain', 'verified', 'verify_error', 'error', 'chain_complete')
+
+    def __init__(self, host, port, version=None, cipher=None, chain=None, verified=False,
+                 verify_error=None, error=None, chain_complete=True):
+        self.host = host
+        self.port = port
+        self.version = version
+        self.cipher = cipher
+        self.chain = chain or []
+        # False when only the leaf could be read (see peer_chain).
+        self.chain_complete = chain_complete
+        self.verified = verified
+        self.verify_error = verify_error
+        self.error = error
+
+    @property
+    def certificate(self):
+        """The leaf :class:`CertificateInfo`, or ``None``."""
+        return self.chain[0] if self.chain else None
+
+    @classmethod
+    def from_connection(cls, host, port, ssl_object, verified):
+        """Describe the TLS session of an established connection."""
+        chain, complete = peer_chain(ssl_object)
+        return cls(host, port, version=ssl_object.version(), cipher=ssl_object.cipher()[0],
+                   chain=[certificate_info(der) for der in chain], verified=verified, chain_complete=complete)
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['chain'] = [cert.to_dict() for cert in self.chain]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['chain'] = [CertificateInfo.from_dict(cert) for cert in data.get('chain') or ()]
+        return cls(**data)
+
+def certificate_findings(host, certificate, now=None):
+    """Expiry and key-size ``(vulnerabilities, recommendations)`` of one leaf certificate."""
+    vulnerabilities = []
+    recommendations = []
+    days = certificate.expires_in(now)
+    if days < 0:
+        vulnerabilities.append(Message("{check}.certificate-expired", f"TLS certificate expired for {host}", host=host))
+    elif days < TLS_EXPIRY_WARNING_DAYS:
+        recommendations.append(Message(
+            "{check}.certificate-expiring",
+            f"TLS certificate for {host} expires in {int(days)} days",
+            host=host, days=int(days)
+        ))
+    if certificate.key_type in ('rsa', 'dsa') and certificate.key_bits and certificate.key_bits < MIN_RSA_KEY_BITS:
+        vulnerabilities.append(Message(
+            "{check}.weak-certificate-key",
+            f"Weak TLS certificate key for {host} ({certificate.key_type.upper()} {certificate.key_bits} bits)",
+            host=host, key_type=certificate.key_type, bits=certificate.key_bits
+        ))
+    return vulnerabilities, recommendations
+
+def tls_findings(result, now=None):
+    """Translate a :class:`TLSResult` into ``(vulnerabilities, recommendations)``."""
+    host = result.host
+    if result.error is not None:
+        return [Message("{check}.tls-failed", f"TLS check failed for {host}:{result.port}: {result.error}",
+                        host=host, port=result.port, error=result.error)], []
+    vulnerabilities = []
+    recommendations = []
+    if result.verify_error is not None:
+        vulnerabilities.append(Message(
+            "{check}.tls-untrusted",
+            f"Untrusted TLS certificate for {host}: {result.verify_error}",
+            host=host, error=result.verify_error
+        ))
+    if tls_version_below(result.version):
+        vulnerabilities.append(Message("{check}.weak-tls", f"Weak SSL/TLS version detected on {host}: {result.version}",
+                                       host=host, tls_version=result.version))
+    if result.certificate is not None:
+        cert_vulns, cert_recs = certificate_findings(host, result.certificate, now)
+        vulnerabilities.extend(cert_vulns)
+        recommendations.extend(cert_recs)
+    return vulnerabilities, recommendations
+
+@lru_cache(maxsize=None)
+def _inspection_context(verify):
+    # Loading the CA store is expensive, so every inspector shares these.
+    context = ssl.create_default_context()
+    # Accept old protocol versions so they can be reported, not refused.
+    context.minimum_version = ssl.TLSVersion.MINIMUM_SUPPORTED
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+class TLSInspector:
+    """Handshake with many ``host:port`` endpoints concurrently and describe what they serve.
+
+    The TCP connect and the TLS handshake each have their own deadline and at
+    most ``max_concurrency`` handshakes run at once.  Results are memoized
+    per endpoint and certificates per fingerprint (see
+    :func:`certificate_info`).  A handshake failing certificate verification
+    is repeated without verification so the chain can still be reported.
+    The default SSL contexts are built once and shared by every inspector.
+    Connections are paced by ``scheduler`` (else the process-wide one) and
+    retried after a backoff when the peer resets them.  ``connect_host``
+    sends every connection to that address instead of the host itself (for
+    local stand-ins).
+    """
+
+    def __init__(self, port=TLS_PORT, connect_timeout=TLS_CONNECT_TIMEOUT, handshake_timeout=TLS_HANDSHAKE_TIMEOUT,
+                 max_concurrency=TLS_MAX_CONCURRENCY, ssl_context=None, connect_host=None, scheduler=None):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.handshake_timeout = handshake_timeout
+        self.max_concurrency = max_concurrency
+        self.ssl_context = ssl_context or _inspection_context(verify=True)
+        self.insecure_context = _inspection_context(verify=False)
+        self.connect_host = connect_host
+        self.scheduler = scheduler
+        self.handshakes = 0
+        self._results = {}
+        self._pending = {}
+        self._loop = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = {}
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return loop
+
+    async def inspect(self, host, port=None):
+        """Return the :class:`TLSResult` of ``host:port``, connecting at most once."""
+        host = host.lower().rstrip('.')
+        key = (host, port or self.port)
+        with span('tls.inspect', host=host) as trace:
+            if key in self._results:
+                trace.set(cache='hit')
+                return self._results[key]
+            self._bind_loop()
+            task = self._pending.get(key)
+            if task is None:
+                trace.set(cache='miss')
+                task = asyncio.ensure_future(self._inspect(*key))
+                self._pending[key] = task
+            else:
+                trace.set(cache='coalesced')
+            result = await asyncio.shield(task)
+            self._results[key] = result
+            self._pending.pop(key, None)
+            if result.error is not None:
+                trace.set(status='error')
+            return result
+
+    async def inspect_all(self, hosts, port=None):
+        results = await asyncio.gather(*(self.inspect(host, port) for host in hosts))
+        return {result.host: result for result in results}
+
+    async def _inspect(self, host, port):
+        try:
+            address = await asyncio.wait_for(resolve_address(self.connect_host or host, port), self.connect_timeout)
+        except asyncio.TimeoutError:
+            return TLSResult(host, port, error="Connect timed out")
+        scheduler = self.scheduler if self.scheduler is not None else get_scheduler()
+        try:
+            return await scheduler.run(destination_keys(host, address),
+                                       lambda: self._attempt(host, port, address or self.connect_host or host))
+        except Throttled as e:
+            return TLSResult(host, port, error=str(e))
+
+    async def _attempt(self, host, port, address):
+        async with self._semaphore:
+            try:
+                return await self._handshake(host, port, address, self.ssl_context)
+            except ssl.SSLCertVerificationError as e:
+                verify_error = e.verify_message or str(e)
+            except ConnectionResetError as e:
+                raise Throttled(str(e) or "Connection reset")
+            except (OSError, ConnectionError, ssl.SSLError, asyncio.TimeoutError) as e:
+                return TLSResult(host, port, error=self._describe(e))
+            try:
+                result = await self._handshake(host, port, address, self.insecure_context)
+            except ConnectionResetError as e:
+                raise Throttled(str(e) or "Connection reset")
+            except (OSError, ConnectionError, ssl.SSLError, asyncio.TimeoutError) as e:
+                return TLSResult(host, port, verify_error=verify_error, error=self._describe(e))
+            result.verified = False
+            result.verify_error = verify_error
+            return result
+
+    @staticmethod
+    def _describe(error):
+        if isinstance(error, asyncio.TimeoutError):
+            return str(error) or "Timed out"
+        return str(error) or error.__class__.__name__
+
+    async def _handshake(self, host, port, address, context):
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError("Connect timed out")
+        try:
+            try:
+                await asyncio.wait_for(start_tls(writer, context, host), self.handshake_timeout)
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError("TLS handshake timed out")
+            self.handshakes += 1
+            return TLSResult.from_connection(host, port, writer.get_extra_info('ssl_object'),
+                                             verified=context.verify_mode != ssl.CERT_NONE)
+        finally:
+            writer.close()
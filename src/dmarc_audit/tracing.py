@@ -0,0 +1,214 @@
+"""Lightweight span tracing: per-check and per-network-operation timings"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from .config import TRACE_SAMPLE_SIZE
+
+_current = contextvars.ContextVar('dmarc_audit_span', default=None)
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+class Span:
+    """One timed operation.  ``attributes`` can be added while it runs via :meth:`set`."""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'duration', 'attributes', '_perf')
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time_ns()
+        self.end = None
+        self.duration = 0.0
+        self.attributes = dict(attributes or {})
+        self._perf = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def incr(self, attribute, amount=1):
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + amount
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._perf
+        self.end = self.start + int(self.duration * 1e9)
+
+    def to_otel(self):
+        """The span as an OpenTelemetry-style JSON object."""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start,
+            'endTimeUnixNano': self.end,
+            'attributes': self.attributes
+        }
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def incr(self, attribute, amount=1):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class SpanStats:
+    """Count, total and max duration of one span name, plus a bounded sample for percentiles."""
+
+    __slots__ = ('count', 'total', 'max', 'sample', 'counters')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sample = []
+        self.counters = {}
+
+    def add(self, span, rng):
+        duration = span.duration
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        # Reservoir sampling keeps memory flat however many spans a run records.
+        if len(self.sample) < TRACE_SAMPLE_SIZE:
+            self.sample.append(duration)
+        else:
+            slot = rng.randrange(self.count)
+            if slot < TRACE_SAMPLE_SIZE:
+                self.sample[slot] = duration
+        for key in ('cache', 'status'):
+            value = span.attributes.get(key)
+            if value is not None:
+                label = f"{key}={value}"
+                self.counters[label] = self.counters.get(label, 0) + 1
+        retries = span.attributes.get('retries')
+        if retries:
+            self.counters['retries'] = self.counters.get('retries', 0) + retries
+
+    def percentile(self, fraction):
+        if not self.sample:
+            return 0.0
+        ordered = sorted(self.sample)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Tracer:
+    """Records spans, aggregates them per name and optionally exports each one.
+
+    ``export`` is a writable text stream receiving one OpenTelemetry-style
+    JSON object per finished span.
+    """
+
+    enabled = True
+
+    def __init__(self, export=None):
+        self.export = export
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+    def start(self, name, attributes=None):
+        span = Span(name, _current.get(), attributes)
+        return span, _current.set(span)
+
+    def finish(self, span, token):
+        span.finish()
+        _current.reset(token)
+        with self._lock:
+            stats = self.stats.get(span.name)
+            if stats is None:
+                stats = self.stats[span.name] = SpanStats()
+            stats.add(span, self._rng)
+            if self.export is not None:
+                self.export.write(json.dumps(span.to_otel()) + "\n")
+
+    def summary(self):
+        """``[(name, count, total, mean, p50, p99, max, counters)]``, slowest total first."""
+        with self._lock:
+            rows = [
+                (name, s.count, s.total, s.total / s.count, s.percentile(0.5), s.percentile(0.99), s.max, dict(s.counters))
+                for name, s in self.stats.items()
+            ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def close(self):
+        if self.export is not None:
+            self.export.close()
+            self.export = None
+
+class _NullTracer:
+    enabled = False
+
+    def summary(self):
+        return []
+
+    def close(self):
+        pass
+
+_tracer = _NullTracer()
+
+def get_tracer():
+    return _tracer
+
+def set_tracer(tracer):
+    """Install ``tracer`` process-wide (``None`` turns tracing off)."""
+    global _tracer
+    _tracer = tracer if tracer is not None else _NullTracer()
+    return _tracer
+
+def current_span():
+    """The innermost running span, or a no-op stand-in when tracing is off."""
+    if not _tracer.enabled:
+        return NULL_SPAN
+    return _current.get() or NULL_SPAN
+
+class span:
+    """Context manager timing a block: ``with span('dns.lookup', name=...) as s:``."""
+
+    __slots__ = ('name', 'attributes', '_span', '_token')
+
+    def __init__(self, name, /, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        if not _tracer.enabled:
+            return NULL_SPAN
+        self._span, self._token = _tracer.start(self.name, self.attributes)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            if exc_type is not None:
+                self._span.set(error=exc_type.__name__)
+            _tracer.finish(self._span, self._token)
+        return False
+
+def traced(name):
+    """Decorate a function or coroutine function so each call is a span."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
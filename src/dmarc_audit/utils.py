@@ -1,16 +1,74 @@
 from datetime import datetime
 import json
-import csv
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from pyfiglet import Figlet
-from colorama import Fore, Style
+import sys
 from .config import BANNER_SETTINGS
+from .writers import open_writer, file_extension
 
-console = Console()
+PLAIN_COLUMNS = ('domain', 'check', 'type', 'finding')
+
+class LazyConsole:
+    """A rich ``Console`` that is only created (and rich imported) on first use.
+
+    Once :attr:`quiet` is set, :meth:`print` is a no-op that never loads rich,
+    which keeps scripted ``--quiet`` runs lean.
+    """
+
+    def __init__(self, **options):
+        self._options = options
+        self._console = None
+        self.quiet = False
+
+    def print(self, *objects, **kwargs):
+        if not self.quiet:
+            self._get().print(*objects, **kwargs)
+
+    def _get(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console(**self._options)
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+console = LazyConsole()
+
+class NullProgress:
+    """Stand-in for ``rich.progress.Progress`` when nothing should be drawn."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_task(self, description, **fields):
+        return None
+
+    def update(self, task, **fields):
+        pass
+
+def set_quiet(quiet=True):
+    """Silence all rich output of the package (machine mode)."""
+    console.quiet = quiet
+
+def progress(quiet=False):
+    """A spinner progress display, or a :class:`NullProgress` when ``quiet``."""
+    if quiet:
+        return NullProgress()
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        transient=False,
+        refresh_per_second=1,
+        disable=False
+    )
 
 def print_banner():
+    from pyfiglet import Figlet
+    from rich.panel import Panel
+
     f = Figlet(font=BANNER_SETTINGS['font'])
     banner = f.renderText('DMARC Audit')
     
@@ -30,32 +88,31 @@ def print_banner():
     console.print(f"Scan started at: {datetime.now()}", style="yellow")
     console.print("=" * 50, style="blue")
 
-def create_report(domain, spf_vulns, dmarc_vulns, dkim_vulns, format='text'):
-    report = {
-        "scan_time": datetime.now().isoformat(),
-        "domain": domain,
-        "spf_vulnerabilities": spf_vulns,
-        "dmarc_vulnerabilities": dmarc_vulns,
-        "dkim_vulnerabilities": dkim_vulns
-    }
-    
+def create_report(domain, spf_vulns, dmarc_vulns, dkim_vulns, format='text', report=None):
+    """Write a timestamped report file for one domain.
+
+    ``report`` is the full ``{check: (vulns, recs)}`` mapping; when it is
+    omitted only the SPF/DMARC/DKIM vulnerabilities are reported.
+    """
+    if report is None:
+        report = {'spf': (spf_vulns, []), 'dmarc': (dmarc_vulns, []), 'dkim': (dkim_vulns, [])}
+    scan_time = datetime.now().isoformat()
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
+
     if format == 'json':
+        result = {"scan_time": scan_time, "domain": domain}
+        for check, (vulns, recs) in report.items():
+            result[f"{check}_vulnerabilities"] = vulns
+            result[f"{check}_recommendations"] = recs
         with open(f"report_{domain}_{timestamp}.json", 'w') as f:
-            json.dump(report, f, indent=4)
-    elif format == 'csv':
-        with open(f"report_{domain}_{timestamp}.csv", 'w') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Type', 'Finding'])
-            for v in spf_vulns:
-                writer.writerow(['SPF', v])
-            for v in dmarc_vulns:
-                writer.writerow(['DMARC', v])
-            for v in dkim_vulns:
-                writer.writerow(['DKIM', v])
+            json.dump(result, f, indent=4)
+    elif format in ('csv', 'columnar'):
+        with open_writer(format, f"report_{domain}_{timestamp}.{file_extension(format)}") as writer:
+            writer.write_report(domain, report, scan_time)
 
 def print_results_table(title, vulns, recs):
+    from rich.table import Table
+
     table = Table(title=title, show_header=True, header_style="bold magenta")
     table.add_column("Type", style="dim")
     table.add_column("Finding")
@@ -68,6 +125,127 @@ def print_results_table(title, vulns, recs):
     
     console.print(table)
 
+def print_aggregate_table(rows):
+    """Print :data:`~dmarc_audit.rua.AGGREGATE_COLUMNS` rows of one domain."""
+    from rich.table import Table
+
+    table = Table(show_header=True, header_style="bold magenta")
+    for column in ("Source IP", "Header From", "Disposition", "Messages", "DMARC Pass", "SPF Aligned", "DKIM Aligned"):
+        text = column in ("Source IP", "Header From", "Disposition")
+        table.add_column(column, justify="left" if text else "right", no_wrap=text)
+    for row in rows:
+        style = "red" if row['dmarc_fail'] else None
+        table.add_row(row['source_ip'], row['header_from'], row['disposition'], str(row['messages']),
+                      str(row['dmarc_pass']), str(row['spf_aligned']), str(row['dkim_aligned']), style=style)
+    console.print(table)
+
+RATE_LABELS = {
+    'dmarc': "DMARC published",
+    'dmarc_enforced': "DMARC enforced (quarantine/reject, pct=100)",
+    'spf_hardfail': "SPF -all",
+    'spf_over_limit': "SPF over the lookup limit",
+    'dkim': "DKIM key found",
+    'dkim_weak': "Weak RSA DKIM key",
+    'mta_sts': "MTA-STS adopted",
+    'mta_sts_enforced': "MTA-STS enforced",
+    'tls_rpt': "TLS-RPT published",
+    'vulnerable': "Domains with vulnerabilities"
+}
+
+def print_portfolio_summary(summary):
+    """Print a :meth:`~dmarc_audit.portfolio.Portfolio.summary` as a few compact tables."""
+    from rich.table import Table
+
+    domains = summary['domains']
+    console.print(f"\n=== Portfolio Summary ({domains} domains) ===", style="cyan bold")
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Posture")
+    table.add_column("Share", justify="right")
+    for name, rate in summary['rates'].items():
+        table.add_row(RATE_LABELS.get(name, name), f"{rate:.1%}")
+    console.print(table)
+
+    if summary['stats']:
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Field")
+        columns = [key for key in next(iter(summary['stats'].values())) if key != 'count']
+        for column in ("Known",) + tuple(columns):
+            table.add_column(column.capitalize(), justify="right")
+        for name, stats in summary['stats'].items():
+            table.add_row(name, str(stats['count']), *(str(stats[column]) for column in columns))
+        console.print(table)
+
+    table = Table(show_header=True, header_style="bold magenta")
+    for column in ("Field", "Value", "Domains", "Share"):
+        table.add_column(column, justify="left" if column in ("Field", "Value") else "right")
+    for name, counts in summary['categories'].items():
+        if name == 'provider':
+            continue
+        for value, count in counts.items():
+            table.add_row(name, value, str(count), f"{count / domains:.1%}" if domains else "-")
+    console.print(table)
+
+    columns = {'dmarc_enforced': "DMARC Enforced", 'dkim': "DKIM", 'mta_sts': "MTA-STS", 'tls_rpt': "TLS-RPT",
+               'vulnerable': "Vulnerable"}
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Mail Provider", no_wrap=True)
+    table.add_column("Domains", justify="right")
+    for header in columns.values():
+        table.add_column(header, justify="right")
+    for row in summary['providers']:
+        table.add_row(row['provider'], str(row['domains']), *(f"{row[name]:.1%}" for name in columns))
+    console.print(table)
+
 def print_status(message, status):
+    from colorama import Fore, Style
+
     color = Fore.GREEN if status == "OK" else Fore.YELLOW if status == "WARNING" else Fore.RED
-    print(f"{color}[{status}]{Style.RESET_ALL} {message}") 
\ No newline at end of file
+    print(f"{color}[{status}]{Style.RESET_ALL} {message}")
+
+def read_domains(path):
+    """Yield domains from ``path`` (one per line, ``-`` for stdin), lazily."""
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in stream:
+            domain = line.split('#', 1)[0].strip().rstrip('.').lower()
+            if domain:
+                yield domain
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def print_bulk_result(domain, report):
+    vuln_count = sum(len(vulns) for vulns, _ in report.values())
+    rec_count = sum(len(recs) for _, recs in report.values())
+    style = "red" if vuln_count else "green"
+    console.print(f"[{style}]{domain}[/{style}]: {vuln_count} vulnerabilities, {rec_count} recommendations")
+
+def print_bulk_diff(domain, diff, reused):
+    """Print what changed for ``domain`` since its last audit."""
+    if reused:
+        console.print(f"[dim]{domain}: unchanged[/dim]")
+        return
+    console.print(f"[cyan]{domain}[/cyan]")
+    for change, marker, style in (('new', '+', 'red'), ('resolved', '-', 'green')):
+        for check, (vulns, recs) in diff[change].items():
+            for finding in vulns + recs:
+                console.print(f"  [{style}]{marker} {check.upper()}: {finding}[/{style}]")
+
+def print_plain_rows(rows, columns=PLAIN_COLUMNS):
+    """Print writer rows as tab-separated lines on stdout (``--quiet`` text output)."""
+    for row in rows:
+        print("\t".join(str(row[column]) for column in columns))
+
+def print_profile(summary):
+    """Print the aggregated span timings of a traced run (to stderr, so reports on stdout stay clean)."""
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title="Profile", show_header=True, header_style="bold magenta")
+    for column in ("Span", "Count", "Total (s)", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)", "Details"):
+        table.add_column(column, justify="left" if column in ("Span", "Details") else "right", no_wrap=column == "Span")
+    for name, count, total, mean, p50, p99, maximum, counters in summary:
+        details = ", ".join(f"{key}: {value}" for key, value in sorted(counters.items()))
+        table.add_row(name, str(count), f"{total:.3f}", f"{mean * 1000:.1f}", f"{p50 * 1000:.1f}",
+                      f"{p99 * 1000:.1f}", f"{maximum * 1000:.1f}", details)
+    Console(stderr=True).print(table)
@@ -0,0 +1,212 @@
+"""Streaming report writers: one row per finding, appended as domains finish"""
+
+import csv
+import json
+import sys
+import threading
+from datetime import datetime
+from .config import WRITER_FLUSH_INTERVAL, COLUMNAR_ROW_GROUP_SIZE
+
+COLUMNS = ('scan_time', 'domain', 'check', 'type', 'finding', 'severity')
+# Incremental re-audits: each row also says whether the finding is new or resolved.
+DIFF_COLUMNS = COLUMNS + ('change',)
+
+def finding_rows(domain, report, scan_time=None, change=None):
+    """Yield one row dict per finding of a ``{check: (vulns, recs)}`` report."""
+    scan_time = scan_time or datetime.now().isoformat()
+    extra = {} if change is None else {'change': change}
+    for check, (vulns, recs) in report.items():
+        for v in vulns:
+            yield {'scan_time': scan_time, 'domain': domain, 'check': check.upper(),
+                   'type': 'Vulnerability', 'finding': v, 'severity': 'ERROR', **extra}
+        for r in recs:
+            yield {'scan_time': scan_time, 'domain': domain, 'check': check.upper(),
+                   'type': 'Recommendation', 'finding': r, 'severity': 'WARNING', **extra}
+
+def diff_rows(domain, diff, scan_time=None):
+    """Rows of a :func:`~dmarc_audit.state.diff_reports` result, tagged ``new``/``resolved``."""
+    scan_time = scan_time or datetime.now().isoformat()
+    for change in ('new', 'resolved'):
+        yield from finding_rows(domain, diff[change], scan_time, change)
+
+class ReportWriter:
+    """Base class: append findings to one output stream with bounded buffering.
+
+    ``write_report`` may be called from several threads (or from a scan
+    loop's callbacks); rows are written under a lock and flushed every
+    ``flush_interval`` rows so a crash loses at most that many.
+    """
+
+    def __init__(self, path=None, flush_interval=WRITER_FLUSH_INTERVAL, columns=COLUMNS):
+        self.path = path
+        self.columns = columns
+        self.flush_interval = flush_interval
+        self.rows = 0
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        self._stream = self._open(path) if path and path != '-' else sys.stdout
+
+    def _open(self, path):
+        return open(path, 'a', encoding='utf-8', newline='')
+
+    def write_report(self, domain, report, scan_time=None):
+        self.write_rows(list(finding_rows(domain, report, scan_time)))
+
+    def write_diff(self, domain, diff, scan_time=None):
+        self.write_rows(list(diff_rows(domain, diff, scan_time)))
+
+    def write_rows(self, rows):
+        with self._lock:
+            for row in rows:
+                self._write_row(row)
+            self.rows += len(rows)
+            self._unflushed += len(rows)
+            if self._unflushed >= self.flush_interval:
+                self._flush()
+                self._unflushed = 0
+
+    def _write_row(self, row):
+        raise NotImplementedError
+
+    def _flush(self):
+        self._stream.flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._stream is not sys.stdout:
+                self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class NDJSONWriter(ReportWriter):
+    def _write_row(self, row):
+        self._stream.write(json.dumps(row) + "\n")
+
+class CSVWriter(ReportWriter):
+    def __init__(self, path=None, flush_interval=WRITER_FLUSH_INTERVAL, columns=COLUMNS):
+        super().__init__(path, flush_interval, columns)
+        self._writer = csv.DictWriter(self._stream, fieldnames=columns)
+        # Appending to an existing file must not repeat the header.
+        if self._stream is sys.stdout or self._stream.tell() == 0:
+            self._writer.writeheader()
+
+    def _write_row(self, row):
+        self._writer.writerow(row)
+
+def _load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+class ColumnarWriter(ReportWriter):
+    """Buffer rows into column arrays and write them out one row group at a time.
+
+    Writes Parquet when ``pyarrow`` is installed; otherwise each row group is
+    one JSON line of ``{column: [values...]}``.  Memory is bounded by
+    ``row_group_size`` rows either way.
+    """
+
+    def __init__(self, path, row_group_size=COLUMNAR_ROW_GROUP_SIZE, columns=COLUMNS):
+        if not path or path == '-':
+            raise ValueError("Columnar output needs an output file")
+        self._arrow = _load_pyarrow()
+        self._parquet = None
+        self.row_group_size = row_group_size
+        self.columns = columns
+        self._columns = {column: [] for column in columns}
+        super().__init__(path, flush_interval=row_group_size, columns=columns)
+
+    def _open(self, path):
+        if self._arrow is not None:
+            schema = self._arrow.schema([(column, self._arrow.string()) for column in self.columns])
+            self._parquet = self._arrow.parquet.ParquetWriter(path, schema)
+            return None
+        return open(path, 'a', encoding='utf-8')
+
+    def _write_row(self, row):
+        for column in self.columns:
+            value = row[column]
+            # The Parquet schema is all strings (counts in aggregate rows are not).
+            if self._parquet is not None and value is not None and not isinstance(value, str):
+                value = str(value)
+            self._columns[column].append(value)
+
+    def _flush(self):
+        if not self._columns['domain']:
+            return
+        if self._parquet is not None:
+            self._parquet.write_table(self._arrow.table(self._columns))
+        else:
+            self._stream.write(json.dumps(self._columns) + "\n")
+            self._stream.flush()
+        self._columns = {column: [] for column in self.columns}
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._parquet is not None:
+                self._parquet.close()
+            else:
+                self._stream.close()
+
+WRITERS = {
+    'json': NDJSONWriter,
+    'csv': CSVWriter,
+    'columnar': ColumnarWriter
+}
+
+def file_extension(format):
+    if format == 'columnar':
+        return 'parquet' if _load_pyarrow() is not None else 'columnar.jsonl'
+    return format
+
+def open_writer(format, path=None, columns=COLUMNS):
+    """Return the streaming writer for ``format`` (``json``, ``csv`` or ``columnar``)."""
+    return WRITERS[format](path, columns=columns)
+
+def read_rows(format, path):
+    """Yield the row dicts of a file written by the ``format`` writer."""
+    if format == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    elif format == 'columnar' and path.endswith('.parquet'):
+        arrow = _load_pyarrow()
+        if arrow is None:
+            raise ValueError("Reading Parquet files requires pyarrow")
+        yield from arrow.parquet.read_table(path).to_pylist()
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if format == 'columnar':
+                    # One row group: {column: [values...]}
+                    yield from (dict(zip(data, values)) for values in zip(*data.values()))
+                else:
+                    yield data
+
+def merge_outputs(format, paths, output):
+    """Merge the outputs of several shards (same ``format``) into ``output``; returns the row count."""
+    rows = (row for path in paths for row in read_rows(format, path))
+    first = next(rows, None)
+    columns = DIFF_COLUMNS if first is not None and 'change' in first else COLUMNS
+    with open_writer(format, output, columns=columns) as writer:
+        if first is not None:
+            writer.write_rows([first])
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= WRITER_FLUSH_INTERVAL:
+                writer.write_rows(batch)
+                batch = []
+        writer.write_rows(batch)
+        return writer.rows
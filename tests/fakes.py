@@ -0,0 +1,90 @@
+"""In-memory stand-ins shared by the test modules"""
+
+import asyncio
+import dns.rdataclass
+import dns.rdatatype
+from dns.rdtypes.ANY.TXT import TXT
+from dmarc_audit.resolver import DNSAnswer, cache_key
+from dmarc_audit.mta_sts import PolicyResult
+from dmarc_audit.smtp import ProbeResult
+
+def txt_rdata(value):
+    """``value`` as the real resolver returns a TXT record: ``str(rdata)``, quoted, in 255-byte strings."""
+    data = value.encode()
+    strings = [data[i:i + 255] for i in range(0, len(data), 255)] or [b""]
+    return str(TXT(dns.rdataclass.IN, dns.rdatatype.TXT, strings))
+
+class FakeResolver:
+    """Answers lookups from a ``{(name, type): [records]}`` dict and counts queries.
+
+    TXT values are returned quoted, as :func:`txt_rdata` formats them, like
+    the real resolver does; values that are already quoted are kept as given.
+    """
+
+    def __init__(self, records):
+        self.records = {
+            cache_key(*key): [value if key[1].upper() != 'TXT' or value.startswith('"') else txt_rdata(value)
+                              for value in values]
+            for key, values in records.items()
+        }
+        self.queries = []
+
+    def lookup(self, name, record_type):
+        key = cache_key(name, record_type)
+        self.queries.append(key)
+        if key in self.records:
+            records = self.records[key]
+            return DNSAnswer(tuple(records), 300, 'NOERROR' if records else 'NODATA')
+        return DNSAnswer((), 300, 'NXDOMAIN')
+
+    async def alookup(self, name, record_type):
+        await asyncio.sleep(0)
+        return self.lookup(name, record_type)
+
+    def resolve(self, name, record_type):
+        return list(self.lookup(name, record_type).records)
+
+    async def aresolve(self, name, record_type):
+        return list((await self.alookup(name, record_type)).records)
+
+class FlakyResolver(FakeResolver):
+    """A :class:`FakeResolver` whose lookups of ``failing`` names time out."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.failing = set()
+
+    def lookup(self, name, record_type):
+        if cache_key(name, record_type) in self.failing:
+            return DNSAnswer((), 0, 'TIMEOUT')
+        return super().lookup(name, record_type)
+
+class FakeProber:
+    """Returns a successful STARTTLS probe for every host and counts probes."""
+
+    def __init__(self, starttls=True, tls_version='TLSv1.3'):
+        self.starttls = starttls
+        self.tls_version = tls_version
+        self.probed = []
+
+    async def probe(self, host):
+        self.probed.append(host)
+        return ProbeResult(host, ehlo=[host, "STARTTLS"] if self.starttls else [host],
+                           starttls=self.starttls, tls_version=self.tls_version if self.starttls else None)
+
+    async def probe_all(self, hosts):
+        return {host: await self.probe(host) for host in hosts}
+
+    def forget(self, host):
+        pass
+
+class FakePolicyFetcher:
+    """Serves the same MTA-STS policy text for every domain and counts fetches."""
+
+    def __init__(self, text="version: STSv1\nmode: enforce\nmx: *.example.com\nmax_age: 604800\n"):
+        self.text = text
+        self.fetched = []
+
+    async def fetch(self, domain, policy_id):
+        self.fetched.append((domain, policy_id))
+        return PolicyResult(domain, policy_id, self.text)
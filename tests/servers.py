@@ -0,0 +1,215 @@
+"""Local network stand-ins (SMTP, HTTPS) for exercising the probes without the internet"""
+
+import asyncio
+import datetime
+import os
+import ssl
+import tempfile
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+def self_signed_certificate(common_name="localhost", key_size=2048, days=365, alt_names=()):
+    """Return ``(cert_pem, key_pem)`` for a throwaway self-signed certificate.
+
+    ``days`` is the remaining validity; a negative value gives an expired certificate.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=max(1, 1 - days)))
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.DNSName(name) for name in (common_name,) + tuple(alt_names)]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()
+    )
+    return cert.public_bytes(serialization.Encoding.PEM), key_pem
+
+def server_ssl_context(common_name="localhost", **kwargs):
+    """Server-side SSL context loaded with a fresh self-signed certificate."""
+    return _server_context(*self_signed_certificate(common_name, **kwargs))
+
+def _server_context(cert_pem, key_pem):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cert_path = os.path.join(tmpdir, "cert.pem")
+        key_path = os.path.join(tmpdir, "key.pem")
+        with open(cert_path, "wb") as f:
+            f.write(cert_pem)
+        with open(key_path, "wb") as f:
+            f.write(key_pem)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+    return context
+
+class SMTPStub:
+    """Minimal asyncio SMTP server speaking EHLO/STARTTLS/QUIT on 127.0.0.1.
+
+    The first ``busy`` connections are turned away with ``421``.
+    """
+
+    def __init__(self, starttls=True, ssl_context=None, delay=0.0, busy=0):
+        self.starttls = starttls
+        self.busy = busy
+        self.ssl_context = ssl_context
+        self.delay = delay
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+        self.port = None
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.connections <= self.busy:
+                writer.write(b"421 stub.test too many connections\r\n")
+                await writer.drain()
+                return
+            writer.write(b"220 stub.test ESMTP\r\n")
+            while True:
+                line = (await reader.readline()).decode().strip().upper()
+                if not line or line == "QUIT":
+                    writer.write(b"221 bye\r\n")
+                    break
+                if line.startswith("EHLO"):
+                    extensions = ["PIPELINING", "SIZE 1000000"]
+                    if self.starttls and writer.get_extra_info('ssl_object') is None:
+                        extensions.append("STARTTLS")
+                    lines = ["stub.test"] + extensions
+                    writer.write("".join(
+                        f"250{' ' if i == len(lines) - 1 else '-'}{text}\r\n" for i, text in enumerate(lines)
+                    ).encode())
+                elif line == "STARTTLS" and self.starttls:
+                    writer.write(b"220 ready\r\n")
+                    await writer.drain()
+                    await writer.start_tls(self.ssl_context)
+                    continue
+                else:
+                    writer.write(b"502 unrecognized\r\n")
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+class HTTPSStub:
+    """Minimal asyncio HTTPS server on 127.0.0.1 answering ``GET`` from a ``{(host, path): response}`` dict.
+
+    A response is ``(status, content_type, body)``.  The certificate covers
+    every host in ``responses``; :attr:`client_context` trusts it.  Bodies
+    are sent with a ``Content-Length``, in two chunks (``chunked``), or in
+    two writes ended by closing the connection (``close_delimited``).
+    """
+
+    def __init__(self, responses, chunked=False, close_delimited=False):
+        self.responses = responses
+        self.chunked = chunked
+        self.close_delimited = close_delimited
+        self.requests = []
+        hosts = sorted({host for host, _ in responses})
+        cert_pem, key_pem = self_signed_certificate(hosts[0], alt_names=hosts[1:])
+        self.ssl_context = _server_context(cert_pem, key_pem)
+        self.client_context = ssl.create_default_context(cadata=cert_pem.decode())
+        self.port = None
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            host = headers.get('host', '')
+            self.requests.append((host, request[1]))
+            status, content_type, body = self.responses.get((host, request[1]), (404, 'text/plain', 'not found'))
+            body = body.encode()
+            head = f"HTTP/1.1 {status} X\r\nContent-Type: {content_type}\r\nConnection: close\r\n"
+            if self.chunked:
+                payload = b"".join(b"%x\r\n%s\r\n" % (len(part), part) for part in (body[:5], body[5:]) if part)
+                writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode() + payload + b"0\r\n\r\n")
+            elif self.close_delimited:
+                writer.write(f"{head}\r\n".encode() + body[:len(body) // 2])
+                await writer.drain()
+                await asyncio.sleep(0.05)
+                writer.write(body[len(body) // 2:])
+            else:
+                writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+class TLSStub:
+    """TLS server on 127.0.0.1 that completes the handshake and hangs up.
+
+    With ``handshake=False`` it accepts the TCP connection but never answers
+    the ClientHello.  :attr:`client_context` trusts its certificate.
+    """
+
+    def __init__(self, common_name="localhost", handshake=True, alt_names=(), **kwargs):
+        self.handshake = handshake
+        self.connections = 0
+        cert_pem, key_pem = self_signed_certificate(common_name, alt_names=alt_names, **kwargs)
+        self.ssl_context = _server_context(cert_pem, key_pem)
+        self.client_context = ssl.create_default_context(cadata=cert_pem.decode())
+        self.port = None
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0,
+                                                  ssl=self.ssl_context if self.handshake else None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if not self.handshake:
+                await reader.read()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
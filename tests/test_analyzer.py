@@ -1,5 +1,9 @@
+import base64
 import unittest
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from dmarc_audit.analyzer import (
     analyze_dmarc,
     analyze_spf,
@@ -7,6 +11,9 @@ from dmarc_audit.analyzer import (
     SecurityAnalyzer,
     get_dns_record
 )
+from dmarc_audit.context import AuditContext
+from dmarc_audit.tls import CertificateInfo, TLSResult
+from fakes import FakeResolver, FakeProber, FakePolicyFetcher
 
 class TestDMARCAnalyzer(unittest.TestCase):
     def test_missing_dmarc(self):
@@ -33,16 +40,45 @@ class TestSPFAnalyzer(unittest.TestCase):
         vulns, recs = analyze_spf(record)
         self.assertIn("Overly permissive SPF policy (+all)", vulns)
 
-    @patch('dmarc_audit.analyzer.get_dns_record')
-    def test_dkim_check(self, mock_dns):
-        mock_dns.return_value = ["v=DKIM1; k=rsa; p=MIGfMA0..."]
-        vulns, recs = check_dkim("example.com", "selector1")
+    def test_dkim_check(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+        der = key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        resolver = FakeResolver({
+            ("selector1._domainkey.example.com", "TXT"): [f"v=DKIM1; k=rsa; p={base64.b64encode(der).decode()}"],
+            ("example.com", "MX"): ["10 mail.example.com."]
+        })
+        context = AuditContext("example.com", "selector1", resolver=resolver, prober=FakeProber(),
+                               policy_fetcher=FakePolicyFetcher())
+        vulns, recs = check_dkim("example.com", "selector1", context)
         self.assertEqual(len(vulns), 0)
 
 class TestSecurityAnalyzer(unittest.TestCase):
-    @patch('socket.create_connection')
-    def test_ssl_check(self, mock_socket):
-        mock_socket.return_value = MagicMock()
+    def test_reverse_dns(self):
+        resolver = FakeResolver({
+            ("mail.example.com", "A"): ["192.0.2.1"],
+            ("1.2.0.192.in-addr.arpa", "PTR"): ["mail.example.com."],
+            ("contoso-com.mail.protection.outlook.com", "A"): ["192.0.2.2"],
+            ("2.2.0.192.in-addr.arpa", "PTR"): ["mail-db8.outbound.protection.outlook.com."],
+            ("alt1.aspmx.l.google.com", "A"): ["192.0.2.3"],
+            ("3.2.0.192.in-addr.arpa", "PTR"): ["mail-db9.outbound.protection.outlook.com."],
+            ("spoof.example.com", "AAAA"): ["2001:db8::4"],
+            ("4.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.8.b.d.0.1.0.0.2.ip6.arpa", "PTR"): ["notexample.com."],
+        })
+        analyzer = SecurityAnalyzer("example.com", context=AuditContext("example.com", resolver=resolver))
+        self.assertEqual(analyzer.check_reverse_dns("mail.example.com"), [])
+        # A PTR in the MX host's own provider is consistent; one in another provider is not.
+        self.assertEqual(analyzer.check_reverse_dns("contoso-com.mail.protection.outlook.com"), [])
+        self.assertEqual(analyzer.check_reverse_dns("alt1.aspmx.l.google.com"),
+                         ["Reverse DNS mismatch for alt1.aspmx.l.google.com"])
+        vulns = analyzer.check_reverse_dns("spoof.example.com")
+        self.assertEqual(vulns[0].evidence, {'host': "spoof.example.com", 'names': ["notexample.com"]})
+
+    @patch('dmarc_audit.tls.TLSInspector.inspect')
+    def test_ssl_check(self, mock_inspect):
+        not_after = (datetime.now(timezone.utc) + timedelta(days=365)).isoformat()
+        leaf = CertificateInfo("00", "CN=mail.example.com", "CN=CA", not_after, 'rsa', 2048, False)
+        mock_inspect.return_value = TLSResult("mail.example.com", 443, "TLSv1.3", "TLS_AES_128_GCM_SHA256",
+                                              [leaf], verified=True)
         analyzer = SecurityAnalyzer("example.com")
         vulns = analyzer.check_ssl_tls("mail.example.com")
         self.assertEqual(len(vulns), 0)
@@ -0,0 +1,103 @@
+import ast
+import asyncio
+import base64
+import glob
+import os
+import pickle
+import unittest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from dmarc_audit.analyzer import analyze_dkim_selectors, analyze_dmarc
+from dmarc_audit.api import AuditResult, Finding, aaudit_many, audit_domain, findings_from_report
+from dmarc_audit.findings import Message
+from dmarc_audit.smtp import ProbeResult, mx_findings
+from dmarc_audit.tls import TLSResult, tls_findings
+from fakes import FakeResolver, FakeProber
+
+def rsa_key(bits):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=bits).public_key()
+    der = key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return base64.b64encode(der).decode()
+
+FAKE_RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 -all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=reject; pct=50"],
+    ("example.com", "MX"): ["10 mail.example.com."],
+}
+
+SOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'dmarc_audit')
+# Lists the analyzers collect finding messages in.
+FINDING_LISTS = {'vulnerabilities', 'recommendations', 'errors', 'node.errors', 'result.errors'}
+
+def is_text(node):
+    return isinstance(node, ast.JoinedStr) or isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+def bare_messages():
+    """``(file, line)`` of every finding appended or returned as plain text instead of a ``Message``."""
+    for path in sorted(glob.glob(os.path.join(SOURCES, '*.py'))):
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'append'
+                    and node.args and ast.unparse(node.func.value) in FINDING_LISTS and is_text(node.args[0])):
+                yield os.path.basename(path), node.lineno
+            elif isinstance(node, ast.Return) and isinstance(node.value, ast.Tuple):
+                for element in node.value.elts:
+                    if isinstance(element, ast.List) and any(map(is_text, element.elts)):
+                        yield os.path.basename(path), node.lineno
+
+class TestFindingCodes(unittest.TestCase):
+    def test_every_finding_is_emitted_with_a_code(self):
+        self.assertEqual(list(bare_messages()), [])
+
+    def test_codes_and_evidence(self):
+        vulns, _ = analyze_dmarc(["v=DMARC1; p=reject; pct=50"])
+        self.assertEqual((vulns[0].code, vulns[0].evidence), ("dmarc.partial-enforcement", {'pct': 50}))
+        vulns, _ = analyze_dkim_selectors({'s1': ["v=DKIM1; k=rsa; p=" + rsa_key(1024)]})
+        self.assertEqual((vulns[0].code, vulns[0].evidence), ("dkim.weak-rsa-key", {'bits': 1024, 'selector': 's1'}))
+        self.assertTrue(vulns[0].startswith("[s1] Weak RSA key length detected"))
+        vulns, recs = mx_findings(ProbeResult("mx.example.com", starttls=False))
+        self.assertEqual({vulns[0].code, recs[0].code}, {"mx.no-starttls"})
+        self.assertEqual(vulns[0].evidence, {'host': "mx.example.com"})
+
+    def test_shared_codes_take_the_check(self):
+        vulns, _ = tls_findings(TLSResult("mta-sts.example.com", 443, error="Connect timed out"))
+        finding, = findings_from_report({'mta_sts': (vulns, [])})
+        self.assertEqual(finding.code, "mta_sts.tls-failed")
+        self.assertEqual(finding.evidence, {'host': "mta-sts.example.com", 'port': 443, 'error': "Connect timed out"})
+        self.assertEqual(finding.message, "TLS check failed for mta-sts.example.com:443: Connect timed out")
+
+    def test_codes_survive_pickling(self):
+        message = pickle.loads(pickle.dumps(Message("spf.too-many-lookups", "Excessive DNS lookups", lookups=12)))
+        self.assertEqual((message, message.code, message.evidence),
+                         ("Excessive DNS lookups", "spf.too-many-lookups", {'lookups': 12}))
+
+    def test_report_round_trip(self):
+        report = {'spf': (["Missing SPF record"], []), 'dmarc': ([], ["Consider specifying SPF alignment mode (aspf)"])}
+        result = AuditResult("example.com", findings_from_report(report))
+        self.assertEqual(result.to_report(), report)
+        self.assertEqual([f.severity for f in result.findings], ['ERROR', 'WARNING'])
+        # Text read back from JSON has lost its code.
+        self.assertEqual([f.code for f in result.findings], ['spf.other', 'dmarc.other'])
+
+class TestAudit(unittest.TestCase):
+    def test_audit_domain(self):
+        result = audit_domain("example.com", resolver=FakeResolver(FAKE_RECORDS), prober=FakeProber())
+        codes = {f.code for f in result.findings}
+        self.assertIn("mta_sts.missing", codes)
+        self.assertIn("dkim.missing", codes)
+        finding = next(f for f in result.findings if f.code == "dmarc.partial-enforcement")
+        self.assertIsInstance(finding, Finding)
+        self.assertEqual(finding.evidence['records'], ["v=DMARC1; p=reject; pct=50"])
+
+    def test_aaudit_many(self):
+        async def collect():
+            domains = [f"d{i}.example" for i in range(10)]
+            return [r async for r in aaudit_many(domains, concurrency=3, resolver=FakeResolver(FAKE_RECORDS),
+                                                 prober=FakeProber())]
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(any(f.code == "spf.missing" for f in r.findings) for r in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import unittest
+from dmarc_audit.async_analyzer import AsyncSecurityAnalyzer, audit_domains
+from dmarc_audit.context import AuditContext
+from fakes import FakeResolver, FakeProber
+
+FAKE_RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 -all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=none;"],
+    ("example.com", "MX"): ["10 mail.example.com."],
+}
+
+class TestAsyncSecurityAnalyzer(unittest.TestCase):
+    def test_check_all(self):
+        context = AuditContext("example.com", resolver=FakeResolver(FAKE_RECORDS), prober=FakeProber())
+        report = asyncio.run(AsyncSecurityAnalyzer("example.com", context=context).check_all())
+        self.assertEqual(set(report), {'spf', 'dmarc', 'dkim', 'mta_sts', 'mx'})
+        self.assertIn("Policy set to monitoring only (p=none)", report['dmarc'][0])
+        self.assertIn("Missing DKIM record", report['dkim'][0])
+        self.assertEqual(report['mx'], ([], []))
+
+    def test_each_fact_fetched_once(self):
+        resolver = FakeResolver(FAKE_RECORDS)
+        context = AuditContext("example.com", resolver=resolver, prober=FakeProber())
+        asyncio.run(AsyncSecurityAnalyzer("example.com", context=context).check_all())
+        self.assertEqual(context.operations['dns'], 6)
+        self.assertEqual(context.operations['smtp'], 1)
+        self.assertEqual(resolver.queries.count(("_mta-sts.example.com", "TXT")), 1)
+
+    def test_audit_domains_streams_every_domain(self):
+        async def collect():
+            domains = [f"d{i}.example" for i in range(25)] + ["example.com"]
+            stream = audit_domains(domains, concurrency=4, resolver=FakeResolver(FAKE_RECORDS), prober=FakeProber())
+            return [domain async for domain, _ in stream]
+        seen = asyncio.run(collect())
+        self.assertEqual(len(seen), 26)
+        self.assertIn("example.com", seen)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from dmarc_audit.cache import PersistentCache
+from dmarc_audit.resolver import CachingResolver
+
+class FakeAnswer(list):
+    def __init__(self, records, ttl=300):
+        super().__init__(records)
+        self.expiration = time.time() + ttl
+
+class TestPersistentCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip_survives_reopen(self):
+        with PersistentCache(self.path) as cache:
+            cache.put("example.com", "TXT", "NOERROR", ["v=spf1 -all"], 300)
+        with PersistentCache(self.path) as cache:
+            status, value, ttl = cache.get("example.com", "TXT")
+        self.assertEqual((status, value), ("NOERROR", ["v=spf1 -all"]))
+        self.assertLessEqual(ttl, 300)
+
+    def test_expired_by_ttl(self):
+        with PersistentCache(self.path) as cache:
+            cache.put("example.com", "TXT", "NOERROR", ["x"], 0)
+            self.assertIsNone(cache.get("example.com", "TXT"))
+
+    def test_max_age_overrides_ttl(self):
+        with PersistentCache(self.path) as cache:
+            cache.put("example.com", "TXT", "NOERROR", ["x"], 0)
+        with PersistentCache(self.path, max_age=3600) as cache:
+            self.assertIsNotNone(cache.get("example.com", "TXT"))
+
+    def test_processes_share_the_file(self):
+        # Two connections stand in for two --workers processes writing the same cache.
+        with patch('dmarc_audit.cache.CACHE_COMMIT_INTERVAL', 2):
+            first, second = PersistentCache(self.path), PersistentCache(self.path)
+            first.put("a.test", "TXT", "NOERROR", ["a"], 300)
+            self.assertEqual(first.get("a.test", "TXT")[1], ["a"])
+            # first has an unwritten batch; second's batch must not wait for it.
+            second.put("b.test", "TXT", "NOERROR", ["b"], 300)
+            second.put("c.test", "TXT", "NOERROR", ["c"], 300)
+            first.put("d.test", "TXT", "NOERROR", ["d"], 300)
+            first.close()
+            second.close()
+        with PersistentCache(self.path) as cache:
+            self.assertEqual([cache.get(name, "TXT")[1] for name in ("a.test", "b.test", "c.test", "d.test")],
+                             [["a"], ["b"], ["c"], ["d"]])
+
+    def test_warm_resolver_skips_network(self):
+        with PersistentCache(self.path) as cache:
+            resolver = CachingResolver(nameservers=['192.0.2.1'], store=cache)
+            with patch.object(resolver.upstreams[0].sync_resolver, 'resolve', return_value=FakeAnswer(["10 mx.example.com."])):
+                resolver.resolve("example.com", "MX")
+        with PersistentCache(self.path) as cache:
+            resolver = CachingResolver(nameservers=['192.0.2.1'], store=cache)
+            with patch.object(resolver.upstreams[0].sync_resolver, 'resolve') as mock:
+                self.assertEqual(resolver.resolve("example.com", "MX"), ["10 mx.example.com."])
+            mock.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
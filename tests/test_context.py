@@ -0,0 +1,35 @@
+import unittest
+from dmarc_audit.analyzer import check_dkim, SecurityAnalyzer
+from dmarc_audit.context import AuditContext
+from fakes import FakeResolver, FakeProber, FakePolicyFetcher
+
+RECORDS = {
+    ("selector1._domainkey.example.com", "TXT"): ["v=DKIM1; p="],
+    ("_mta-sts.example.com", "TXT"): ["v=STSv1; id=1"],
+    ("example.com", "MX"): ["10 mx1.example.com.", "20 mx2.example.com."],
+}
+
+class TestAuditContext(unittest.TestCase):
+    def test_checks_share_one_set_of_fetches(self):
+        resolver = FakeResolver(RECORDS)
+        prober = FakeProber()
+        policies = FakePolicyFetcher()
+        context = AuditContext("example.com", resolver=resolver, prober=prober, policy_fetcher=policies).prefetch()
+        check_dkim("example.com", "selector1", context)
+        analyzer = SecurityAnalyzer("example.com", context=context)
+        analyzer.check_email_headers()
+        analyzer.check_mx_records()
+        self.assertEqual(sorted(prober.probed), ["mx1.example.com", "mx2.example.com"])
+        self.assertEqual(len(resolver.queries), len(set(resolver.queries)))
+        self.assertEqual(policies.fetched, [("example.com", "1")])
+        self.assertEqual(context.network_ops, 9)
+
+    def test_starttls_header_from_probes(self):
+        context = AuditContext("example.com", resolver=FakeResolver(RECORDS), prober=FakeProber())
+        _, headers = SecurityAnalyzer("example.com", context=context).check_email_headers()
+        self.assertTrue(headers['STARTTLS'])
+        self.assertTrue(headers['MTA-STS'])
+        self.assertFalse(headers['TLS-RPT'])
+
+if __name__ == '__main__':
+    unittest.main()
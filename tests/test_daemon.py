@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from dmarc_audit.daemon import Watcher, serve_http
+from dmarc_audit.resolver import cache_key
+from dmarc_audit.state import StateStore
+from fakes import FakeResolver, FlakyResolver, FakeProber, FakePolicyFetcher
+
+RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 -all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=reject; adkim=s; aspf=s"],
+    ("example.com", "MX"): ["10 mail.example.com."],
+}
+
+def watcher(resolver, **options):
+    options.setdefault('jitter', 0)
+    return Watcher(["example.com"], resolver=resolver, prober=FakeProber(), policy_fetcher=FakePolicyFetcher(),
+                   **options)
+
+def run(coro):
+    return asyncio.run(coro)
+
+class TestWatcherChecks(unittest.TestCase):
+    def test_only_changed_checks_rerun(self):
+        resolver = FlakyResolver(RECORDS)
+        w = watcher(resolver)
+        watch = w.domains["example.com"]
+        diff, delay = run(w.check(watch))
+        self.assertEqual(set(watch.report), {'spf', 'dmarc', 'dkim', 'mta_sts', 'mx'})
+        self.assertIn('dkim', diff['new'])
+        # FakeResolver answers carry a 300s TTL.
+        self.assertEqual(delay, 300)
+
+        self.assertIsNone(run(w.check(watch))[0])
+        self.assertEqual(w.checks[('dmarc', 'unchanged')], 1)
+
+        resolver.records[cache_key("_dmarc.example.com", "TXT")] = ["v=DMARC1; p=none; adkim=s; aspf=s"]
+        diff, _ = run(w.check(watch))
+        self.assertEqual(diff['new'], {'dmarc': (["Policy set to monitoring only (p=none)"], [])})
+        self.assertEqual(diff['resolved'], {})
+        self.assertEqual((w.checks[('dmarc', 'run')], w.checks[('spf', 'run')]), (2, 1))
+
+    def test_failed_lookup_keeps_findings(self):
+        resolver = FlakyResolver(RECORDS)
+        w = watcher(resolver, min_interval=5)
+        watch = w.domains["example.com"]
+        run(w.check(watch))
+        report = dict(watch.report)
+        resolver.failing.add(cache_key("_dmarc.example.com", "TXT"))
+        diff, delay = run(w.check(watch))
+        self.assertIsNone(diff)
+        self.assertEqual(delay, 5)
+        self.assertEqual(watch.report, report)
+        self.assertEqual(watch.error, "DNS lookup failed for dmarc")
+        self.assertEqual(w.checks[('dmarc', 'failed')], 1)
+
+    def test_state_committed_after_each_check(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "state.sqlite3")
+            with StateStore(path) as state:
+                w = watcher(FakeResolver(RECORDS), state=state)
+                run(w.check(w.domains["example.com"]))
+                # Read through a second connection while the daemon's is still open.
+                with StateStore(path) as reader:
+                    saved = reader.get("example.com")
+        self.assertIsNotNone(saved)
+        self.assertEqual(set(saved.report), {'spf', 'dmarc', 'dkim', 'mta_sts', 'mx'})
+
+    def test_interval_clamped_to_bounds(self):
+        w = watcher(FakeResolver(RECORDS), min_interval=60, max_interval=3600)
+        self.assertEqual([w.interval(ttl) for ttl in (5, 300, 86400, None)], [60, 300, 3600, 3600])
+        w.jitter = 0.5
+        self.assertTrue(300 <= w.interval(300) <= 450)
+
+class TestWatcherLoop(unittest.TestCase):
+    def test_rechecks_when_due_and_reports_changes(self):
+        resolver = FakeResolver(RECORDS)
+        changes = []
+        w = watcher(resolver, min_interval=0.05, max_interval=0.05,
+                    on_change=lambda domain, diff: changes.append((domain, diff)))
+
+        async def scenario():
+            task = asyncio.ensure_future(w.run())
+            await asyncio.sleep(0.12)
+            resolver.records[cache_key("example.com", "TXT")] = ["v=spf1 +all"]
+            w.add("other.test")
+            await asyncio.sleep(0.15)
+            w.stop()
+            await task
+        run(scenario())
+        self.assertGreaterEqual(w.domains["example.com"].audits, 4)
+        self.assertGreaterEqual(w.domains["other.test"].audits, 1)
+        # The first check reports every finding as new; the record change adds one.
+        spf_changes = [diff for domain, diff in changes if domain == "example.com" and 'spf' in diff['new']]
+        self.assertEqual(spf_changes[-1]['new']['spf'][0], ["Overly permissive SPF policy (+all)"])
+
+    def test_removed_domain_not_checked(self):
+        w = watcher(FakeResolver(RECORDS), min_interval=0.01, max_interval=0.01)
+        w.set_domains(["other.test"])
+
+        async def scenario():
+            task = asyncio.ensure_future(w.run())
+            await asyncio.sleep(0.05)
+            w.stop()
+            await task
+        run(scenario())
+        self.assertEqual(list(w.domains), ["other.test"])
+        self.assertEqual(w.checks[('spf', 'run')], 1)
+
+class TestHTTPEndpoint(unittest.TestCase):
+    def test_metrics_and_domains(self):
+        w = watcher(FakeResolver(RECORDS))
+
+        async def get(port, path):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.partition(b"\r\n\r\n")
+            return head.split(b" ", 2)[1].decode(), body
+
+        async def scenario():
+            await w.check(w.domains["example.com"])
+            server = await serve_http(w, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return [await get(port, path) for path in ("/metrics", "/domains/example.com", "/domains/nope.test")]
+            finally:
+                server.close()
+                await server.wait_closed()
+        (status, metrics), (_, detail), (missing, _) = run(scenario())
+        self.assertEqual(status, "200")
+        self.assertIn(b'dmarc_audit_checks_total{check="spf",outcome="run"} 1', metrics)
+        self.assertIn(b'dmarc_audit_findings{check="dkim",severity="ERROR"} 1', metrics)
+        detail = json.loads(detail)
+        self.assertEqual(detail['audits'], 1)
+        self.assertIn("dkim.missing", [finding['code'] for finding in detail['findings']])
+        self.assertEqual(missing, "404")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import base64
+import unittest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+from dmarc_audit import dkim
+from dmarc_audit.analyzer import analyze_dkim
+from dmarc_audit.async_analyzer import AsyncSecurityAnalyzer
+from dmarc_audit.context import AuditContext
+from dmarc_audit.records import parse_dkim
+from fakes import FakeResolver, FakeProber, txt_rdata
+
+SELECTORS = ["selector1", "google", "k1", "s1"]
+
+RECORDS = {
+    ("_domainkey.example.com", "TXT"): [],
+    ("google._domainkey.example.com", "TXT"): ["v=DKIM1; k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQ"],
+    ("k1._domainkey.example.com", "TXT"): ["v=DKIM1; k=rsa; p="],
+}
+
+class TestSelectorDiscovery(unittest.TestCase):
+    def discover(self, domain, resolver):
+        context = AuditContext(domain, resolver=resolver, prober=FakeProber())
+        return asyncio.run(context.adiscover_selectors(SELECTORS))
+
+    def test_reports_every_selector_found(self):
+        found = self.discover("example.com", FakeResolver(RECORDS))
+        self.assertEqual(list(found), ["google", "k1"])
+
+    def test_stops_on_nxdomain_domainkey(self):
+        resolver = FakeResolver(RECORDS)
+        self.assertEqual(self.discover("other.test", resolver), {})
+        self.assertEqual(resolver.queries, [("_domainkey.other.test", "TXT")])
+
+    def test_findings_prefixed_with_selector(self):
+        context = AuditContext("example.com", resolver=FakeResolver(RECORDS), prober=FakeProber())
+        analyzer = AsyncSecurityAnalyzer("example.com", context=context, dkim_selectors=SELECTORS)
+        vulns, _ = asyncio.run(analyzer.check_dkim())
+        self.assertTrue(any(v.startswith("[k1] ") for v in vulns))
+        self.assertTrue(any(v.startswith("[google] ") for v in vulns))
+        self.assertNotIn("Missing DKIM record", vulns)
+
+def rsa_key(bits, encoding=serialization.PublicFormat.SubjectPublicKeyInfo):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=bits).public_key()
+    return base64.b64encode(key.public_bytes(serialization.Encoding.DER, encoding)).decode()
+
+class TestDKIMKeys(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rsa1024 = rsa_key(1024)
+        cls.rsa2048 = rsa_key(2048)
+
+    def test_exact_rsa_modulus_size(self):
+        vulns, recs = analyze_dkim([f"v=DKIM1; k=rsa; p={self.rsa1024}"])
+        self.assertEqual(vulns, ["Weak RSA key length detected (1024 bits)"])
+        vulns, recs = analyze_dkim([f"v=DKIM1; k=rsa; p={self.rsa2048}"])
+        self.assertEqual(vulns, [])
+        self.assertEqual(len(recs), 1)
+
+    def test_quoted_multi_string_rdata(self):
+        # 2048-bit keys do not fit one 255-byte string, so the record arrives as several.
+        rdata = txt_rdata(f"v=DKIM1; k=rsa; p={self.rsa2048}")
+        self.assertTrue(rdata.startswith('"v=DKIM1') and '" "' in rdata)
+        vulns, recs = analyze_dkim([rdata])
+        self.assertEqual(vulns, [])
+        self.assertEqual(len(recs), 1)
+        vulns, _ = analyze_dkim([txt_rdata(f"v=DKIM1; k=rsa; p={self.rsa1024}")])
+        self.assertEqual(vulns, ["Weak RSA key length detected (1024 bits)"])
+
+    def test_pkcs1_rsa_key(self):
+        key = rsa_key(1024, serialization.PublicFormat.PKCS1)
+        self.assertEqual(dkim.load_dkim_key('rsa', key).bits, 1024)
+
+    def test_ed25519_raw_key(self):
+        raw = ed25519.Ed25519PrivateKey.generate().public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        record = f"v=DKIM1; k=ed25519; p={base64.b64encode(raw).decode()}"
+        self.assertEqual(analyze_dkim([record]), ([], []))
+        self.assertEqual(dkim.load_dkim_key('ed25519', parse_dkim(record).public_key).bits, 256)
+
+    def test_folded_key_keeps_case(self):
+        folded = " ".join(self.rsa2048[i:i + 64] for i in range(0, len(self.rsa2048), 64))
+        self.assertEqual(parse_dkim(f"v=DKIM1; k=rsa; p={folded}").public_key, self.rsa2048)
+
+    def test_revoked_and_invalid_keys(self):
+        self.assertIn("Invalid or missing public key in DKIM record", analyze_dkim(["v=DKIM1; k=rsa; p="])[0])
+        vulns, _ = analyze_dkim(["v=DKIM1; k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQ=="])
+        self.assertTrue(vulns[0].startswith("Unable to analyze DKIM public key"))
+
+    def test_keys_memoized_by_fingerprint(self):
+        dkim.clear_key_cache()
+        first = dkim.load_dkim_key('rsa', self.rsa1024)
+        self.assertIs(dkim.load_dkim_key('rsa', self.rsa1024), first)
+        self.assertEqual(len(dkim._keys), 1)
+
+if __name__ == '__main__':
+    unittest.main()
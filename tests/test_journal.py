@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import unittest
+from dmarc_audit.async_analyzer import audit_domains
+from dmarc_audit.journal import Journal, JournalError
+from dmarc_audit.main import run_journaled
+from dmarc_audit.portfolio import Portfolio
+from dmarc_audit.writers import NDJSONWriter, read_rows
+from fakes import FakeResolver, FakeProber, FakePolicyFetcher
+
+REPORT = {
+    'spf': (["No SPF record found"], ["Add an SPF record"]),
+    'dmarc': ([], [])
+}
+
+RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 -all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=reject"],
+    ("example.com", "MX"): ["10 aspmx.l.google.com."],
+}
+
+OPTIONS = {'shard': [0, 1], 'dkim_selector': 'selector1', 'dkim_selectors': None}
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "run.journal")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, domains, **kwargs):
+        journal = Journal(self.path, OPTIONS, **kwargs)
+        journal.start(resume=True)
+        list(journal.replay())
+        with journal.open():
+            for domain in domains:
+                journal.record(domain, REPORT, "t0")
+        return journal
+
+    def test_records_are_synced_in_batches(self):
+        journal = self.write([f"d{i}.test" for i in range(5)], sync_records=2, sync_interval=3600)
+        # The header, two full batches and the remainder at close.
+        self.assertEqual(journal.syncs, 4)
+        records = list(Journal(self.path, OPTIONS).replay())
+        self.assertEqual([r.domain for r in records], [f"d{i}.test" for i in range(5)])
+        self.assertEqual(records[0].report, REPORT)
+        self.assertEqual(records[0].scan_time, "t0")
+
+    def test_torn_tail_is_dropped_and_truncated(self):
+        self.write(["a.test", "b.test"])
+        with open(self.path, 'ab') as f:
+            f.write(b'{"domain": "c.test", "rep')
+        journal = Journal(self.path, OPTIONS)
+        self.assertTrue(journal.start(resume=True))
+        self.assertEqual([r.domain for r in journal.replay()], ["a.test", "b.test"])
+        with journal.open():
+            journal.record("c.test", REPORT)
+        self.assertEqual([r.domain for r in Journal(self.path, OPTIONS).replay()], ["a.test", "b.test", "c.test"])
+
+    def test_existing_journal_needs_resume_and_same_options(self):
+        self.write(["a.test"])
+        with self.assertRaisesRegex(JournalError, "--resume"):
+            Journal(self.path, OPTIONS).start()
+        with self.assertRaisesRegex(JournalError, "different options"):
+            Journal(self.path, dict(OPTIONS, shard=[1, 4])).start(resume=True)
+        self.assertFalse(Journal(os.path.join(self.tmpdir.name, "new.journal"), OPTIONS).start())
+
+    def test_postures_follow_their_report(self):
+        portfolio = Portfolio()
+        journal = Journal(self.path, OPTIONS, portfolio)
+        journal.start()
+        with journal.open():
+            async def run():
+                async for domain, report in audit_domains(["example.com", "bare.test"], resolver=FakeResolver(RECORDS),
+                                                          prober=FakeProber(), policy_fetcher=FakePolicyFetcher(),
+                                                          portfolio=journal):
+                    # bare.test never finishes, as if the run was killed.
+                    if domain == "example.com":
+                        journal.record(domain, report)
+            asyncio.run(run())
+        self.assertEqual(len(portfolio), 2)
+        resumed = Portfolio()
+        for record in Journal(self.path, OPTIONS).replay():
+            resumed.add(record.posture)
+        self.assertEqual(len(resumed), 1)
+        self.assertEqual(resumed.summary()['categories']['provider'], {'Google Workspace': 1})
+
+    def test_resume_replays_output_and_skips_finished_domains(self):
+        self.write(["a.test", "b.test"])
+        audited = []
+
+        def run(args, writer, portfolio, journal, done):
+            for domain in ["a.test", "b.test", "c.test"]:
+                if domain not in done:
+                    audited.append(domain)
+                    writer.write_report(domain, REPORT)
+                    journal.record(domain, REPORT)
+            return len(audited)
+
+        args = argparse.Namespace(quiet=True, journal=self.path)
+        journal = Journal(self.path, OPTIONS)
+        self.assertTrue(journal.start(resume=True))
+        output = os.path.join(self.tmpdir.name, "out.ndjson")
+        with NDJSONWriter(output) as writer:
+            self.assertEqual(run_journaled(args, run, writer, None, journal), 3)
+        self.assertEqual(audited, ["c.test"])
+        domains = [row['domain'] for row in read_rows('json', output)]
+        self.assertEqual(domains, ["a.test"] * 2 + ["b.test"] * 2 + ["c.test"] * 2)
+        self.assertEqual(len(list(Journal(self.path, OPTIONS).replay())), 3)
+
+if __name__ == '__main__':
+    unittest.main()
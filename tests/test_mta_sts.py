@@ -0,0 +1,137 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from dmarc_audit.async_analyzer import AsyncSecurityAnalyzer
+from dmarc_audit.cache import PersistentCache
+from dmarc_audit.config import MTA_STS_MAX_POLICY_SIZE
+from dmarc_audit.context import AuditContext
+from dmarc_audit.mta_sts import POLICY_PATH, PolicyFetcher, _HTTPError, _read_body, mx_matches
+from dmarc_audit.records import parse_mta_sts, parse_mta_sts_policy
+from fakes import FakeResolver, FakeProber
+from servers import HTTPSStub
+
+POLICY = "version: STSv1\r\nmode: enforce\r\nmx: mail.example.com\r\nmx: *.backup.example.com\r\nmax_age: 604800\r\n"
+
+def stub(**kwargs):
+    return HTTPSStub({
+        ("mta-sts.example.com", POLICY_PATH): (200, "text/plain; charset=utf-8", POLICY),
+        ("mta-sts.html.test", POLICY_PATH): (200, "text/html", "<html></html>"),
+        ("mta-sts.moved.test", "/"): (200, "text/plain", "")
+    }, **kwargs)
+
+def fetcher(server, **kwargs):
+    return PolicyFetcher(port=server.port, ssl_context=server.client_context, connect_host='127.0.0.1', **kwargs)
+
+class TestParsing(unittest.TestCase):
+    def test_record(self):
+        self.assertEqual(parse_mta_sts("v=STSv1; id=20240101T000000;").id, "20240101T000000")
+        self.assertTrue(parse_mta_sts("v=STSv1; id=bad-id").errors)
+        self.assertTrue(parse_mta_sts("v=STSv2; id=1").errors)
+
+    def test_policy(self):
+        policy = parse_mta_sts_policy(POLICY)
+        self.assertEqual((policy.mode, policy.max_age, policy.errors), ('enforce', 604800, ()))
+        self.assertEqual(policy.mx, ("mail.example.com", "*.backup.example.com"))
+        self.assertTrue(parse_mta_sts_policy("version: STSv1\nmode: enforce\nmax_age: x\n").errors)
+
+    def test_mx_matches(self):
+        self.assertTrue(mx_matches("*.backup.example.com", "mx1.backup.example.com."))
+        self.assertFalse(mx_matches("*.backup.example.com", "a.mx1.backup.example.com"))
+        self.assertFalse(mx_matches("*.backup.example.com", "backup.example.com"))
+        self.assertTrue(mx_matches("Mail.Example.com", "mail.example.com"))
+
+class TestPolicyFetcher(unittest.TestCase):
+    def test_fetch_and_reuse_per_id(self):
+        async def run():
+            async with stub() as server:
+                policies = fetcher(server)
+                first = await policies.fetch("example.com", "1")
+                again = await asyncio.gather(*(policies.fetch("example.com", "1") for _ in range(5)))
+                changed = await policies.fetch("example.com", "2")
+                return first, again, changed, policies.requests
+        first, again, changed, requests = asyncio.run(run())
+        self.assertIsNone(first.error)
+        self.assertEqual(first.policy.mode, 'enforce')
+        self.assertTrue(all(result is first for result in again))
+        self.assertIsNone(changed.error)
+        self.assertEqual(requests, 2)
+
+    def test_persistent_cache(self):
+        async def run(store):
+            async with stub() as server:
+                policies = fetcher(server, store=store)
+                result = await policies.fetch("example.com", "1")
+                return result, policies.requests
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with PersistentCache(os.path.join(tmpdir, "cache.sqlite3")) as store:
+                _, cold = asyncio.run(run(store))
+                result, warm = asyncio.run(run(store))
+        self.assertEqual((cold, warm), (1, 0))
+        self.assertEqual(result.policy.mx[0], "mail.example.com")
+        self.assertTrue(result.tls.verified)
+        self.assertIn("CN=mta-sts.", result.tls.certificate.subject)
+
+    def test_errors(self):
+        async def run():
+            async with stub() as server:
+                policies = fetcher(server)
+                return await asyncio.gather(policies.fetch("html.test", "1"), policies.fetch("moved.test", "1"),
+                                            policies.fetch("unknown.test", "1"))
+        html, missing, unknown = asyncio.run(run())
+        self.assertIn("text/html", html.error)
+        self.assertEqual(missing.error, "HTTP 404")
+        self.assertIn("CERTIFICATE_VERIFY_FAILED", unknown.error)
+
+    def test_chunked(self):
+        async def run():
+            async with stub(chunked=True) as server:
+                return await fetcher(server).fetch("example.com", "1")
+        self.assertEqual(asyncio.run(run()).text, POLICY)
+
+    def test_body_read_until_close(self):
+        async def run():
+            async with stub(close_delimited=True) as server:
+                return await fetcher(server).fetch("example.com", "1")
+        result = asyncio.run(run())
+        self.assertEqual(result.text, POLICY)
+        self.assertEqual(result.policy.max_age, 604800)
+
+    def test_oversized_unframed_body_rejected(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"x" * MTA_STS_MAX_POLICY_SIZE)
+            reader.feed_data(b"x")
+            reader.feed_eof()
+            return await _read_body(reader, {})
+        with self.assertRaisesRegex(_HTTPError, "policy too large"):
+            asyncio.run(run())
+
+    def test_oversized_chunk_rejected_before_reading(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            # A 4 GB chunk is announced but never sent: it must be refused from the header alone.
+            reader.feed_data(b"10\r\nversion: STSv1\r\n\r\nffffffff\r\n")
+            reader.feed_eof()
+            return await _read_body(reader, {'transfer-encoding': 'chunked'})
+        with self.assertRaisesRegex(_HTTPError, "policy too large"):
+            asyncio.run(run())
+
+class TestMTASTSCheck(unittest.TestCase):
+    def test_mx_not_covered(self):
+        records = {
+            ("_mta-sts.example.com", "TXT"): ["v=STSv1; id=1"],
+            ("example.com", "MX"): ["10 mail.example.com.", "20 mx.other.test."],
+        }
+
+        async def run():
+            async with stub() as server:
+                context = AuditContext("example.com", resolver=FakeResolver(records), prober=FakeProber(),
+                                       policy_fetcher=fetcher(server))
+                return await AsyncSecurityAnalyzer("example.com", context=context).check_mta_sts()
+        vulns, recs = asyncio.run(run())
+        self.assertEqual(vulns, ["MX host mx.other.test is not covered by the MTA-STS policy"])
+        self.assertNotIn("Implement MTA-STS for enhanced mail transport security", recs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from dmarc_audit.parallel import parse_shard, select_shard
+from dmarc_audit.writers import CSVWriter, NDJSONWriter, merge_outputs, read_rows
+
+DOMAINS = [f"d{n}.test" for n in range(500)]
+REPORT = {'spf': (["Missing SPF record"], [])}
+
+class TestSharding(unittest.TestCase):
+    def test_shards_partition_the_list(self):
+        shards = [list(select_shard(DOMAINS, i, 4)) for i in range(4)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(DOMAINS))
+        self.assertTrue(all(shards))
+
+    def test_workers_partition_a_shard(self):
+        shard = list(select_shard(DOMAINS, 1, 3))
+        workers = [list(select_shard(DOMAINS, 1, 3, w, 4)) for w in range(4)]
+        self.assertEqual(sorted(sum(workers, [])), sorted(shard))
+
+    def test_order_independent(self):
+        self.assertEqual(sorted(select_shard(reversed(DOMAINS), 2, 5)), sorted(select_shard(DOMAINS, 2, 5)))
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/8"), (2, 8))
+        for value in ("8/8", "-1/2", "1", "a/b", "0/0"):
+            with self.assertRaises(ValueError):
+                parse_shard(value)
+
+class TestWorkers(unittest.TestCase):
+    def test_worker_failures_are_logged(self):
+        # Spawned workers set up logging as the parent did, so their errors reach stderr.
+        src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+        code = ("from dmarc_audit.logger import setup_logger\n"
+                "from dmarc_audit.parallel import audit_parallel\n"
+                "setup_logger(quiet=True)\n"
+                "print(list(audit_parallel('missing-domains.txt', 1)))\n")
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=dict(os.environ, PYTHONPATH=src),
+                                    capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), "[]")
+        self.assertIn("missing-domains.txt", result.stderr)
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def shard_files(self, writer_class, extension):
+        paths = []
+        for shard in range(3):
+            path = os.path.join(self.tmpdir.name, f"shard{shard}.{extension}")
+            with writer_class(path) as writer:
+                writer.write_report(f"d{shard}.test", REPORT)
+            paths.append(path)
+        return paths
+
+    def test_merge_csv_keeps_one_header(self):
+        output = os.path.join(self.tmpdir.name, "merged.csv")
+        self.assertEqual(merge_outputs('csv', self.shard_files(CSVWriter, 'csv'), output), 3)
+        self.assertEqual([row['domain'] for row in read_rows('csv', output)], ["d0.test", "d1.test", "d2.test"])
+
+    def test_merge_ndjson(self):
+        output = os.path.join(self.tmpdir.name, "merged.ndjson")
+        self.assertEqual(merge_outputs('json', self.shard_files(NDJSONWriter, 'ndjson'), output), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import pickle
+import unittest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from dmarc_audit.async_analyzer import audit_domains
+from dmarc_audit.portfolio import Portfolio, Posture, _NumpyColumns, _PythonColumns, _load_numpy, summarize
+from dmarc_audit.resolver import cache_key
+from fakes import FakeResolver, FlakyResolver, FakeProber, FakePolicyFetcher
+
+def rsa_key(bits):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=bits).public_key()
+    der = key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return base64.b64encode(der).decode()
+
+RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 include:_spf.example.net -all"],
+    ("_spf.example.net", "TXT"): ["v=spf1 a mx ip4:192.0.2.0/24 ~all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=quarantine; pct=50"],
+    ("selector1._domainkey.example.com", "TXT"): [f"v=DKIM1; k=rsa; p={rsa_key(1024)}"],
+    ("_mta-sts.example.com", "TXT"): ["v=STSv1; id=20240101"],
+    ("_smtp._tls.example.com", "TXT"): ["v=TLSRPTv1; rua=mailto:tls@example.com"],
+    ("example.com", "MX"): ["20 alt.mx.example.net.", "10 mx1.mail.example.co.uk."],
+}
+
+def row(policy='reject', pct=100, spf_all='-all', lookups=3, dkim_key='rsa', bits=2048, mode='enforce',
+        provider='google.com', tls_rpt=1, vulnerabilities=0, recommendations=2):
+    return Posture('example.com', policy, spf_all, dkim_key, mode, provider, pct, lookups, bits, tls_rpt, vulnerabilities,
+                   recommendations)
+
+ROWS = [
+    row(),
+    row(policy='none', pct=100, lookups=12, mode='missing', tls_rpt=0, vulnerabilities=2),
+    row(policy='quarantine', pct=50, bits=1024, provider='outlook.com', vulnerabilities=1),
+    row(policy='missing', pct=-1, spf_all='~all', lookups=7, dkim_key='missing', bits=-1, mode='testing',
+        provider='outlook.com'),
+    row(provider='example.net', lookups=-1, spf_all='missing', tls_rpt=0),
+]
+
+class TestPosture(unittest.TestCase):
+    def test_posture_from_audit(self):
+        portfolio = Portfolio()
+
+        async def run():
+            async for _ in audit_domains(["example.com", "bare.test"], resolver=FakeResolver(RECORDS),
+                                         prober=FakeProber(), policy_fetcher=FakePolicyFetcher(),
+                                         portfolio=portfolio):
+                pass
+        asyncio.run(run())
+        self.assertEqual(len(portfolio), 2)
+        summary = portfolio.summary()
+        self.assertEqual(summary['categories']['dmarc_policy'], {'quarantine': 1, 'missing': 1})
+        self.assertEqual(summary['categories']['spf_all'], {'-all': 1, 'missing': 1})
+        self.assertEqual(summary['categories']['mta_sts_mode'], {'enforce': 1, 'missing': 1})
+        # Lowest-preference MX host decides the provider.
+        self.assertEqual(summary['categories']['provider'], {'example.co.uk': 1, 'none': 1})
+        self.assertEqual(summary['distributions']['dmarc_pct'], {50: 1})
+        self.assertEqual(summary['distributions']['dkim_bits'], {1024: 1})
+        # include (1) plus the included record's a and mx (2).
+        self.assertEqual(summary['distributions']['spf_lookups'], {3: 1})
+        self.assertEqual(summary['rates']['tls_rpt'], 0.5)
+
+    def test_weakest_key_ranked_within_type(self):
+        raw = ed25519.Ed25519PrivateKey.generate().public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        records = dict(RECORDS)
+        records[("_domainkey.example.com", "TXT")] = []
+        records[("ed._domainkey.example.com", "TXT")] = [f"v=DKIM1; k=ed25519; p={base64.b64encode(raw).decode()}"]
+        portfolio = Portfolio()
+
+        async def run():
+            async for _ in audit_domains(["example.com"], resolver=FakeResolver(records), prober=FakeProber(),
+                                         policy_fetcher=FakePolicyFetcher(), dkim_selectors=["ed", "selector1"],
+                                         portfolio=portfolio):
+                pass
+        asyncio.run(run())
+        summary = portfolio.summary()
+        self.assertEqual(summary['categories']['dkim_key'], {'rsa': 1})
+        self.assertEqual(summary['distributions']['dkim_bits'], {1024: 1})
+        self.assertEqual(summary['rates']['dkim_weak'], 1.0)
+
+    def test_failed_lookups_are_unknown_not_missing(self):
+        resolver = FlakyResolver(RECORDS)
+        resolver.failing.update(cache_key(*key) for key in (("_dmarc.example.com", "TXT"), ("example.com", "MX")))
+        portfolio = Portfolio()
+
+        async def run():
+            async for _ in audit_domains(["example.com"], resolver=resolver, prober=FakeProber(),
+                                         policy_fetcher=FakePolicyFetcher(), portfolio=portfolio):
+                pass
+        asyncio.run(run())
+        categories = portfolio.summary()['categories']
+        self.assertEqual((categories['dmarc_policy'], categories['provider']), ({'unknown': 1}, {'unknown': 1}))
+        self.assertEqual(categories['spf_all'], {'-all': 1})
+
+class TestSummary(unittest.TestCase):
+    def portfolio(self, rows=ROWS):
+        portfolio = Portfolio()
+        for posture in rows:
+            portfolio.add(posture)
+        return portfolio
+
+    def test_rates_and_percentiles(self):
+        summary = summarize(self.portfolio(), _PythonColumns())
+        self.assertEqual(summary['domains'], 5)
+        self.assertEqual(summary['rates']['dmarc'], 0.8)
+        self.assertEqual(summary['rates']['dmarc_enforced'], 0.4)
+        self.assertEqual(summary['rates']['spf_over_limit'], 0.2)
+        self.assertEqual(summary['rates']['dkim_weak'], 0.2)
+        self.assertEqual(summary['rates']['mta_sts'], 0.8)
+        self.assertEqual(summary['stats']['spf_lookups'],
+                         {'count': 4, 'mean': 6.25, 'min': 3, 'max': 12, 'p50': 3, 'p90': 12, 'p99': 12})
+        self.assertEqual(summary['distributions']['dkim_bits'], {1024: 1, 2048: 3})
+        self.assertEqual(summary['categories']['dmarc_policy'],
+                         {'reject': 2, 'none': 1, 'quarantine': 1, 'missing': 1})
+
+    def test_provider_breakdown(self):
+        summary = summarize(self.portfolio(), _PythonColumns(), top_providers=2)
+        rows = {row['provider']: row for row in summary['providers']}
+        self.assertEqual([row['provider'] for row in summary['providers']], ['google.com', 'outlook.com', 'other'])
+        self.assertEqual(rows['google.com']['domains'], 2)
+        self.assertEqual(rows['google.com']['dmarc_enforced'], 0.5)
+        self.assertEqual(rows['outlook.com']['vulnerable'], 0.5)
+        self.assertEqual(rows['other']['domains'], 1)
+
+    def test_merge_and_pickle_reencode_categories(self):
+        first = self.portfolio(ROWS[:2])
+        second = pickle.loads(pickle.dumps(self.portfolio(ROWS[2:])))
+        merged = first.merge(second)
+        self.assertEqual(len(merged), 5)
+        self.assertEqual(summarize(merged, _PythonColumns()), summarize(self.portfolio(), _PythonColumns()))
+
+    def test_empty_portfolio(self):
+        summary = summarize(Portfolio(), _PythonColumns())
+        self.assertEqual((summary['domains'], summary['stats'], summary['providers']), (0, {}, []))
+
+    @unittest.skipIf(_load_numpy() is None, "numpy is not installed")
+    def test_numpy_matches_python(self):
+        portfolio = self.portfolio(ROWS * 50)
+        numpy_summary = summarize(portfolio, _NumpyColumns(_load_numpy()))
+        python_summary = summarize(portfolio, _PythonColumns())
+        self.assertEqual(numpy_summary.pop('backend'), 'numpy')
+        python_summary.pop('backend')
+        self.assertEqual(numpy_summary, python_summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import unittest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from dmarc_audit.analyzer import analyze_spf
+from dmarc_audit.async_analyzer import AsyncSecurityAnalyzer
+from dmarc_audit.context import AuditContext
+from dmarc_audit.dkim import load_dkim_key
+from dmarc_audit.providers import ProviderIndex, SuffixTrie, afetch_mx_ptr, classify_domain, get_provider_index
+from dmarc_audit.ratelimit import destination_keys
+from dmarc_audit.smtp import SMTPProber
+from fakes import FakeResolver, FakeProber, txt_rdata
+from servers import SMTPStub, server_ssl_context
+
+class TestSuffixTrie(unittest.TestCase):
+    def test_longest_label_aligned_suffix(self):
+        trie = SuffixTrie()
+        trie.add("outlook.com", "consumer")
+        trie.add("mail.protection.outlook.com", "business")
+        self.assertEqual(trie.match("contoso-com.mail.protection.outlook.com."), "business")
+        self.assertEqual(trie.match("OUTLOOK.COM"), "consumer")
+        self.assertEqual(trie.match("smtp.outlook.com"), "consumer")
+        self.assertIsNone(trie.match("notoutlook.com"))
+        self.assertIsNone(trie.match("com"))
+        self.assertEqual(trie.size, 2)
+
+class TestProviderIndex(unittest.TestCase):
+    def test_classify(self):
+        index = get_provider_index()
+        infrastructure = index.classify(
+            mx_hosts=["aspmx.l.google.com", "alt1.aspmx.l.google.com", "mx.example.org"],
+            spf_targets=["_spf.google.com", "sendgrid.net", "u123.wl.sendgrid.net", "spf.example.org"],
+            dkim_keys=[("google", None), ("s1", None), ("default", None)]
+        )
+        self.assertEqual(infrastructure.mx, ['google'])
+        self.assertEqual(infrastructure.spf, ['google', 'sendgrid'])
+        self.assertEqual(infrastructure.providers, ['google', 'sendgrid'])
+
+    def test_key_fingerprint_beats_selector(self):
+        index = ProviderIndex({
+            'esp': {'dkim_keys': ('AB12',)},
+            'other': {'dkim_selectors': ('k1',)}
+        })
+        self.assertEqual(index.match_dkim("k1", "ab12").id, 'esp')
+        self.assertEqual(index.match_dkim("K1").id, 'other')
+        self.assertIsNone(index.match_dkim("k2", "cd34"))
+
+    def test_shared_spf_pool_matched_exactly(self):
+        vulns, _ = analyze_spf(["v=spf1 include:sendgrid.net -all"])
+        self.assertIn("Third-party email service included without proper restriction", vulns)
+        vulns, _ = analyze_spf(["v=spf1 include:u123.wl.sendgrid.net -all"])
+        self.assertNotIn("Third-party email service included without proper restriction", vulns)
+
+    def test_rate_limit_groups_provider_domains(self):
+        self.assertEqual(destination_keys("aspmx.l.google.com")[-1], ('provider', 'google'))
+        self.assertEqual(destination_keys("alt1.gmr-smtp-in.l.googlemail.com")[-1], ('provider', 'google'))
+
+    def test_classify_domain_from_audit(self):
+        resolver = FakeResolver({
+            ("example.com", "TXT"): ["v=spf1 include:_spf.example.com -all"],
+            ("_spf.example.com", "TXT"): ["v=spf1 include:spf.protection.outlook.com ~all"],
+            ("spf.protection.outlook.com", "TXT"): ["v=spf1 ip4:40.92.0.0/15 -all"],
+            ("example.com", "MX"): ["0 example-com.mail.protection.outlook.com."],
+        })
+        context = AuditContext("example.com", resolver=resolver, prober=FakeProber())
+        audit = AsyncSecurityAnalyzer("example.com", context=context)
+        asyncio.run(audit.check_all())
+        infrastructure = classify_domain(context, audit.spf_result)
+        # The Microsoft include is nested one level down.
+        self.assertEqual(infrastructure.to_dict(), {'mx': ['microsoft'], 'spf': ['microsoft'], 'dkim': []})
+        self.assertEqual(classify_domain(context).spf, [])
+
+    def test_classify_domain_from_quoted_rdata(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+        public_key = base64.b64encode(key.public_bytes(serialization.Encoding.DER,
+                                                       serialization.PublicFormat.SubjectPublicKeyInfo)).decode()
+        index = ProviderIndex({'esp': {'spf': ('spf.esp.example',), 'dkim_keys': (load_dkim_key('rsa', public_key).fingerprint,)}})
+        resolver = FakeResolver({
+            ("example.com", "TXT"): [txt_rdata("v=spf1 include:spf.esp.example -all")],
+            ("selector1._domainkey.example.com", "TXT"): [txt_rdata(f"v=DKIM1; k=rsa; p={public_key}")],
+        })
+        context = AuditContext("example.com", resolver=resolver, prober=FakeProber())
+        context.prefetch()
+        self.assertEqual(classify_domain(context, index=index).to_dict(), {'mx': [], 'spf': ['esp'], 'dkim': ['esp']})
+
+    def test_vanity_mx_classified_by_ptr(self):
+        resolver = FakeResolver({
+            ("example.com", "MX"): ["10 mx.example.com.", "20 contoso-com.mail.protection.outlook.com."],
+            ("mx.example.com", "A"): ["192.0.2.10"],
+            ("10.2.0.192.in-addr.arpa", "PTR"): ["mail-qt1-f10.1e100.net."],
+        })
+        context = AuditContext("example.com", resolver=resolver, prober=FakeProber())
+        context.prefetch()
+        self.assertEqual(classify_domain(context).mx, ['microsoft'])
+        asyncio.run(afetch_mx_ptr(context))
+        self.assertEqual(context.fetched_ptr_names("mx.example.com"), ["mail-qt1-f10.1e100.net"])
+        self.assertEqual(classify_domain(context).mx, ['google', 'microsoft'])
+        # Hosts a provider's MX suffix matches are not looked up.
+        self.assertNotIn(("contoso-com.mail.protection.outlook.com", "A"), resolver.queries)
+
+class TestSharedProbes(unittest.TestCase):
+    def test_fleets_scoped_to_tenant_mx(self):
+        index = get_provider_index()
+        self.assertEqual(index.mx_fleet("contoso-com.mail.protection.outlook.com"), "mail.protection.outlook.com")
+        self.assertEqual(index.mx_fleet("contoso-de.mail.protection.outlook.de"), "mail.protection.outlook.de")
+        self.assertEqual(index.mx_fleet("alt1.aspmx.l.google.com"), "aspmx.l.google.com")
+        self.assertEqual(index.mx_fleet("mx0a-001234.pphosted.com"), "pphosted.com")
+        # Same provider, other servers.
+        self.assertEqual(index.match_mx("smtp.google.com").id, 'google')
+        self.assertIsNone(index.mx_fleet("smtp.google.com"))
+        self.assertIsNone(index.mx_fleet("us-smtp-inbound-1.mimecast.com"))
+
+    def test_tenant_mx_reuses_provider_probe(self):
+        index = ProviderIndex({'local': {'mx': ('localhost',), 'shared_mx': ('localhost',)}})
+
+        async def scenario():
+            async with SMTPStub(ssl_context=server_ssl_context()) as stub:
+                prober = SMTPProber(port=stub.port, providers=index)
+                results = await prober.probe_all(["localhost", "tenant-a.localhost", "tenant-b.localhost"])
+                return results, stub.connections
+        results, connections = asyncio.run(scenario())
+        self.assertEqual(connections, 1)
+        self.assertEqual(sorted(results), ["localhost", "tenant-a.localhost", "tenant-b.localhost"])
+        self.assertTrue(results["tenant-b.localhost"].starttls)
+        self.assertEqual(results["tenant-b.localhost"].host, "tenant-b.localhost")
+
+    def test_other_provider_hosts_probed_themselves(self):
+        # 127.0.0.1 is the provider's, but outside the localhost fleet.
+        index = ProviderIndex({'local': {'mx': ('localhost', '1'), 'shared_mx': ('localhost',)}})
+
+        async def scenario():
+            async with SMTPStub(ssl_context=server_ssl_context()) as stub:
+                prober = SMTPProber(port=stub.port, providers=index)
+                await prober.probe_all(["localhost", "tenant-a.localhost", "127.0.0.1"])
+                return stub.connections
+        self.assertEqual(asyncio.run(scenario()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
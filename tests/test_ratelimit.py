@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+from dmarc_audit.ratelimit import Scheduler, Throttled, TokenBucket, destination_keys, network_of, provider_of
+from dmarc_audit.smtp import SMTPProber
+from servers import SMTPStub
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+FAST = {'host': (1000, 10), 'network': (1000, 10), 'provider': (1000, 10)}
+
+def run(coro):
+    return asyncio.run(coro)
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+        clock.now += 2
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_throttle_slows_and_pauses(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=10, burst=10, backoff=4, clock=clock)
+        backoff = bucket.throttled()
+        self.assertEqual(bucket.rate, 5)
+        self.assertTrue(2 <= backoff <= 4)
+        self.assertAlmostEqual(bucket.reserve(), backoff + 0.2)
+        # Late signals from work sent before the pause do not compound it.
+        self.assertAlmostEqual(bucket.throttled(), backoff)
+        self.assertEqual(bucket.rate, 5)
+        clock.now += backoff + 1
+        self.assertTrue(4 <= bucket.throttled() <= 8)
+        self.assertEqual(bucket.rate, 2.5)
+
+    def test_success_recovers_up_to_ceiling(self):
+        bucket = TokenBucket(rate=10, burst=10, increase=1, clock=Clock())
+        bucket.throttled()
+        for _ in range(100):
+            bucket.succeeded()
+        self.assertEqual((bucket.rate, bucket.failures), (bucket.max_rate, 0))
+
+class TestScheduler(unittest.TestCase):
+    def test_throttled_work_is_deferred(self):
+        scheduler = Scheduler(FAST, backoff=0.01)
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            if len(calls) < 3:
+                raise Throttled("busy")
+            return "done"
+        self.assertEqual(run(scheduler.run([('host', 'mx.example.com')], attempt)), "done")
+        self.assertEqual((scheduler.deferred, scheduler.throttles), (2, 2))
+        self.assertLess(scheduler.bucket('host', 'mx.example.com').rate, 1000)
+
+    def test_gives_up_after_retries(self):
+        scheduler = Scheduler(FAST, backoff=0.01, max_retries=1)
+
+        async def attempt():
+            raise Throttled("busy")
+        with self.assertRaises(Throttled):
+            run(scheduler.run([('host', 'mx.example.com')], attempt))
+        self.assertEqual(scheduler.throttles, 2)
+
+    def test_unlimited_kinds_and_eviction(self):
+        scheduler = Scheduler(limits={'host': (1, 1)}, max_keys=2)
+        self.assertIsNone(scheduler.bucket('network', '10.0.0.0/24'))
+        for host in ("a", "b", "c"):
+            scheduler.bucket('host', host)
+        self.assertEqual(scheduler.stats()['buckets'], 2)
+
+    def test_destination_keys(self):
+        self.assertEqual(destination_keys("MX1.Mail.Example.co.uk.", "192.0.2.77"), [
+            ('host', 'mx1.mail.example.co.uk'), ('network', '192.0.2.0/24'), ('provider', 'example.co.uk')
+        ])
+        self.assertEqual(destination_keys("127.0.0.1"), [('host', '127.0.0.1'), ('network', '127.0.0.0/24')])
+        self.assertEqual(provider_of("aspmx.l.google.com"), "google.com")
+        self.assertEqual(network_of("2001:db8::1"), "2001:db8::/48")
+        self.assertIsNone(network_of("mx.example.com"))
+
+class TestProberBackoff(unittest.TestCase):
+    def test_busy_greeting_retried(self):
+        async def scenario():
+            async with SMTPStub(starttls=False, busy=1) as stub:
+                prober = SMTPProber(port=stub.port, scheduler=Scheduler(FAST, backoff=0.01))
+                return await prober.probe("127.0.0.1"), stub.connections
+        result, connections = run(scenario())
+        self.assertIsNone(result.error)
+        self.assertEqual(connections, 2)
+
+    def test_persistently_busy_reported(self):
+        async def scenario():
+            async with SMTPStub(starttls=False, busy=10) as stub:
+                prober = SMTPProber(port=stub.port, scheduler=Scheduler(FAST, backoff=0.01, max_retries=2))
+                return await prober.probe("127.0.0.1"), stub.connections
+        result, connections = run(scenario())
+        self.assertEqual(result.error, "Unexpected greeting (421)")
+        self.assertEqual(connections, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from dmarc_audit.records import parse_spf, parse_dmarc, SPFMechanism
+from dmarc_audit.analyzer import analyze_spf, analyze_dmarc
+
+class TestSPFParser(unittest.TestCase):
+    def test_mechanisms_and_modifiers(self):
+        spf = parse_spf("v=spf1 -a/24 ~mx:mail.test include:x.test redirect=y.test exp=e.test")
+        self.assertEqual(spf.mechanisms, (
+            SPFMechanism('-', 'a', '/24'),
+            SPFMechanism('~', 'mx', 'mail.test'),
+            SPFMechanism('+', 'include', 'x.test'),
+        ))
+        self.assertEqual(spf.modifiers, {'redirect': 'y.test', 'exp': 'e.test'})
+        self.assertEqual(spf.mechanisms[0].split_cidr("example.com"), ("example.com", "24", "128"))
+
+    def test_redirect_ignored_with_all(self):
+        spf = parse_spf("v=spf1 include:x.test redirect=y.test -all")
+        self.assertIsNone(spf.redirect)
+        self.assertEqual(spf.lookup_count(), 1)
+
+    def test_unknown_mechanism(self):
+        self.assertIn("Unknown SPF mechanism: bogus", parse_spf("v=spf1 bogus -all").errors)
+
+    def test_parse_is_memoized(self):
+        self.assertIs(parse_spf("v=spf1 mx -all"), parse_spf("v=spf1 mx -all"))
+
+    def test_ptr_substring_not_flagged(self):
+        vulns, _ = analyze_spf(["v=spf1 include:_spf.ptrservice.test -all"])
+        self.assertNotIn("Insecure PTR mechanism used", vulns)
+        vulns, _ = analyze_spf(["v=spf1 ptr -all"])
+        self.assertIn("Insecure PTR mechanism used", vulns)
+
+class TestDMARCParser(unittest.TestCase):
+    def test_typed_tags(self):
+        dmarc = parse_dmarc("v=DMARC1; p=Reject; pct=50; rua=mailto:a@x.test, mailto:b@x.test; adkim=s")
+        self.assertEqual(dmarc.policy, 'reject')
+        self.assertEqual(dmarc.pct, 50)
+        self.assertEqual(dmarc.rua, ('mailto:a@x.test', 'mailto:b@x.test'))
+        self.assertEqual(dmarc.adkim, 's')
+        self.assertIsNone(dmarc.aspf)
+
+    def test_invalid_values(self):
+        dmarc = parse_dmarc("v=DMARC1; p=block; pct=150")
+        self.assertIn("Invalid DMARC policy: p=block", dmarc.errors)
+        self.assertIn("Invalid DMARC pct value: 150", dmarc.errors)
+
+    def test_multiple_records_flagged(self):
+        vulns, _ = analyze_dmarc(["v=DMARC1; p=reject;", "v=DMARC1; p=none;"])
+        self.assertIn("Multiple DMARC records published (receivers ignore DMARC)", vulns)
+
+if __name__ == '__main__':
+    unittest.main()
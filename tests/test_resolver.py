@@ -0,0 +1,140 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import dns.resolver
+from dmarc_audit.ratelimit import Scheduler
+from dmarc_audit.resolver import CachingResolver, mx_hosts
+
+class FakeAnswer(list):
+    def __init__(self, records, ttl=300):
+        super().__init__(records)
+        self.expiration = time.time() + ttl
+
+class TestCachingResolver(unittest.TestCase):
+    def setUp(self):
+        self.resolver = CachingResolver(nameservers=['192.0.2.1'])
+
+    def test_positive_answer_cached(self):
+        with patch.object(self.resolver.upstreams[0].sync_resolver, 'resolve', return_value=FakeAnswer(["v=spf1 -all"])) as mock:
+            self.assertEqual(self.resolver.resolve("Example.com.", "txt"), ["v=spf1 -all"])
+            self.assertEqual(self.resolver.resolve("example.com", "TXT"), ["v=spf1 -all"])
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(self.resolver.stats()['hits'], 1)
+        self.assertEqual(self.resolver.stats()['misses'], 1)
+
+    def test_negative_answer_cached(self):
+        with patch.object(self.resolver.upstreams[0].sync_resolver, 'resolve', side_effect=dns.resolver.NXDOMAIN()) as mock:
+            self.assertEqual(self.resolver.lookup("_mta-sts.example.com", "TXT").status, 'NXDOMAIN')
+            self.assertEqual(self.resolver.lookup("_mta-sts.example.com", "TXT").status, 'NXDOMAIN')
+        self.assertEqual(mock.call_count, 1)
+
+    def test_timeouts_not_cached(self):
+        with patch.object(self.resolver.upstreams[0].sync_resolver, 'resolve', side_effect=dns.resolver.LifetimeTimeout(timeout=1.0, errors=[])) as mock:
+            self.assertEqual(self.resolver.lookup("example.com", "MX").status, 'TIMEOUT')
+            self.resolver.lookup("example.com", "MX")
+        self.assertEqual(mock.call_count, 2)
+
+    def test_expired_entry_refetched(self):
+        self.resolver.min_ttl = 0
+        with patch.object(self.resolver.upstreams[0].sync_resolver, 'resolve', return_value=FakeAnswer(["x"], ttl=0)) as mock:
+            self.resolver.resolve("example.com", "TXT")
+            self.resolver.resolve("example.com", "TXT")
+        self.assertEqual(mock.call_count, 2)
+
+    def test_lru_eviction(self):
+        self.resolver.max_entries = 2
+        with patch.object(self.resolver.upstreams[0].sync_resolver, 'resolve', return_value=FakeAnswer(["x"])):
+            for name in ("a.test", "b.test", "c.test"):
+                self.resolver.resolve(name, "TXT")
+        self.assertEqual(self.resolver.stats()['entries'], 2)
+
+    def test_concurrent_async_lookups_coalesced(self):
+        calls = []
+
+        async def fake_resolve(name, record_type):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return FakeAnswer(["10 mx.example.com."])
+
+        async def run():
+            with patch.object(self.resolver.upstreams[0].async_resolver, 'resolve', fake_resolve):
+                return await asyncio.gather(*(self.resolver.aresolve("example.com", "MX") for _ in range(10)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == ["10 mx.example.com."] for r in results))
+
+    def test_sync_failover_demotes_unhealthy_upstream(self):
+        resolver = CachingResolver(nameservers=['192.0.2.1', '192.0.2.2'])
+        bad, good = resolver.upstreams
+        bad.max_failures = 2
+        timeout = dns.resolver.LifetimeTimeout(timeout=1.0, errors=[])
+        with patch.object(bad.sync_resolver, 'resolve', side_effect=timeout) as bad_mock, \
+             patch.object(good.sync_resolver, 'resolve', return_value=FakeAnswer(["x"])):
+            for name in ("a.test", "b.test", "c.test"):
+                self.assertEqual(resolver.resolve(name, "TXT"), ["x"])
+        # Demoted after two failures, so the third lookup went to the good upstream first.
+        self.assertEqual(bad_mock.call_count, 2)
+        self.assertFalse(bad.healthy)
+        self.assertEqual(resolver.stats()['upstreams']['192.0.2.1']['errors'], 2)
+
+    def test_hedged_query_takes_first_answer(self):
+        resolver = CachingResolver(nameservers=['192.0.2.1', '192.0.2.2'], hedge_delay=0.01)
+        slow, fast = resolver.upstreams
+
+        async def slow_resolve(name, record_type):
+            await asyncio.sleep(5)
+
+        async def fast_resolve(name, record_type):
+            return FakeAnswer(["fast"])
+
+        async def run():
+            with patch.object(slow.async_resolver, 'resolve', slow_resolve), \
+                 patch.object(fast.async_resolver, 'resolve', fast_resolve):
+                return await asyncio.wait_for(resolver.aresolve("example.com", "TXT"), 1)
+
+        self.assertEqual(asyncio.run(run()), ["fast"])
+        self.assertEqual(resolver.stats()['hedged'], 1)
+
+    def test_async_failover_without_hedging(self):
+        resolver = CachingResolver(nameservers=['192.0.2.1', '192.0.2.2'], hedge_delay=0, scheduler=Scheduler())
+
+        async def failing(name, record_type):
+            raise dns.resolver.NoNameservers()
+
+        async def answering(name, record_type):
+            return FakeAnswer(["ok"])
+
+        async def run():
+            with patch.object(resolver.upstreams[0].async_resolver, 'resolve', failing), \
+                 patch.object(resolver.upstreams[1].async_resolver, 'resolve', answering):
+                return await resolver.aresolve("example.com", "TXT")
+
+        self.assertEqual(asyncio.run(run()), ["ok"])
+        self.assertEqual(resolver.stats()['hedged'], 0)
+
+    def test_throttled_upstream_deferred(self):
+        scheduler = Scheduler(backoff=0.01)
+        resolver = CachingResolver(nameservers=['192.0.2.1'], hedge_delay=0, scheduler=scheduler)
+        answers = [dns.resolver.NoNameservers(), FakeAnswer(["ok"])]
+
+        async def refusing_once(name, record_type):
+            answer = answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        async def run():
+            with patch.object(resolver.upstreams[0].async_resolver, 'resolve', refusing_once):
+                return await resolver.aresolve("example.com", "TXT")
+
+        self.assertEqual(asyncio.run(run()), ["ok"])
+        self.assertEqual(scheduler.throttles, 1)
+        self.assertLess(scheduler.bucket('resolver', '192.0.2.1').rate, 1000)
+
+    def test_mx_hosts(self):
+        self.assertEqual(mx_hosts(["20 b.example.com.", "10 A.example.com."]), ["a.example.com", "b.example.com"])
+
+if __name__ == '__main__':
+    unittest.main()
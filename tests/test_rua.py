@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from dmarc_audit.rua import Aggregate, ReportError, aggregate_findings, audit_aggregate, ingest, parse_report
+from fakes import FakeResolver
+
+def record(source_ip, count, disposition="none", dkim="pass", spf="pass", header_from="example.com", spf_auth=None):
+    return f"""
+  <record>
+    <row>
+      <source_ip>{source_ip}</source_ip>
+      <count>{count}</count>
+      <policy_evaluated><disposition>{disposition}</disposition><dkim>{dkim}</dkim><spf>{spf}</spf></policy_evaluated>
+    </row>
+    <identifiers><header_from>{header_from}</header_from></identifiers>
+    <auth_results>
+      <dkim><domain>{header_from}</domain><result>{dkim}</result></dkim>
+      <spf><domain>{header_from}</domain><result>{spf_auth or spf}</result></spf>
+    </auth_results>
+  </record>"""
+
+def report(*records, report_id="r1", policy="none", end=1700086400, xmlns=""):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feedback{xmlns}>
+  <report_metadata>
+    <org_name>receiver.test</org_name>
+    <report_id>{report_id}</report_id>
+    <date_range><begin>1700000000</begin><end>{end}</end></date_range>
+  </report_metadata>
+  <policy_published><domain>example.com</domain><p>{policy}</p><pct>100</pct></policy_published>
+  {''.join(records)}
+</feedback>
+""".encode()
+
+RECORDS = (
+    record("192.0.2.10", 90),
+    record("192.0.2.10", 5, dkim="fail", spf="fail", spf_auth="pass"),
+    record("203.0.113.5", 4, dkim="fail", spf="fail"),
+    record("203.0.113.6", 1, disposition="reject", dkim="fail", spf="fail")
+)
+
+class TestParseReport(unittest.TestCase):
+    def test_records(self):
+        records = list(parse_report(io.BytesIO(report(*RECORDS)), read_size=64))
+        self.assertEqual(len(records), 4)
+        first = records[0]
+        self.assertEqual((first.source_ip, first.count, first.header_from), ("192.0.2.10", 90, "example.com"))
+        self.assertTrue(first.dmarc_pass)
+        self.assertEqual(first.dkim_auth, ("pass",))
+        self.assertEqual(first.report.policy, "none")
+        self.assertEqual(first.report.report_id, "r1")
+        self.assertFalse(records[2].dmarc_pass)
+
+    def test_namespaced_report(self):
+        data = report(record("192.0.2.1", 3), xmlns=' xmlns="urn:ietf:params:xml:ns:dmarc-2.0"')
+        self.assertEqual([r.count for r in parse_report(io.BytesIO(data))], [3])
+
+    def test_doctype_refused(self):
+        data = b'<?xml version="1.0"?><!DOCTYPE feedback [<!ENTITY a "aaaa">]><feedback>&a;</feedback>'
+        with self.assertRaises(ReportError):
+            list(parse_report(io.BytesIO(data)))
+
+    def test_not_a_report(self):
+        with self.assertRaises(ReportError):
+            list(parse_report(io.BytesIO(b"<html></html>")))
+
+class TestAggregate(unittest.TestCase):
+    def test_group_totals(self):
+        aggregate = Aggregate()
+        aggregate.ingest_stream(io.BytesIO(report(*RECORDS)))
+        rows = list(aggregate.rows())
+        self.assertEqual(rows[0], {
+            'domain': 'example.com', 'source_ip': '192.0.2.10', 'header_from': 'example.com',
+            'disposition': 'none', 'messages': 95, 'dmarc_pass': 90, 'dmarc_fail': 5,
+            'spf_aligned': 90, 'dkim_aligned': 90, 'spf_auth': 95
+        })
+        self.assertEqual(aggregate.totals('example.com'), [100, 90, 90, 90, 95])
+        self.assertEqual(aggregate.reporters, {'example.com': {'receiver.test'}})
+
+    def test_duplicate_report_skipped(self):
+        aggregate = Aggregate()
+        aggregate.ingest_stream(io.BytesIO(report(*RECORDS)))
+        self.assertEqual(aggregate.ingest_stream(io.BytesIO(report(*RECORDS))), 0)
+        self.assertEqual((aggregate.reports, aggregate.duplicates), (1, 1))
+        self.assertEqual(aggregate.totals('example.com')[0], 100)
+
+    def test_compressed_attachments_and_errors(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with gzip.open(os.path.join(tmpdir, "a.xml.gz"), 'wb') as f:
+                f.write(report(record("192.0.2.1", 2), report_id="a"))
+            with zipfile.ZipFile(os.path.join(tmpdir, "b.zip"), 'w') as archive:
+                archive.writestr("b.xml", report(record("192.0.2.1", 3), report_id="b"))
+            with open(os.path.join(tmpdir, "c.xml"), 'wb') as f:
+                f.write(b"<feedback><record>")
+            aggregate = ingest([tmpdir])
+        self.assertEqual(aggregate.totals('example.com')[0], 5)
+        self.assertEqual(aggregate.reports, 2)
+        self.assertEqual([os.path.basename(name) for name, _ in aggregate.errors], ["c.xml"])
+
+class TestCrossReference(unittest.TestCase):
+    def aggregate(self, *records, **options):
+        aggregate = Aggregate()
+        aggregate.ingest_stream(io.BytesIO(report(*records, **options)))
+        return aggregate
+
+    def test_findings_from_reports_alone(self):
+        vulns, recs = aggregate_findings('example.com', self.aggregate(*RECORDS))
+        self.assertEqual(vulns, ["Unauthenticated mail from 203.0.113.5 delivered as example.com (4 messages)"])
+        self.assertEqual(len(recs), 1)
+        self.assertTrue(recs[0].startswith("Source 192.0.2.10 is authorized by SPF but failed DMARC"))
+        self.assertEqual((vulns[0].code, vulns[0].evidence['source_ip'], vulns[0].evidence['messages']),
+                         ("rua.unauthenticated-delivered", "203.0.113.5", 4))
+        self.assertEqual(recs[0].code, "rua.unaligned-source")
+
+    def test_against_published_records(self):
+        resolver = FakeResolver({
+            ("example.com", "TXT"): ["v=spf1 ip4:203.0.113.0/24 -all"],
+            ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=quarantine; adkim=s; aspf=s"]
+        })
+        aggregate = self.aggregate(*RECORDS)
+
+        async def collect():
+            return [item async for item in audit_aggregate(aggregate, resolver)]
+        [(domain, findings)] = asyncio.run(collect())
+        self.assertEqual(domain, 'example.com')
+        self.assertEqual(set(findings), {'spf', 'dmarc', 'rua'})
+        vulns, recs = findings['rua']
+        # 192.0.2.10 is not in the published SPF record; 203.0.113.5 is.
+        self.assertEqual(vulns, ["Unauthenticated mail from 192.0.2.10 delivered as example.com (5 messages)"])
+        self.assertIn("Receivers last reported policy p=none, the published record has p=quarantine", recs)
+        self.assertTrue(any(r.startswith("Source 203.0.113.5 is authorized by SPF") for r in recs))
+
+    def test_ready_to_enforce(self):
+        aggregate = self.aggregate(record("192.0.2.10", 500), record("192.0.2.11", 2, dkim="fail", spf="fail",
+                                                                         disposition="none"))
+        _, recs = aggregate_findings('example.com', aggregate)
+        self.assertIn("99.6% of 502 reported messages pass DMARC; move the policy from p=none to quarantine or reject",
+                      recs)
+
+if __name__ == '__main__':
+    unittest.main()
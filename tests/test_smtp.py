@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from dmarc_audit.smtp import SMTPProber, ProbeResult, mx_findings
+from servers import SMTPStub, server_ssl_context
+
+SERVER_CONTEXT = server_ssl_context()
+
+def run(coro):
+    return asyncio.run(coro)
+
+class TestSMTPProber(unittest.TestCase):
+    def test_starttls_negotiated(self):
+        async def scenario():
+            async with SMTPStub(ssl_context=SERVER_CONTEXT) as stub:
+                return await SMTPProber(port=stub.port).probe("127.0.0.1")
+        result = run(scenario())
+        self.assertIsNone(result.error)
+        self.assertTrue(result.starttls)
+        self.assertIn(result.tls_version, ("TLSv1.2", "TLSv1.3"))
+        self.assertIn("CN=localhost", result.certificate['subject'])
+        self.assertEqual(mx_findings(result), ([], []))
+
+    def test_starttls_missing(self):
+        async def scenario():
+            async with SMTPStub(starttls=False) as stub:
+                return await SMTPProber(port=stub.port).probe("127.0.0.1")
+        vulns, recs = mx_findings(run(scenario()))
+        self.assertIn("STARTTLS not supported on 127.0.0.1", vulns)
+
+    def test_shared_hosts_probed_once(self):
+        async def scenario():
+            async with SMTPStub(ssl_context=SERVER_CONTEXT) as stub:
+                prober = SMTPProber(port=stub.port)
+                await asyncio.gather(*(prober.probe("127.0.0.1") for _ in range(20)))
+                await prober.probe("127.0.0.1.")
+                return stub.connections
+        self.assertEqual(run(scenario()), 1)
+
+    def test_global_concurrency_cap(self):
+        async def scenario():
+            async with SMTPStub(starttls=False, delay=0.05) as stub:
+                prober = SMTPProber(port=stub.port, max_concurrency=3)
+                hosts = ["127.0.0.1", "localhost"] + [f"127.0.0.{n}" for n in range(2, 8)]
+                await prober.probe_all(hosts)
+                return stub.max_active
+        self.assertLessEqual(run(scenario()), 3)
+
+    def test_deadline(self):
+        async def scenario():
+            async with SMTPStub(delay=1.0) as stub:
+                return await SMTPProber(port=stub.port, deadline=0.1).probe("127.0.0.1")
+        result = run(scenario())
+        self.assertIsNotNone(result.error)
+
+    def test_weak_tls_version_reported(self):
+        result = ProbeResult("mx.test", starttls=True, tls_version="TLSv1")
+        vulns, _ = mx_findings(result)
+        self.assertIn("Weak TLS version negotiated on mx.test: TLSv1", vulns)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import ipaddress
+import unittest
+from dmarc_audit.analyzer import SPFEvaluator, analyze_spf
+from fakes import FakeResolver
+
+RECORDS = {
+    ("example.com", "TXT"): ['"v=spf1 include:_spf.esp.test ip4:192.0.2.0/25 " "mx a:web.example.com/28 -all"'],
+    ("example.com", "MX"): ["10 mx.example.com."],
+    ("mx.example.com", "A"): ["198.51.100.7"],
+    ("mx.example.com", "AAAA"): [],
+    ("web.example.com", "A"): ["203.0.113.20"],
+    ("_spf.esp.test", "TXT"): ["v=spf1 ip4:192.0.2.128/25 include:_spf2.esp.test ~all"],
+    ("_spf2.esp.test", "TXT"): ["v=spf1 ip6:2001:db8::/32 ~all"],
+    ("other.test", "TXT"): ["v=spf1 include:_spf.esp.test -all"],
+    ("loop-a.test", "TXT"): ["v=spf1 include:loop-b.test -all"],
+    ("loop-b.test", "TXT"): ["v=spf1 include:loop-a.test -all"],
+    ("void.test", "TXT"): ["v=spf1 include:gone1.test include:gone2.test a:gone3.test -all"],
+    ("redirect.test", "TXT"): ["v=spf1 redirect=_spf.esp.test"],
+}
+
+def evaluate(domain, resolver=None, evaluator=None):
+    evaluator = evaluator or SPFEvaluator(resolver or FakeResolver(RECORDS))
+    return asyncio.run(evaluator.evaluate(domain))
+
+class TestSPFEngine(unittest.TestCase):
+    def test_lookup_count_includes_nested_terms(self):
+        result = evaluate("example.com")
+        # include, mx, a at the top level plus the nested include
+        self.assertEqual(result.lookups, 4)
+        self.assertEqual(result.void_lookups, 0)
+        self.assertEqual(result.errors, [])
+        self.assertIn("include:_spf.esp.test", result.tree)
+        self.assertIn("include:_spf2.esp.test", result.tree["include:_spf.esp.test"])
+
+    def test_flattened_networks(self):
+        networks = evaluate("example.com").authorized_networks()
+        self.assertIn(ipaddress.ip_network("192.0.2.0/24"), networks)
+        self.assertIn(ipaddress.ip_network("198.51.100.7/32"), networks)
+        self.assertIn(ipaddress.ip_network("203.0.113.16/28"), networks)
+        self.assertIn(ipaddress.ip_network("2001:db8::/32"), networks)
+
+    def test_loop_detected(self):
+        result = evaluate("loop-a.test")
+        self.assertTrue(any("loop" in error for error in result.errors))
+
+    def test_void_lookups(self):
+        result = evaluate("void.test")
+        self.assertEqual(result.void_lookups, 3)
+        vulns, _ = analyze_spf(["v=spf1 -all"], result)
+        self.assertIn("Too many void DNS lookups (3, limit 2)", vulns)
+
+    def test_redirect_counts_as_lookup(self):
+        result = evaluate("redirect.test")
+        self.assertEqual(result.lookups, 2)
+
+    def test_shared_includes_fetched_once_per_batch(self):
+        resolver = FakeResolver(RECORDS)
+        evaluator = SPFEvaluator(resolver)
+
+        async def run():
+            return await asyncio.gather(evaluator.evaluate("example.com"), evaluator.evaluate("other.test"))
+
+        asyncio.run(run())
+        self.assertEqual(resolver.queries.count(("_spf.esp.test", "TXT")), 1)
+
+    def test_excessive_lookups_reported(self):
+        records = {("big.test", "TXT"): ["v=spf1 " + " ".join(f"include:i{n}.test" for n in range(6)) + " -all"]}
+        for n in range(6):
+            records[(f"i{n}.test", "TXT")] = ["v=spf1 a mx -all"]
+        result = evaluate("big.test", FakeResolver(records))
+        self.assertEqual(result.lookups, 18)
+        vulns, _ = analyze_spf(["v=spf1 -all"], result)
+        self.assertIn("Excessive DNS lookups (18 lookups, limit 10)", vulns)
+
+if __name__ == '__main__':
+    unittest.main()
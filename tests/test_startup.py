@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+def run(code, cwd):
+    env = dict(os.environ, PYTHONPATH=SRC)
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+class TestStartup(unittest.TestCase):
+    def test_import_is_lean(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            out = run("import sys, dmarc_audit.main\n"
+                      "print(sorted(m for m in ('rich', 'pyfiglet', 'colorama', 'dns', 'cryptography', 'asyncio')"
+                      " if m in sys.modules))", cwd)
+            self.assertEqual(out.strip(), "[]")
+            self.assertEqual(os.listdir(cwd), [])
+
+    def test_lazy_exports(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            out = run("import dmarc_audit; print(dmarc_audit.check_dkim.__module__)", cwd)
+            self.assertEqual(out.strip(), "dmarc_audit.analyzer")
+
+if __name__ == '__main__':
+    unittest.main()
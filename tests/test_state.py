@@ -0,0 +1,66 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from dmarc_audit.async_analyzer import reaudit_domains
+from dmarc_audit.state import StateStore, diff_reports
+from fakes import FakeResolver, FakeProber
+
+RECORDS = {
+    ("example.com", "TXT"): ["v=spf1 -all"],
+    ("_dmarc.example.com", "TXT"): ["v=DMARC1; p=none"],
+    ("example.com", "MX"): ["10 mx.example.com."],
+}
+
+class TestIncrementalAudit(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = StateStore(os.path.join(self.tmpdir.name, "state.sqlite3"))
+
+    def tearDown(self):
+        self.state.close()
+        self.tmpdir.cleanup()
+
+    def run_audit(self, records, prober, probe_ttl=3600):
+        async def run():
+            return [r async for r in reaudit_domains(["example.com"], self.state, concurrency=1,
+                                                     resolver=FakeResolver(records), prober=prober,
+                                                     probe_ttl=probe_ttl)]
+        return asyncio.run(run())[0]
+
+    def test_unchanged_domain_skips_analysis_and_probes(self):
+        first = self.run_audit(RECORDS, FakeProber())
+        self.assertFalse(first.reused)
+        self.assertIn("Policy set to monitoring only (p=none)", first.diff['new']['dmarc'][0])
+        prober = FakeProber()
+        second = self.run_audit(RECORDS, prober)
+        self.assertTrue(second.reused)
+        self.assertEqual(prober.probed, [])
+        self.assertEqual(second.report, first.report)
+        self.assertEqual(second.diff, {'new': {}, 'resolved': {}})
+
+    def test_changed_records_reaudited_with_diff(self):
+        self.run_audit(RECORDS, FakeProber())
+        changed = dict(RECORDS)
+        changed[("_dmarc.example.com", "TXT")] = ["v=DMARC1; p=reject; rua=mailto:d@example.com"]
+        result = self.run_audit(changed, FakeProber())
+        self.assertFalse(result.reused)
+        self.assertIn("Policy set to monitoring only (p=none)", result.diff['resolved']['dmarc'][0])
+
+    def test_expired_probes_rerun(self):
+        self.run_audit(RECORDS, FakeProber())
+        prober = FakeProber()
+        result = self.run_audit(RECORDS, prober, probe_ttl=0)
+        self.assertFalse(result.reused)
+        self.assertEqual(prober.probed, ["mx.example.com"])
+
+    def test_diff_reports(self):
+        old = {'spf': (["a", "b"], []), 'dkim': (["x"], [])}
+        new = {'spf': (["b", "c"], ["r"])}
+        self.assertEqual(diff_reports(old, new), {
+            'new': {'spf': (["c"], ["r"])},
+            'resolved': {'spf': (["a"], []), 'dkim': (["x"], [])}
+        })
+
+if __name__ == '__main__':
+    unittest.main()
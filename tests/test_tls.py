@@ -0,0 +1,119 @@
+import asyncio
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from dmarc_audit.tls import (
+    CertificateInfo,
+    TLSInspector,
+    TLSResult,
+    certificate_findings,
+    clear_certificate_cache,
+    peer_chain,
+    tls_findings
+)
+from servers import TLSStub
+
+def run(coro):
+    return asyncio.run(coro)
+
+def certificate(days=365, key_type='rsa', key_bits=2048):
+    not_after = (datetime.now(timezone.utc) + timedelta(days=days)).isoformat()
+    return CertificateInfo("00", "CN=mail.example.com", "CN=CA", not_after, key_type, key_bits, False)
+
+class TestTLSInspector(unittest.TestCase):
+    def test_trusted_certificate(self):
+        async def scenario():
+            async with TLSStub() as stub:
+                inspector = TLSInspector(port=stub.port, ssl_context=stub.client_context,
+                                         connect_host='127.0.0.1')
+                return await inspector.inspect("localhost")
+        result = run(scenario())
+        self.assertIsNone(result.error)
+        self.assertTrue(result.verified)
+        self.assertIn(result.version, ("TLSv1.2", "TLSv1.3"))
+        self.assertIn("CN=localhost", result.certificate.subject)
+        self.assertTrue(result.chain_complete)
+        self.assertEqual(tls_findings(result), ([], []))
+
+    def test_untrusted_certificate_still_reported(self):
+        async def scenario():
+            async with TLSStub() as stub:
+                return await TLSInspector(port=stub.port, connect_host='127.0.0.1').inspect("localhost")
+        result = run(scenario())
+        self.assertIsNone(result.error)
+        self.assertFalse(result.verified)
+        self.assertTrue(result.certificate.self_signed)
+        vulns, _ = tls_findings(result)
+        self.assertTrue(vulns[0].startswith("Untrusted TLS certificate for localhost"))
+
+    def test_shared_certificate_parsed_once(self):
+        hosts = ["a.example.test", "b.example.test", "c.example.test"]
+
+        async def scenario():
+            async with TLSStub(hosts[0], alt_names=hosts[1:]) as stub:
+                inspector = TLSInspector(port=stub.port, ssl_context=stub.client_context,
+                                         connect_host='127.0.0.1')
+                results = await inspector.inspect_all(hosts + hosts)
+                return results, stub.connections
+        clear_certificate_cache()
+        results, connections = run(scenario())
+        self.assertEqual(connections, 3)
+        leaves = [results[host].certificate for host in hosts]
+        self.assertTrue(all(leaf is leaves[0] for leaf in leaves))
+
+    def test_handshake_timeout(self):
+        async def scenario():
+            async with TLSStub(handshake=False) as stub:
+                inspector = TLSInspector(port=stub.port, handshake_timeout=0.2, connect_host='127.0.0.1')
+                return await inspector.inspect("localhost")
+        result = run(scenario())
+        self.assertEqual(result.error, "TLS handshake timed out")
+        self.assertEqual(tls_findings(result)[0], [f"TLS check failed for localhost:{result.port}: TLS handshake timed out"])
+
+    @unittest.skipIf(sys.version_info >= (3, 13), "the chain is read through the public API")
+    def test_leaf_only_without_chain_access(self):
+        class BrokenChain:
+            def get_unverified_chain(self):
+                raise AttributeError("no chain support")
+
+        class SSLObject:
+            def __init__(self, sslobj=None):
+                if sslobj is not None:
+                    self._sslobj = sslobj
+
+            def getpeercert(self, binary_form=False):
+                return b"leaf-der"
+
+        self.assertEqual(peer_chain(SSLObject()), ([b"leaf-der"], False))
+        self.assertEqual(peer_chain(SSLObject(BrokenChain())), ([b"leaf-der"], False))
+        self.assertTrue(TLSResult.from_dict({'host': "mx.example.com", 'port': 25}).chain_complete)
+
+    def test_result_round_trip(self):
+        result = TLSResult("mx.example.com", 443, "TLSv1.3", "TLS_AES_128_GCM_SHA256", [certificate()], True)
+        restored = TLSResult.from_dict(result.to_dict())
+        self.assertEqual(restored.certificate, result.certificate)
+        self.assertEqual(restored.version, "TLSv1.3")
+
+class TestCertificateFindings(unittest.TestCase):
+    def test_expired(self):
+        vulns, _ = certificate_findings("mx.example.com", certificate(days=-2))
+        self.assertEqual(vulns, ["TLS certificate expired for mx.example.com"])
+
+    def test_expiring_soon(self):
+        _, recs = certificate_findings("mx.example.com", certificate(days=10.5))
+        self.assertEqual(recs, ["TLS certificate for mx.example.com expires in 10 days"])
+
+    def test_weak_key(self):
+        vulns, _ = certificate_findings("mx.example.com", certificate(key_bits=1024))
+        self.assertEqual(vulns, ["Weak TLS certificate key for mx.example.com (RSA 1024 bits)"])
+
+    def test_ec_key_not_weak(self):
+        self.assertEqual(certificate_findings("mx.example.com", certificate(key_type='ec', key_bits=256)), ([], []))
+
+    def test_weak_protocol(self):
+        result = TLSResult("mx.example.com", 443, "TLSv1", "AES128-SHA", [certificate()], True)
+        vulns, _ = tls_findings(result)
+        self.assertEqual(vulns, ["Weak SSL/TLS version detected on mx.example.com: TLSv1"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import io
+import json
+import unittest
+from dmarc_audit.async_analyzer import AsyncSecurityAnalyzer
+from dmarc_audit.context import AuditContext
+from dmarc_audit.tracing import Tracer, NULL_SPAN, current_span, set_tracer, span, traced
+from fakes import FakeResolver, FakeProber
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.export = io.StringIO()
+        self.tracer = set_tracer(Tracer(self.export))
+
+    def tearDown(self):
+        set_tracer(None)
+
+    def spans(self):
+        return [json.loads(line) for line in self.export.getvalue().splitlines()]
+
+    def test_nested_spans_share_trace(self):
+        with span('outer', domain="example.com"):
+            with span('inner', name="x") as inner:
+                inner.set(cache='hit')
+        inner, outer = self.spans()
+        self.assertEqual(inner['parentSpanId'], outer['spanId'])
+        self.assertEqual(inner['traceId'], outer['traceId'])
+        self.assertEqual(inner['attributes'], {'name': "x", 'cache': 'hit'})
+        self.assertGreaterEqual(outer['endTimeUnixNano'], outer['startTimeUnixNano'])
+
+    def test_concurrent_tasks_keep_their_own_parent(self):
+        @traced('child')
+        async def child():
+            await asyncio.sleep(0)
+
+        async def audit(domain):
+            with span('audit', domain=domain):
+                await child()
+
+        async def run():
+            await asyncio.gather(audit("a.test"), audit("b.test"))
+
+        asyncio.run(run())
+        spans = self.spans()
+        roots = {s['spanId']: s['attributes']['domain'] for s in spans if s['name'] == 'audit'}
+        children = [s for s in spans if s['name'] == 'child']
+        self.assertEqual(sorted(roots[c['parentSpanId']] for c in children), ["a.test", "b.test"])
+
+    def test_summary_counts_cache_and_retries(self):
+        for cache in ('hit', 'miss', 'miss'):
+            with span('dns.lookup') as s:
+                s.set(cache=cache)
+                s.incr('retries')
+        (name, count, _, _, _, _, _, counters), = self.tracer.summary()
+        self.assertEqual((name, count), ('dns.lookup', 3))
+        self.assertEqual(counters, {'cache=hit': 1, 'cache=miss': 2, 'retries': 3})
+
+    def test_audit_records_checks_and_lookups(self):
+        context = AuditContext("example.com", resolver=FakeResolver({}), prober=FakeProber())
+        asyncio.run(AsyncSecurityAnalyzer("example.com", context=context).check_all())
+        names = {row[0] for row in self.tracer.summary()}
+        self.assertTrue({'audit', 'prefetch', 'check.spf', 'check.mx', 'analyze.dmarc'} <= names)
+
+    def test_disabled_tracer_is_noop(self):
+        set_tracer(None)
+        with span('ignored') as s:
+            self.assertIs(s, NULL_SPAN)
+            self.assertIs(current_span(), NULL_SPAN)
+        self.assertEqual(self.export.getvalue(), "")
+
+if __name__ == '__main__':
+    unittest.main()
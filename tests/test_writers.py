@@ -0,0 +1,65 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from dmarc_audit.writers import COLUMNS, ColumnarWriter, CSVWriter, NDJSONWriter, finding_rows
+
+REPORT = {
+    'spf': (["No SPF record found"], ["Add an SPF record"]),
+    'dmarc': ([], ["Consider adding a ruf tag"]),
+    'dkim': ([], [])
+}
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_rows_include_recommendations(self):
+        rows = list(finding_rows("example.com", REPORT, "t0"))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([r['type'] for r in rows], ['Vulnerability', 'Recommendation', 'Recommendation'])
+        self.assertEqual(rows[2]['check'], 'DMARC')
+
+    def test_ndjson_appends_one_row_per_finding(self):
+        path = self.path("out.ndjson")
+        with NDJSONWriter(path) as writer:
+            writer.write_report("a.test", REPORT)
+            writer.write_report("b.test", REPORT)
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(set(rows[0]), set(COLUMNS))
+
+    def test_csv_header_written_once_when_appending(self):
+        path = self.path("out.csv")
+        for domain in ("a.test", "b.test"):
+            with CSVWriter(path) as writer:
+                writer.write_report(domain, REPORT)
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[3]['domain'], "b.test")
+
+    def test_columnar_row_groups_are_bounded(self):
+        path = self.path("out.columnar")
+        writer = ColumnarWriter(path, row_group_size=4)
+        if writer._parquet is not None:
+            writer.close()
+            self.skipTest("pyarrow installed; Parquet output")
+        for n in range(3):
+            writer.write_report(f"d{n}.test", REPORT)
+        writer.close()
+        with open(path) as f:
+            groups = [json.loads(line) for line in f]
+        self.assertEqual([len(g['domain']) for g in groups], [6, 3])
+        self.assertEqual(groups[1]['domain'], ["d2.test"] * 3)
+
+if __name__ == '__main__':
+    unittest.main()